@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Run request envelopes from JSONL files through the skill in bulk.
+
+Input lines are streamed, grouped into chunks and handed to a pool of
+worker processes. Every worker builds the skill once and deserializes
+each line straight into a RequestEnvelope with the SDK serializer (no
+json.loads/json.dumps round trip, unlike lambda_handler). Response
+envelopes are written as JSONL in input order; a line that fails is
+written as ``{"error": ..., "line": n}``.
+
+At most ``--max-pending`` chunks are in flight, so memory stays bounded
+whatever the size of the input.
+
+By default the monetization service is StubMonetizationApiClient; use
+``--emulator-url`` for a running isp_emulator.py. With ``--seed`` every
+chunk seeds the random module from its position and entitlement
+snapshots (signed with a per-process key and dated by the wall clock)
+are turned off, so a run gives the same responses for any number of
+processes.
+
+Usage::
+
+    python benchmarks/batch.py envelopes.jsonl [more.jsonl | -]
+        [-o responses.jsonl] [--processes 8] [--chunk 200] [--seed 1]
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+_worker = {}
+
+
+def read_lines(paths):
+    """Yield the non-blank lines of the files, "-" being stdin."""
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path)
+        try:
+            for line in f:
+                if line.strip():
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def chunked(iterable, size):
+    """Yield (index, lines) chunks of up to size items."""
+    iterator = iter(iterable)
+    for index in itertools.count():
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield index, chunk
+
+
+def init_worker(api_client_args, environ):
+    """Build the skill once per worker process."""
+    sys.path.insert(0, os.path.join(ROOT, "lambda", "py"))
+    sys.path.insert(0, BENCH_DIR)
+    os.environ.update(environ)
+    # Failed lines are reported in the output instead of logged
+    logging.disable(logging.CRITICAL)
+    import lambda_function
+    from ask_sdk_model import RequestEnvelope
+
+    emulator_url, entitled = api_client_args
+    if emulator_url:
+        from isp_emulator import EmulatorApiClient
+        api_client = EmulatorApiClient(emulator_url)
+    else:
+        from stubs import StubMonetizationApiClient
+        api_client = StubMonetizationApiClient(entitled=entitled)
+    lambda_function.sb.api_client = api_client
+    skill = lambda_function.sb.create()
+    _worker.update(skill=skill, envelope_type=RequestEnvelope,
+                   response_cache=lambda_function.response_cache)
+
+
+def process_chunk(task):
+    """Return the output lines for a chunk of input lines."""
+    index, first_line, lines, seed = task
+    if seed is not None:
+        random.seed(seed + index)
+    skill = _worker["skill"]
+    serializer = skill.serializer
+    envelope_type = _worker["envelope_type"]
+    response_cache = _worker["response_cache"]
+    output = []
+    for offset, line in enumerate(lines):
+        try:
+            request_envelope = serializer.deserialize(
+                payload=line, obj_type=envelope_type)
+            response_envelope = skill.invoke(
+                request_envelope=request_envelope, context=None)
+            if response_cache is not None:
+                serialized = response_cache.serialize_envelope(
+                    serializer, response_envelope)
+            else:
+                serialized = serializer.serialize(response_envelope)
+            output.append(json.dumps(serialized, separators=(",", ":")))
+        except Exception as e:
+            output.append(json.dumps(
+                {"error": str(e).strip(), "line": first_line + offset}))
+    return output
+
+
+def run(lines, out, processes, chunk_size, max_pending, seed,
+        api_client_args):
+    """Stream lines through the pool into out and return the count."""
+    environ = {"EMIT_METRICS": "false", "LOG_SAMPLE_RATE": "0"}
+    if seed is not None:
+        environ["ENTITLEMENT_SNAPSHOTS"] = "false"
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(processes, initializer=init_worker,
+                        initargs=(api_client_args, environ))
+    pending = collections.deque()
+    count = 0
+    line_number = 1
+    try:
+        for index, chunk in chunked(lines, chunk_size):
+            pending.append(pool.apply_async(
+                process_chunk, ((index, line_number, chunk, seed),)))
+            line_number += len(chunk)
+            while len(pending) >= max_pending:
+                count += write(out, pending.popleft().get())
+        while pending:
+            count += write(out, pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return count
+
+
+def write(out, output):
+    out.write("\n".join(output))
+    out.write("\n")
+    return len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+",
+                        help="JSONL files of request envelopes, - for stdin")
+    parser.add_argument("-o", "--output", default="-")
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk", type=int, default=200,
+                        help="envelopes per worker task")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="chunks in flight, 2 per process by default")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--entitled", default="science_pack",
+                        help="comma separated reference names the stubbed "
+                             "service reports as owned")
+    parser.add_argument("--emulator-url", default=None)
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    started = time.perf_counter()
+    try:
+        count = run(
+            read_lines(args.inputs), out, args.processes, args.chunk,
+            args.max_pending or 2 * args.processes, args.seed,
+            (args.emulator_url,
+             tuple(filter(None, args.entitled.split(",")))))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    sys.stderr.write("{} envelopes in {:.2f} s ({:.0f}/s)\n".format(
+        count, elapsed, count / elapsed if elapsed else 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
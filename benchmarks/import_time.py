@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Cold-start import profile of the skill's lambda_function module.
+
+Runs ``python -X importtime -c "import lambda_function"`` in fresh
+interpreters, reports the median cumulative import time of the module
+and the slowest packages it pulls in, and exits non-zero when the median
+goes over ``--max-ms``.
+
+Usage::
+
+    python benchmarks/import_time.py [--runs 5] [--top 15] [--max-ms 250]
+        [--profile benchmarks/profiles/import_time.txt]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKILL_DIR = os.path.join(ROOT, "lambda", "py")
+MODULE = "lambda_function"
+
+
+def profile_once(module=MODULE):
+    """Return the raw ``-X importtime`` output and a mapping of
+    top-level package to cumulative microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=SKILL_DIR, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        universal_newlines=True, check=True)
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        name = fields[2].rstrip()
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            cumulative[name.strip()] = int(fields[1])
+    return result.stderr, cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail if the median import time exceeds this")
+    parser.add_argument("--profile", default=None,
+                        help="write the raw importtime output of the "
+                             "last run to this file")
+    args = parser.parse_args()
+
+    totals = []
+    last = None
+    for _ in range(args.runs):
+        raw, cumulative = profile_once()
+        totals.append(cumulative[MODULE] / 1000.0)
+        last = raw, cumulative
+
+    raw, cumulative = last
+    median = statistics.median(totals)
+    print("{} import: median {:.1f} ms over {} runs (min {:.1f}, "
+          "max {:.1f})".format(MODULE, median, args.runs, min(totals),
+                               max(totals)))
+    print("Slowest top-level imports of the last run:")
+    ranked = sorted(
+        ((us, name) for name, us in cumulative.items() if name != MODULE),
+        reverse=True)
+    for us, name in ranked[:args.top]:
+        print("  {:>9.1f} ms  {}".format(us / 1000.0, name))
+
+    if args.profile:
+        with open(args.profile, "w") as f:
+            f.write(raw)
+
+    if args.max_ms is not None and median > args.max_ms:
+        print("FAIL: median import time {:.1f} ms exceeds {:.1f} ms".format(
+            median, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
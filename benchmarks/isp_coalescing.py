@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Send bursts of concurrent turns for one user through lambda_handler.
+
+Each burst is --concurrency threads sending the recorded ShoppingIntent
+envelope for a new user at the same moment, as a threaded server or a
+burst of Connections.Response events would. The product cache is cold
+for that user, so every turn needs the user's In-skill products. The
+script reports monetization calls per burst and turn latency with the
+single-flight layer (isp_flights) on and off.
+
+Usage::
+
+    python benchmarks/isp_coalescing.py [--bursts 50] [--concurrency 8]
+        [--latency-ms 50]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, "lambda", "py"))
+os.environ.setdefault("EMIT_METRICS", "false")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+
+from stubs import StubMonetizationApiClient  # noqa: E402
+
+import lambda_function  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+def user_envelope(envelope, user_id):
+    """Return a copy of envelope sent by user_id."""
+    envelope = copy.deepcopy(envelope)
+    envelope["session"]["user"]["userId"] = user_id
+    envelope["context"]["System"]["user"]["userId"] = user_id
+    return envelope
+
+
+def run_bursts(handler, envelope, bursts, concurrency, label):
+    """Run the bursts and return (calls per burst, sorted latencies)."""
+    timings = []
+    lock = threading.Lock()
+
+    def turn(barrier, user_envelope):
+        barrier.wait()
+        started = time.perf_counter()
+        handler(user_envelope, None)
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings.append(elapsed)
+
+    api_client = lambda_function.sb.api_client
+    calls_before = api_client.calls
+    for burst in range(bursts):
+        burst_envelope = user_envelope(
+            envelope, "amzn1.ask.account.{}-{}".format(label, burst))
+        barrier = threading.Barrier(concurrency)
+        threads = [threading.Thread(target=turn,
+                                    args=(barrier, burst_envelope))
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    timings.sort()
+    return float(api_client.calls - calls_before) / bursts, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--bursts", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    with open(os.path.join(BENCH_DIR, "envelopes",
+                           "shopping_intent.json")) as f:
+        envelope = json.load(f)
+    api_client = StubMonetizationApiClient(latency=args.latency_ms / 1000.0)
+    lambda_function.sb.api_client = api_client
+    handler = lambda_function.sb.lambda_handler()
+
+    print("{:<14} {:>14} {:>9} {:>9} {:>9}".format(
+        "single flight", "calls/burst", "p50 ms", "p95 ms", "max ms"))
+    for label, flights in (("off", SingleFlight(share=False)),
+                           ("on", SingleFlight())):
+        lambda_function.isp_flights = flights
+        lambda_function.product_cache.clear()
+        calls, timings = run_bursts(
+            handler, envelope, args.bursts, args.concurrency, label)
+        print("{:<14} {:>14.2f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            label, calls, percentile(timings, 50) * 1000,
+            percentile(timings, 95) * 1000, timings[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""Local HTTP emulator of the Alexa monetization service.
+
+Serves the products in ``isps.samples`` with per-user entitlement state,
+a configurable latency distribution and error and timeout rates:
+
+* ``GET .../inSkillProducts`` answers like the InSkillProducts API for
+  the user named by the bearer token (the envelope's apiAccessToken).
+* ``POST /emulator/connections`` plays the Alexa side of a Buy, Cancel
+  or Upsell Connections request. The body is
+  ``{"name": "Buy", "userId": ..., "productId": ...}``; the user's
+  entitlements are updated and the ``request`` of the resulting
+  Connections.Response envelope is returned.
+* ``GET /emulator/stats`` returns request counters,
+  ``PUT /emulator/users/<userId>`` replaces a user's entitled reference
+  names.
+
+Entitlements come from ``--entitlements``, a JSON file such as
+``{"default": ["science_pack"], "users": {"user-1": ["all_access"]}}``.
+
+EmulatorApiClient is an ApiClient sending the skill's service calls to
+the emulator over plain HTTP; DefaultApiClient only talks HTTPS.
+
+Usage::
+
+    python benchmarks/isp_emulator.py --port 8086 --latency-ms 40
+        --latency-sigma 0.5 --error-rate 0.02 --timeout-rate 0.01
+"""
+import argparse
+import http.client
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ask_sdk_model.services import ApiClient, ApiClientResponse
+
+from stubs import PRODUCT_ID_PREFIX, in_skill_products_body, load_isp_samples
+
+USER_PATH = re.compile(r"^/emulator/users/(?P<user_id>[^/]+)$")
+
+
+class EmulatorConfig(object):
+    """Behaviour of the emulated service.
+
+    :param latency: median delay in seconds
+    :param latency_sigma: sigma of the log-normal delay distribution,
+        0 for a fixed delay
+    :param error_rate: fraction of calls answered with HTTP 500, or a
+        failed Connections.Response
+    :param timeout_rate: fraction of calls held for hang seconds
+    :param accept_rate: fraction of Buy and Cancel requests accepted
+    """
+    def __init__(self, latency=0.0, latency_sigma=0.0, error_rate=0.0,
+                 timeout_rate=0.0, hang=10.0, accept_rate=0.8,
+                 default_entitled=("science_pack",), users=None,
+                 locale="en-US"):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.accept_rate = accept_rate
+        self.default_entitled = tuple(default_entitled)
+        self.users = dict(users or {})
+        self.locale = locale
+
+    @classmethod
+    def load_entitlements(cls, path, **kwargs):
+        """Return a config with the entitlements in the JSON file."""
+        with open(path) as f:
+            entitlements = json.load(f)
+        return cls(default_entitled=entitlements.get("default", ()),
+                   users=entitlements.get("users"), **kwargs)
+
+
+class MonetizationEmulator(object):
+    """Entitlement state and failure injection behind the HTTP server."""
+    def __init__(self, config):
+        self.config = config
+        self.products = load_isp_samples(config.locale)
+        self._entitled = {
+            user_id: set(names) for user_id, names in config.users.items()}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.stats = {"products": 0, "connections": 0, "errors": 0,
+                      "timeouts": 0}
+
+    def entitled(self, user_id):
+        with self._lock:
+            names = self._entitled.get(user_id)
+            if names is None:
+                names = self._entitled[user_id] = set(
+                    self.config.default_entitled)
+            return set(names)
+
+    def set_entitled(self, user_id, names):
+        with self._lock:
+            self._entitled[user_id] = set(names)
+
+    def _draw(self):
+        """Return the delay of one call and whether it fails, hangs or
+        succeeds."""
+        config = self.config
+        with self._lock:
+            delay = config.latency
+            if config.latency_sigma and delay > 0:
+                delay = self._random.lognormvariate(0, config.latency_sigma)
+                delay *= config.latency
+            roll = self._random.random()
+        if roll < config.timeout_rate:
+            return config.hang, "timeout"
+        if roll < config.timeout_rate + config.error_rate:
+            return delay, "error"
+        return delay, "ok"
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def products_call(self, user_id):
+        """Return (status code, body) of an InSkillProducts call."""
+        delay, outcome = self._draw()
+        self._count("products")
+        if outcome != "ok":
+            self._count(outcome + "s")
+        time.sleep(delay)
+        if outcome == "error":
+            return 500, {"type": "INTERNAL_ERROR",
+                         "message": "Emulated service error"}
+        return 200, in_skill_products_body(
+            self.entitled(user_id), self.config.locale)
+
+    def connections_call(self, name, user_id, product_id):
+        """Return the request of the Connections.Response that Alexa
+        would send after name for product_id.
+
+        The purchase dialog isn't delayed or timed out, only failed at
+        error_rate.
+        """
+        with self._lock:
+            failed = self._random.random() < self.config.error_rate
+        self._count("connections")
+        request = {
+            "type": "Connections.Response",
+            "name": name,
+            "status": {"code": "200", "message": "OK"},
+            "payload": {"productId": product_id},
+            "token": "correlationToken",
+        }
+        if failed:
+            self._count("errors")
+            request["status"] = {"code": "500",
+                                 "message": "Emulated purchase error"}
+            return request
+
+        reference_name = product_id[len(PRODUCT_ID_PREFIX):]
+        owned = reference_name in self.entitled(user_id)
+        with self._lock:
+            accepted = self._random.random() < self.config.accept_rate
+        if name == "Buy" and owned:
+            result = "ALREADY_PURCHASED"
+        elif name == "Cancel" and not owned:
+            result = "DECLINED"
+        elif name in ("Buy", "Upsell", "Cancel") and accepted:
+            result = "ACCEPTED"
+            names = self.entitled(user_id)
+            if name == "Cancel":
+                names.discard(reference_name)
+            else:
+                names.add(reference_name)
+            self.set_entitled(user_id, names)
+        else:
+            result = "DECLINED"
+        request["payload"]["purchaseResult"] = result
+        return request
+
+
+class EmulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle and
+    # delayed ACKs add 40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    @property
+    def emulator(self):
+        return self.server.emulator
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _user_id(self):
+        authorization = self.headers.get("Authorization") or ""
+        return authorization.split(" ", 1)[-1]
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/inSkillProducts"):
+            self._send_json(*self.emulator.products_call(self._user_id()))
+        elif path == "/emulator/stats":
+            self._send_json(200, self.emulator.stats)
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/emulator/connections":
+            self._send_json(404, {"message": "Not found"})
+            return
+        body = self._read_json()
+        self._send_json(200, self.emulator.connections_call(
+            body["name"], body["userId"], body["productId"]))
+
+    def do_PUT(self):
+        match = USER_PATH.match(self.path)
+        if match is None:
+            self._send_json(404, {"message": "Not found"})
+            return
+        self.emulator.set_entitled(match.group("user_id"), self._read_json())
+        self._send_json(200, sorted(
+            self.emulator.entitled(match.group("user_id"))))
+
+
+class EmulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, emulator):
+        ThreadingHTTPServer.__init__(self, address, EmulatorRequestHandler)
+        self.emulator = emulator
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out close the connection mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+
+def start_emulator(config, host="127.0.0.1", port=0):
+    """Serve the emulator on a background thread and return the
+    server; port 0 picks a free port."""
+    server = EmulatorServer((host, port), MonetizationEmulator(config))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class EmulatorApiClient(ApiClient):
+    """ApiClient sending every request to the emulator at base_url,
+    keeping one keep-alive connection per thread.
+
+    :param timeout: socket timeout in seconds; a timed out call fails
+        like an unreachable monetization service
+    """
+    def __init__(self, base_url, timeout=2.0):
+        host_port = base_url.split("://", 1)[-1].rstrip("/")
+        self.host, _, port = host_port.partition(":")
+        self.port = int(port or 80)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def invoke(self, request):
+        path = "/" + request.url.split("://", 1)[-1].split("/", 1)[-1]
+        body = request.body
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        connection = self._connection()
+        try:
+            connection.request(request.method, path, body=body,
+                               headers=dict(request.headers or ()))
+            response = connection.getresponse()
+            data = response.read().decode("utf-8")
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+        return ApiClientResponse(
+            headers=response.getheaders(), status_code=response.status,
+            body=data)
+
+
+def add_emulator_arguments(parser):
+    """Add the emulator's behaviour options to an argument parser."""
+    parser.add_argument("--entitlements", default=None,
+                        help="JSON file of per-user entitled products")
+    parser.add_argument("--default-entitled", default="science_pack",
+                        help="comma separated reference names owned by "
+                             "users missing from --entitlements")
+    parser.add_argument("--latency-ms", type=float, default=20.0,
+                        help="median service latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="log-normal sigma of the latency, 0 for fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=10.0,
+                        help="how long a timed out call is held")
+    parser.add_argument("--accept-rate", type=float, default=0.8,
+                        help="fraction of Buy/Cancel/Upsell accepted")
+
+
+def emulator_config(args):
+    """Return the EmulatorConfig described by parsed arguments."""
+    kwargs = dict(
+        latency=args.latency_ms / 1000.0, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+        hang=args.hang_seconds, accept_rate=args.accept_rate)
+    if args.entitlements:
+        return EmulatorConfig.load_entitlements(args.entitlements, **kwargs)
+    return EmulatorConfig(
+        default_entitled=filter(None, args.default_entitled.split(",")),
+        **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8086)
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+
+    server = EmulatorServer(
+        (args.host, args.port), MonetizationEmulator(emulator_config(args)))
+    print("Monetization emulator on {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
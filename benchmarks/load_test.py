@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""Drive lambda_handler from several processes against the emulator.
+
+Every worker process imports the skill with its service calls sent to
+the monetization emulator (isp_emulator.py) and plays user sessions
+drawn from ``--mix``. A session starts with one of the recorded
+envelopes in ``benchmarks/envelopes`` for a random user; when the skill
+answers with a Buy, Cancel or Upsell directive the emulator decides the
+purchase and the resulting Connections.Response is sent back to the
+skill, as Alexa would.
+
+The report has throughput and p50/p95/p99 latency per turn, and counts
+turns answered by the skill's exception handler or raising, which is
+what an ISP error or timeout looks like to the user.
+
+Usage::
+
+    python benchmarks/load_test.py --processes 4 --sessions 2000
+        --latency-ms 40 --error-rate 0.02 --timeout-rate 0.01
+        --isp-timeout 1.0
+"""
+import argparse
+import copy
+import glob
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+from isp_emulator import (  # noqa: E402
+    EmulatorApiClient, add_emulator_arguments, emulator_config,
+    start_emulator)
+
+DEFAULT_MIX = "launch=3,category_fact=4,shopping=1,buy=1,cancel=0.5"
+CATEGORIES = ("science", "history", "space")
+ERROR_SPEECH = "can't understand the command"
+
+_worker = {}
+
+
+def load_templates():
+    """Return the recorded envelopes keyed on file name."""
+    templates = {}
+    for path in glob.glob(os.path.join(BENCH_DIR, "envelopes", "*.json")):
+        with open(path) as f:
+            templates[os.path.splitext(os.path.basename(path))[0]] = (
+                json.load(f))
+    return templates
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(round(pct / 100.0 * (len(sorted_values) - 1)))]
+
+
+def parse_mix(mix):
+    """Return (scenarios, weights) from "name=weight,..."."""
+    names, weights = [], []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit("Unknown scenario {!r}, expected one of {}".format(
+                name, ", ".join(sorted(SCENARIOS))))
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def _with_category(envelope, slot_name, category):
+    slots = envelope["request"]["intent"]["slots"]
+    if category is None:
+        slots.pop(slot_name, None)
+        return envelope
+    slot = slots[slot_name]
+    slot["value"] = category
+    value = slot["resolutions"]["resolutionsPerAuthority"][0]["values"][0]
+    value["value"] = {"name": category, "id": category}
+    return envelope
+
+
+def _launch(templates, rng):
+    return copy.deepcopy(templates["launch_request"])
+
+
+def _category_fact(templates, rng):
+    return _with_category(
+        copy.deepcopy(templates["get_category_fact_intent"]),
+        "factCategory", rng.choice(CATEGORIES))
+
+
+def _shopping(templates, rng):
+    return copy.deepcopy(templates["shopping_intent"])
+
+
+def _buy(templates, rng):
+    # No category asks for the all_access subscription
+    return _with_category(
+        copy.deepcopy(templates["buy_intent"]), "productCategory",
+        rng.choice(CATEGORIES + (None,)))
+
+
+def _cancel(templates, rng):
+    envelope = _with_category(
+        copy.deepcopy(templates["buy_intent"]), "productCategory", None)
+    envelope["request"]["intent"]["name"] = "CancelSubscriptionIntent"
+    return envelope
+
+
+SCENARIOS = {
+    "launch": _launch,
+    "category_fact": _category_fact,
+    "shopping": _shopping,
+    "buy": _buy,
+    "cancel": _cancel,
+}
+
+
+def _for_user(envelope, user_id, request_number):
+    envelope["session"]["user"]["userId"] = user_id
+    system = envelope["context"]["System"]
+    system["user"]["userId"] = user_id
+    # The emulator identifies the user by the bearer token
+    system["apiAccessToken"] = user_id
+    envelope["request"]["requestId"] = (
+        "amzn1.echo-api.request.load-{}".format(request_number))
+    return envelope
+
+
+def init_worker(base_url, isp_timeout, environ):
+    """Import the skill in the worker with calls sent to base_url."""
+    sys.path.insert(0, os.path.join(ROOT, "lambda", "py"))
+    os.environ.update(environ)
+    # Failed turns are counted in the report instead of logged
+    logging.disable(logging.CRITICAL)
+    import lambda_function
+
+    lambda_function.sb.api_client = EmulatorApiClient(
+        base_url, timeout=isp_timeout)
+    host_port = base_url.split("://", 1)[-1]
+    _worker.update(
+        handler=lambda_function.sb.lambda_handler(),
+        templates=load_templates(),
+        connections=http.client.HTTPConnection(host_port),
+        requests=0)
+
+
+def _connections_response(name, user_id, product_id):
+    connection = _worker["connections"]
+    connection.request(
+        "POST", "/emulator/connections",
+        body=json.dumps(
+            {"name": name, "userId": user_id, "productId": product_id}),
+        headers={"Content-Type": "application/json"})
+    return json.loads(connection.getresponse().read().decode("utf-8"))
+
+
+def _turn(name, envelope, user_id, records):
+    """Send one envelope, record it and return the response or None."""
+    _worker["requests"] += 1
+    envelope = _for_user(envelope, user_id, _worker["requests"])
+    started = time.perf_counter()
+    try:
+        response = _worker["handler"](envelope, None)
+    except Exception:
+        records.append((name, time.perf_counter() - started, "exception"))
+        return None
+    elapsed = time.perf_counter() - started
+    speech = ((response.get("response") or {}).get("outputSpeech") or
+              {}).get("ssml", "")
+    outcome = "error" if ERROR_SPEECH in speech else "ok"
+    records.append((name, elapsed, outcome))
+    return response
+
+
+def run_sessions(task):
+    """Play count sessions and return (turn, seconds, outcome) records."""
+    seed, count, scenarios, weights, users = task
+    rng = random.Random(seed)
+    templates = _worker["templates"]
+    records = []
+    for _ in range(count):
+        scenario = rng.choices(scenarios, weights)[0]
+        user_id = "amzn1.ask.account.LOAD{:04d}".format(rng.randrange(users))
+        response = _turn(
+            scenario, SCENARIOS[scenario](templates, rng), user_id, records)
+        directives = ((response or {}).get("response") or {}).get(
+            "directives") or ()
+        for directive in directives:
+            if directive.get("type") != "Connections.SendRequest":
+                continue
+            name = directive["name"]
+            product_id = directive["payload"]["InSkillProduct"]["productId"]
+            envelope = copy.deepcopy(templates["buy_response"])
+            envelope["request"] = dict(
+                envelope["request"],
+                **_connections_response(name, user_id, product_id))
+            _turn("connections_" + name.lower(), envelope, user_id, records)
+    return records
+
+
+def report(records, elapsed):
+    by_turn = {}
+    for name, seconds, outcome in records:
+        by_turn.setdefault(name, []).append((seconds, outcome))
+    print("{:<22} {:>7} {:>9} {:>9} {:>9} {:>7} {:>7}".format(
+        "turn", "count", "p50 ms", "p95 ms", "p99 ms", "errors", "raised"))
+    for name in sorted(by_turn):
+        turns = by_turn[name]
+        timings = sorted(seconds for seconds, _ in turns)
+        print("{:<22} {:>7} {:>9.2f} {:>9.2f} {:>9.2f} {:>7} {:>7}".format(
+            name, len(turns), percentile(timings, 50) * 1000,
+            percentile(timings, 95) * 1000, percentile(timings, 99) * 1000,
+            sum(1 for _, o in turns if o == "error"),
+            sum(1 for _, o in turns if o == "exception")))
+    timings = sorted(seconds for _, seconds, _ in records)
+    print("{} turns in {:.2f} s: {:.0f} turns/s, p50 {:.2f} ms, "
+          "p95 {:.2f} ms, p99 {:.2f} ms".format(
+              len(records), elapsed, len(records) / elapsed,
+              percentile(timings, 50) * 1000,
+              percentile(timings, 95) * 1000,
+              percentile(timings, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--chunk", type=int, default=25,
+                        help="sessions per worker task")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="scenario weights, from {}".format(
+                            ", ".join(sorted(SCENARIOS))))
+    parser.add_argument("--isp-timeout", type=float, default=2.0,
+                        help="skill-side timeout of monetization calls")
+    parser.add_argument("--cache-ttl", default=None,
+                        help="ISP_CACHE_TTL_SECONDS of the workers")
+    parser.add_argument("--emulator-url", default=None,
+                        help="use a running isp_emulator.py instead of "
+                             "starting one")
+    parser.add_argument("--seed", type=int, default=0)
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios, weights = parse_mix(args.mix)
+    server = None
+    base_url = args.emulator_url
+    if base_url is None:
+        server = start_emulator(emulator_config(args))
+        base_url = server.url
+
+    environ = {"EMIT_METRICS": "false", "LOG_SAMPLE_RATE": "0"}
+    if args.cache_ttl is not None:
+        environ["ISP_CACHE_TTL_SECONDS"] = args.cache_ttl
+    tasks = []
+    remaining = args.sessions
+    while remaining > 0:
+        count = min(args.chunk, remaining)
+        tasks.append((args.seed + len(tasks), count, scenarios, weights,
+                      args.users))
+        remaining -= count
+
+    # spawn, so workers don't inherit the emulator's threads and socket
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(args.processes, initializer=init_worker,
+                        initargs=(base_url, args.isp_timeout, environ))
+    try:
+        # Let every worker import the skill before timing
+        pool.map(time.sleep, [0.01] * args.processes)
+        started = time.perf_counter()
+        records = []
+        for chunk in pool.imap_unordered(run_sessions, tasks):
+            records.extend(chunk)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.close()
+        pool.join()
+
+    report(records, elapsed)
+    if server is not None:
+        print("Emulator: {}".format(json.dumps(server.emulator.stats)))
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
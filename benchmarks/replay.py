@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Replay recorded request envelopes through lambda_handler in-process.
+
+Each envelope in ``benchmarks/envelopes`` is run ``--iterations`` times
+against the skill with the monetization service replaced by
+StubMonetizationApiClient. For every envelope the script reports p50,
+p95 and p99 latency, requests per second and the peak memory allocated
+per request (traced in a separate pass so tracing doesn't skew timing).
+
+With ``--baseline`` the p95 of every envelope is compared with a
+previously saved run and the script exits non-zero when any of them
+regressed by more than ``--threshold`` percent.
+
+Usage::
+
+    python benchmarks/replay.py [--iterations 500] [--latency-ms 20]
+        [--cold-cache] [--save-baseline benchmarks/baseline.json]
+        [--baseline benchmarks/baseline.json --threshold 20]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, "lambda", "py"))
+# Keep the per-turn metric lines out of the report
+os.environ.setdefault("EMIT_METRICS", "false")
+
+from stubs import StubMonetizationApiClient  # noqa: E402
+
+import lambda_function  # noqa: E402
+
+ENVELOPE_DIR = os.path.join(BENCH_DIR, "envelopes")
+
+
+def load_envelopes(pattern="*.json"):
+    """Return (name, envelope) pairs for the recorded envelopes."""
+    envelopes = []
+    for path in sorted(glob.glob(os.path.join(ENVELOPE_DIR, pattern))):
+        with open(path) as f:
+            envelopes.append(
+                (os.path.splitext(os.path.basename(path))[0], json.load(f)))
+    return envelopes
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+def build_handler(api_client):
+    """Return a lambda handler for the skill talking to api_client."""
+    lambda_function.sb.api_client = api_client
+    return lambda_function.sb.lambda_handler()
+
+
+def run_case(handler, envelope, iterations, cold_cache):
+    """Time iterations of envelope through handler."""
+    cache = lambda_function.product_cache
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if cold_cache:
+            cache.clear()
+        t0 = time.perf_counter()
+        handler(envelope, None)
+        timings.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "rps": iterations / elapsed if elapsed else 0.0,
+    }
+
+
+def trace_allocations(handler, envelope, iterations, cold_cache):
+    """Return the mean peak traced KiB allocated per request."""
+    cache = lambda_function.product_cache
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            if cold_cache:
+                cache.clear()
+            tracemalloc.clear_traces()
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            handler(envelope, None)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024.0
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human readable regressions over threshold %."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("p95_ms"):
+            continue
+        change = (result["p95_ms"] / previous["p95_ms"] - 1) * 100
+        if change > threshold:
+            regressions.append(
+                "{}: p95 {:.3f} ms vs baseline {:.3f} ms (+{:.0f}%)".format(
+                    name, result["p95_ms"], previous["p95_ms"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated monetization service latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--entitled", default="science_pack",
+                        help="comma separated reference names the user owns")
+    parser.add_argument("--cold-cache", action="store_true",
+                        help="clear the product cache before every request")
+    parser.add_argument("--envelopes", default="*.json",
+                        help="glob of envelope files to replay")
+    parser.add_argument("--no-alloc", action="store_true",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="allowed p95 regression in percent")
+    parser.add_argument("--save-baseline", default=None)
+    args = parser.parse_args()
+
+    client = StubMonetizationApiClient(
+        entitled=tuple(filter(None, args.entitled.split(","))),
+        latency=args.latency_ms / 1000.0, jitter=args.jitter_ms / 1000.0)
+    handler = build_handler(client)
+
+    results = {}
+    print("{:<28} {:>9} {:>9} {:>9} {:>10} {:>11} {:>9}".format(
+        "envelope", "p50 ms", "p95 ms", "p99 ms", "req/s", "alloc KiB",
+        "isp/req"))
+    for name, envelope in load_envelopes(args.envelopes):
+        run_case(handler, envelope, args.warmup, args.cold_cache)
+        calls_before = client.calls
+        result = run_case(handler, envelope, args.iterations, args.cold_cache)
+        result["isp_calls_per_request"] = (
+            (client.calls - calls_before) / float(args.iterations))
+        if not args.no_alloc:
+            result["alloc_kib"] = trace_allocations(
+                handler, envelope, min(args.iterations, 100),
+                args.cold_cache)
+        results[name] = result
+        print("{:<28} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.0f} {:>11} {:>9.2f}"
+              .format(name, result["p50_ms"], result["p95_ms"],
+                      result["p99_ms"], result["rps"],
+                      "{:.1f}".format(result["alloc_kib"])
+                      if "alloc_kib" in result else "-",
+                      result["isp_calls_per_request"]))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("FAIL: p95 regressed by more than {:.0f}%".format(
+                args.threshold))
+            for line in regressions:
+                print("  " + line)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Compare cached response dicts with the SDK serializer.
+
+For every response the skill takes from its ResponseCache (help,
+fallback, goodbye, no more products), the script times
+
+* serializing the ResponseEnvelope with DefaultSerializer, and
+* ResponseCache.serialize_envelope, which reuses the response's dict
+
+and then whole turns through lambda_handler with the response cache on
+and off in the skill builder. The monetization service is replaced by
+StubMonetizationApiClient with every product owned, so ShoppingIntent
+takes the "no more products" branch.
+
+Usage::
+
+    python benchmarks/response_serialization.py [--iterations 5000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, "lambda", "py"))
+os.environ.setdefault("EMIT_METRICS", "false")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+
+from ask_sdk_core.serialize import DefaultSerializer  # noqa: E402
+from ask_sdk_model import RequestEnvelope, ResponseEnvelope  # noqa: E402
+
+from stubs import StubMonetizationApiClient  # noqa: E402
+
+import lambda_function  # noqa: E402
+
+ALL_PRODUCTS = ("science_pack", "history_pack", "space_pack", "all_access")
+INTENTS = (
+    ("fallback", "AMAZON.FallbackIntent"),
+    ("help", "AMAZON.HelpIntent"),
+    ("goodbye", "AMAZON.NoIntent"),
+    ("no_more_products", "ShoppingIntent"),
+)
+
+
+def intent_envelope(intent_name):
+    """Return the recorded ShoppingIntent envelope for intent_name."""
+    with open(os.path.join(BENCH_DIR, "envelopes",
+                           "shopping_intent.json")) as f:
+        envelope = json.load(f)
+    envelope["request"]["intent"]["name"] = intent_name
+    envelope["session"]["attributes"] = {"factSampler": {"*": "9f3a.4"}}
+    return envelope
+
+
+def time_per_call(function, iterations):
+    """Return the mean microseconds of a call of function."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    cache = lambda_function.response_cache
+    if cache is None:
+        raise SystemExit("RESPONSE_CACHE is off")
+    lambda_function.sb.api_client = StubMonetizationApiClient(
+        entitled=ALL_PRODUCTS)
+    envelopes = [(name, intent_envelope(intent))
+                 for name, intent in INTENTS]
+
+    cached_handler = lambda_function.sb.lambda_handler()
+    lambda_function.sb.response_cache = None
+    uncached_handler = lambda_function.sb.lambda_handler()
+    lambda_function.sb.response_cache = cache
+
+    serializer = DefaultSerializer()
+    skill = lambda_function.sb.create()
+    print("{:<18} {:>14} {:>14} {:>12} {:>12}".format(
+        "response", "serialize us", "cached us", "turn us", "cached turn"))
+    for name, envelope in envelopes:
+        response_envelope = skill.invoke(
+            request_envelope=serializer.deserialize(
+                json.dumps(envelope), RequestEnvelope),
+            context=None)
+        if cache.serialized(response_envelope.response) is None:
+            raise SystemExit("{} was not served from the cache".format(name))
+        response = response_envelope.response
+        attributes = response_envelope.session_attributes
+
+        def serialize():
+            serializer.serialize(ResponseEnvelope(
+                response=response, session_attributes=attributes,
+                version="1.0"))
+
+        def serialize_cached():
+            cache.serialize_envelope(serializer, ResponseEnvelope(
+                response=response, session_attributes=attributes,
+                version="1.0"))
+
+        print("{:<18} {:>14.1f} {:>14.1f} {:>12.1f} {:>12.1f}".format(
+            name,
+            time_per_call(serialize, args.iterations),
+            time_per_call(serialize_cached, args.iterations),
+            time_per_call(lambda: uncached_handler(envelope, None),
+                          args.iterations),
+            time_per_call(lambda: cached_handler(envelope, None),
+                          args.iterations)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Local stand-ins for the Alexa monetization service."""
+import glob
+import json
+import os
+import random
+import time
+
+from ask_sdk_model.services import ApiClient, ApiClientResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ISP_SAMPLES_DIR = os.path.join(ROOT, "isps.samples")
+PRODUCT_ID_PREFIX = "amzn1.adg.product."
+
+
+def load_isp_samples(locale="en-US", samples_dir=ISP_SAMPLES_DIR):
+    """Return the product definitions in isps.samples as dicts keyed on
+    reference name."""
+    products = {}
+    for path in sorted(glob.glob(os.path.join(samples_dir, "*", "*.json"))):
+        with open(path) as f:
+            sample = json.load(f)
+        listing = sample["publishingInformation"]["locales"][locale]
+        products[sample["referenceName"]] = {
+            "type": sample["type"],
+            "name": listing["name"],
+            "summary": listing["summary"],
+            "purchasable": sample.get("purchasableState", "PURCHASABLE"),
+        }
+    return products
+
+
+def in_skill_products_body(entitled=(), locale="en-US"):
+    """Return an InSkillProducts API response body in which the
+    reference names in entitled are owned by the user."""
+    products = []
+    for reference_name, sample in load_isp_samples(locale).items():
+        owned = reference_name in entitled
+        products.append({
+            "productId": PRODUCT_ID_PREFIX + reference_name,
+            "referenceName": reference_name,
+            "type": sample["type"],
+            "name": sample["name"],
+            "summary": sample["summary"],
+            "entitled": "ENTITLED" if owned else "NOT_ENTITLED",
+            "entitlementReason": "PURCHASED" if owned else "NOT_PURCHASED",
+            "activeEntitlementCount": 1 if owned else 0,
+            "purchasable": ("NOT_PURCHASABLE" if owned
+                            else sample["purchasable"]),
+            "purchaseMode": "TEST",
+        })
+    return {"inSkillProducts": products, "isTruncated": False,
+            "nextToken": None}
+
+
+class StubMonetizationApiClient(ApiClient):
+    """ApiClient answering every request with a canned InSkillProducts
+    body after a simulated network delay.
+
+    :param entitled: reference names the user owns
+    :param latency: mean delay in seconds
+    :param jitter: uniform +/- jitter in seconds added to latency
+    """
+    def __init__(self, entitled=("science_pack",), latency=0.0, jitter=0.0,
+                 locale="en-US"):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._body = json.dumps(in_skill_products_body(entitled, locale))
+
+    def invoke(self, request):
+        self.calls += 1
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return ApiClientResponse(
+            headers=[("Content-Type", "application/json")],
+            status_code=200, body=self._body)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Skill builder wiring the skill's own dispatch components."""
+import json
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ask_sdk_core.handler_input import HandlerInput
+from ask_sdk_core.skill import CustomSkill, SkillConfiguration
+from ask_sdk_core.skill_builder import CustomSkillBuilder
+from ask_sdk_model import RequestEnvelope
+from ask_sdk_runtime.dispatch_components import (
+    GenericRequestHandlerChain, GenericRequestMapper)
+
+from fast_envelope import parse_request_envelope
+from response_cache import ResponseCache
+from telemetry import TracingHandlerAdapter
+
+Route = Tuple[str, Optional[str]]
+
+INTENT_REQUEST = "IntentRequest"
+CONNECTIONS_RESPONSE = "Connections.Response"
+
+
+def request_route(request_type):
+    # type: (str) -> Route
+    """Route matching every request of request_type."""
+    return request_type, None
+
+
+def intent_route(intent_name):
+    # type: (str) -> Route
+    """Route matching IntentRequests for intent_name."""
+    return INTENT_REQUEST, intent_name
+
+
+def connections_route(name):
+    # type: (str) -> Route
+    """Route matching Connections.Response events named name."""
+    return CONNECTIONS_RESPONSE, name
+
+
+def request_route_key(handler_input):
+    # type: (HandlerInput) -> Route
+    """Return the (request type, name) key of the current request."""
+    request = handler_input.request_envelope.request
+    request_type = request.object_type
+    if request_type == INTENT_REQUEST:
+        return request_type, request.intent.name
+    if request_type == CONNECTIONS_RESPONSE:
+        return request_type, request.name
+    return request_type, None
+
+
+class IndexedRequestMapper(GenericRequestMapper):
+    """Request mapper dispatching through a hash table.
+
+    Handlers declaring a ``routes`` class attribute (a sequence of
+    :func:`request_route`, :func:`intent_route` or
+    :func:`connections_route` keys) are looked up by request type and
+    intent or Connections.Response name without calling ``can_handle``.
+    Handlers without routes are tried afterwards, in registration order,
+    through their ``can_handle`` predicates.
+    """
+    def __init__(self, request_handler_chains):
+        # type: (List[GenericRequestHandlerChain]) -> None
+        self._routes = {}  # type: Dict[Route, GenericRequestHandlerChain]
+        self._fallbacks = []  # type: List[GenericRequestHandlerChain]
+        super(IndexedRequestMapper, self).__init__(request_handler_chains)
+
+    def add_request_handler_chain(self, request_handler_chain):
+        # type: (GenericRequestHandlerChain) -> None
+        super(IndexedRequestMapper, self).add_request_handler_chain(
+            request_handler_chain)
+        routes = getattr(
+            request_handler_chain.request_handler, "routes", None
+        )  # type: Optional[Sequence[Route]]
+        if not routes:
+            self._fallbacks.append(request_handler_chain)
+            return
+        for route in routes:
+            # The first registered handler wins, as with can_handle
+            self._routes.setdefault(route, request_handler_chain)
+
+    def get_request_handler_chain(self, handler_input):
+        # type: (HandlerInput) -> Optional[GenericRequestHandlerChain]
+        key = request_route_key(handler_input)
+        chain = self._routes.get(key)
+        if chain is None and key[1] is not None:
+            chain = self._routes.get((key[0], None))
+        if chain is not None:
+            return chain
+        for chain in self._fallbacks:
+            if chain.request_handler.can_handle(handler_input):
+                return chain
+        return None
+
+
+class FactSkillBuilder(CustomSkillBuilder):
+    """CustomSkillBuilder with the skill's dispatch components.
+
+    Requests are mapped through an IndexedRequestMapper and handlers
+    run through a TracingHandlerAdapter, so interceptors know which
+    handler served the turn. The skill, and with it the dispatch table,
+    is built once per lambda_handler instead of once per request.
+
+    With fast_envelopes, events of the request types in
+    fast_envelope.FAST_REQUEST_TYPES are read by
+    parse_request_envelope instead of the SDK serializer. Responses
+    handlers took from response_cache are not serialized again.
+    """
+    def __init__(self, persistence_adapter=None, api_client=None,
+                 fast_envelopes=False, response_cache=None):
+        # type: (Any, Any, bool, Optional[ResponseCache]) -> None
+        super(FactSkillBuilder, self).__init__(
+            persistence_adapter=persistence_adapter, api_client=api_client)
+        self.fast_envelopes = fast_envelopes
+        self.response_cache = response_cache
+
+    @property
+    def skill_configuration(self):
+        # type: () -> SkillConfiguration
+        skill_config = super(FactSkillBuilder, self).skill_configuration
+        skill_config.request_mappers = [IndexedRequestMapper(
+            self.runtime_configuration_builder.request_handler_chains)]
+        skill_config.handler_adapters = [TracingHandlerAdapter()]
+        return skill_config
+
+    def lambda_handler(self):
+        # type: () -> Callable[[Dict[str, Any], Any], Dict[str, Any]]
+        skill = self.create()  # type: CustomSkill
+        fast_envelopes = self.fast_envelopes
+        response_cache = self.response_cache
+
+        def wrapper(event, context):
+            # type: (Dict[str, Any], Any) -> Dict[str, Any]
+            request_envelope = None
+            if fast_envelopes:
+                request_envelope = parse_request_envelope(event)
+            if request_envelope is None:
+                request_envelope = skill.serializer.deserialize(
+                    payload=json.dumps(event), obj_type=RequestEnvelope)
+            response_envelope = skill.invoke(
+                request_envelope=request_envelope, context=context)
+            if response_cache is not None:
+                return response_cache.serialize_envelope(
+                    skill.serializer, response_envelope)
+            return skill.serializer.serialize(response_envelope)
+        return wrapper
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Signed snapshot of a user's entitlements kept in session attributes.
+
+Turns of one session may land on different containers, so the product
+cache doesn't spare repeat InSkillProducts calls within a session. The
+snapshot travels with the session instead::
+
+    {"entitlements": "66f2b1c0:all_access,science_pack:Qk3v0c1nYp8iF2aXr9bW1g"}
+
+It holds the fetch time (hex seconds), the entitled reference names and
+a truncated HMAC-SHA256 over both plus the user id and locale. Snapshots
+that were altered, or that belong to another user or locale, are
+ignored.
+"""
+import base64
+import hashlib
+import hmac
+import time
+
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional
+
+SESSION_ATTRIBUTE = "entitlements"
+SIGNATURE_BYTES = 16
+
+
+class EntitlementSnapshots(object):
+    """Write and verify entitlement snapshots.
+
+    :param key: HMAC key; every container must use the same key to
+        trust each other's snapshots
+    :param max_age: seconds a snapshot is trusted after its fetch
+    """
+    def __init__(self, key, max_age=3600.0, attribute=SESSION_ATTRIBUTE,
+                 clock=time.time):
+        # type: (bytes, float, str, Callable[[], float]) -> None
+        self.key = key
+        self.max_age = max_age
+        self.attribute = attribute
+        self._clock = clock
+
+    def _signature(self, user_id, locale, fetched_at, names):
+        # type: (str, str, str, str) -> str
+        message = "\n".join([user_id, locale or "", fetched_at, names])
+        digest = hmac.new(
+            self.key, message.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(
+            digest[:SIGNATURE_BYTES]).decode("ascii").rstrip("=")
+
+    def encode(self, user_id, locale, entitled, fetched_at=None):
+        # type: (str, str, Iterable[str], Optional[float]) -> str
+        """Return the signed snapshot of the entitled reference names."""
+        if fetched_at is None:
+            fetched_at = self._clock()
+        stamp = "{:x}".format(int(fetched_at))
+        names = ",".join(sorted(entitled))
+        return "{}:{}:{}".format(
+            stamp, names, self._signature(user_id, locale, stamp, names))
+
+    def decode(self, snapshot, user_id, locale):
+        # type: (Any, str, str) -> Optional[FrozenSet[str]]
+        """Return the entitled reference names of a valid snapshot, or
+        None if it is missing, forged, foreign or too old."""
+        try:
+            stamp, names, signature = snapshot.split(":")
+            fetched_at = int(stamp, 16)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(
+                signature, self._signature(user_id, locale, stamp, names)):
+            return None
+        if self._clock() - fetched_at > self.max_age:
+            return None
+        return frozenset(names.split(",")) if names else frozenset()
+
+    def load(self, session_attributes, user_id, locale):
+        # type: (Dict[str, Any], str, str) -> Optional[FrozenSet[str]]
+        return self.decode(
+            session_attributes.get(self.attribute), user_id, locale)
+
+    def save(self, session_attributes, user_id, locale, entitled,
+             fetched_at=None):
+        # type: (Dict[str, Any], str, str, Iterable[str], Optional[float]) -> None
+        session_attributes[self.attribute] = self.encode(
+            user_id, locale, entitled, fetched_at)
+
+    def invalidate(self, session_attributes):
+        # type: (Dict[str, Any]) -> None
+        session_attributes.pop(self.attribute, None)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""Cross-container store of the users' In-skill product state.
+
+The product cache in lambda_function only helps the container that
+filled it. EntitlementStore keeps the last InSkillProductsResponse of
+every user in a persistence adapter shared by all containers, so a cold
+container can answer from it instead of calling the monetization
+service.
+
+Records are stored in the adapter's attributes under ``entitlements``,
+one per locale::
+
+    {"version": 3, "fetchedAt": 1760000000000,
+     "entitled": ["science_pack"], "response": {...}}
+
+``entitled`` is the user's entitled reference names, ``response`` the
+serialized InSkillProductsResponse, ``fetchedAt`` when the monetization
+service returned it, in epoch milliseconds, and ``version`` the number
+of writes. Records hold no floats, which DynamoDB rejects; the Decimals
+it returns are converted on read.
+
+An accepted purchase or cancel replaces the user's records with
+``{"version": 4, "fetchedAt": <time of the purchase>, "response":
+null}``, so nothing is loaded from them until products fetched after
+the purchase are saved. A write older than the stored record (products
+fetched before the stored ones, or before the purchase that invalidated
+them) is skipped, so a slow write doesn't bring back outdated products.
+The check is not atomic: two containers writing at the same instant can
+still race.
+
+Backends are chosen from the environment by :func:`build_entitlement_store`:
+
+* ``ENTITLEMENT_TABLE``: DynamoDB table read and written through the
+  ASK SDK DynamoDbAdapter (``pip install
+  ask-sdk-dynamodb-persistence-adapter``). The adapter and boto3 are
+  imported on first use, not at cold start.
+* ``ENTITLEMENT_SQLITE_PATH``: local SQLite file, for testing.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import Executor, Future
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model import RequestEnvelope
+from ask_sdk_model.services.monetization import (
+    EntitledState, InSkillProductsResponse)
+
+from isp_cache import fetched_at, mark_fetched
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE_NAME = "entitlements"
+
+
+def _to_millis(seconds):
+    # type: (float) -> int
+    return int(seconds * 1000)
+
+
+def _to_seconds(millis):
+    # type: (Any) -> float
+    return float(millis) / 1000.0
+
+
+def _replace(records, locale, fetched, fields):
+    # type: (Dict[str, Any], str, float, Dict[str, Any]) -> bool
+    """Replace the record of locale with fields, unless it is newer than
+    fetched."""
+    previous = records.get(locale) or {}
+    if previous.get("fetchedAt", 0) > _to_millis(fetched):
+        return False
+    record = {
+        "version": int(previous.get("version", 0)) + 1,
+        "fetchedAt": _to_millis(fetched),
+    }
+    record.update(fields)
+    records[locale] = record
+    return True
+
+
+def _json_number(value):
+    # type: (Any) -> Any
+    """json.dumps default for the Decimals of DynamoDB records."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(
+            value)
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def _user_id(request_envelope):
+    # type: (RequestEnvelope) -> str
+    return request_envelope.context.system.user.user_id
+
+
+class SqlitePersistenceAdapter(AbstractPersistenceAdapter):
+    """Persistence adapter keeping JSON attributes per user in SQLite."""
+    def __init__(self, path):
+        # type: (str) -> None
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS attributes "
+                "(id TEXT PRIMARY KEY, attributes TEXT NOT NULL)")
+
+    def _connect(self):
+        # type: () -> sqlite3.Connection
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, Any]
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT attributes FROM attributes WHERE id = ?",
+                (_user_id(request_envelope),)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, Any]) -> None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO attributes (id, attributes) "
+                "VALUES (?, ?)",
+                (_user_id(request_envelope), json.dumps(attributes)))
+
+    def delete_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> None
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM attributes WHERE id = ?",
+                (_user_id(request_envelope),))
+
+
+class EntitlementStore(object):
+    """Read and write users' product state through a persistence
+    adapter.
+
+    :param adapter_factory: callable returning the persistence adapter,
+        called on first use
+    :param ttl: seconds a stored record is trusted
+    :param executor: executor running save_async writes
+    """
+    def __init__(self, adapter_factory, ttl=3600.0, executor=None,
+                 clock=time.time):
+        # type: (Callable[[], AbstractPersistenceAdapter], float, Optional[Executor], Callable[[], float]) -> None
+        self._adapter_factory = adapter_factory
+        self._adapter = None  # type: Optional[AbstractPersistenceAdapter]
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.executor = executor
+        self.serializer = DefaultSerializer()
+        self._clock = clock
+
+    @property
+    def adapter(self):
+        # type: () -> AbstractPersistenceAdapter
+        if self._adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = self._adapter_factory()
+        return self._adapter
+
+    def load(self, request_envelope, locale):
+        # type: (RequestEnvelope, str) -> Optional[InSkillProductsResponse]
+        """Return the user's stored response for locale if it is younger
+        than ttl, marked with the time it was fetched."""
+        attributes = self.adapter.get_attributes(request_envelope) or {}
+        record = attributes.get(ATTRIBUTE_NAME, {}).get(locale)
+        if not record or record.get("response") is None:
+            return None
+        fetched = _to_seconds(record.get("fetchedAt", 0))
+        if fetched + self.ttl <= self._clock():
+            return None
+        response = self.serializer.deserialize(
+            json.dumps(record["response"], default=_json_number),
+            InSkillProductsResponse)
+        mark_fetched(response, fetched)
+        return response
+
+    def save(self, request_envelope, locale, response):
+        # type: (RequestEnvelope, str, InSkillProductsResponse) -> bool
+        """Store response as the user's product state for locale,
+        unless the stored one was fetched later. Returns whether it was
+        stored."""
+        fetched = fetched_at(response)
+        if fetched is None:
+            fetched = self._clock()
+        attributes = self.adapter.get_attributes(request_envelope) or {}
+        records = attributes.setdefault(ATTRIBUTE_NAME, {})
+        if not _replace(records, locale, fetched, {
+                "entitled": [
+                    p.reference_name
+                    for p in response.in_skill_products or ()
+                    if p.entitled == EntitledState.ENTITLED],
+                "response": self.serializer.serialize(response)}):
+            return False
+        self.adapter.save_attributes(request_envelope, attributes)
+        return True
+
+    def invalidate(self, request_envelope, invalidated_at=None):
+        # type: (RequestEnvelope, Optional[float]) -> bool
+        """Mark the user's records of every locale as outdated since
+        invalidated_at (default now), e.g. by an accepted purchase.
+        Returns whether a record was changed."""
+        if invalidated_at is None:
+            invalidated_at = self._clock()
+        attributes = self.adapter.get_attributes(request_envelope) or {}
+        records = attributes.get(ATTRIBUTE_NAME) or {}
+        changed = [
+            _replace(records, locale, invalidated_at, {"response": None})
+            for locale in list(records)]
+        if not any(changed):
+            return False
+        self.adapter.save_attributes(request_envelope, attributes)
+        return True
+
+    def save_async(self, request_envelope, locale, response):
+        # type: (RequestEnvelope, str, InSkillProductsResponse) -> Optional[Future]
+        """Save on the executor, or inline if there is none. Failures
+        are logged, never raised."""
+        return self._submit(self.save, request_envelope, locale, response)
+
+    def invalidate_async(self, request_envelope):
+        # type: (RequestEnvelope) -> Optional[Future]
+        """Invalidate as of now on the executor, or inline if there is
+        none. Failures are logged, never raised."""
+        return self._submit(
+            self.invalidate, request_envelope, self._clock())
+
+    def _submit(self, write, *args):
+        # type: (Callable[..., bool], *Any) -> Optional[Future]
+        if self.executor is None:
+            self._write_logged(write, *args)
+            return None
+        return self.executor.submit(self._write_logged, write, *args)
+
+    def _write_logged(self, write, *args):
+        # type: (Callable[..., bool], *Any) -> None
+        try:
+            write(*args)
+        except Exception:
+            logger.warning("Could not store entitlements", exc_info=True)
+
+
+def _dynamodb_adapter_factory(table_name):
+    # type: (str) -> Callable[[], AbstractPersistenceAdapter]
+    def factory():
+        from ask_sdk_dynamodb.adapter import DynamoDbAdapter
+        return DynamoDbAdapter(table_name=table_name)
+    return factory
+
+
+def build_entitlement_store(executor=None, environ=os.environ):
+    # type: (Optional[Executor], Dict[str, str]) -> Optional[EntitlementStore]
+    """Return the store configured in the environment, or None."""
+    ttl = float(environ.get("ENTITLEMENT_TTL_SECONDS", "3600"))
+    table_name = environ.get("ENTITLEMENT_TABLE")
+    if table_name:
+        return EntitlementStore(
+            _dynamodb_adapter_factory(table_name), ttl=ttl,
+            executor=executor)
+    sqlite_path = environ.get("ENTITLEMENT_SQLITE_PATH")
+    if sqlite_path:
+        return EntitlementStore(
+            lambda: SqlitePersistenceAdapter(sqlite_path), ttl=ttl,
+            executor=executor)
+    return None
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Memory-mapped, on-disk fact catalogue.
+
+The catalogue is a single little-endian binary file::
+
+    header      magic b"FCAT", version (u16), category count (u16),
+                fact count (u32)
+    categories  per category: name length (u16), UTF-8 name,
+                first fact index (u32), end fact index (u32)
+    offsets     fact count + 1 blob offsets (u32)
+    blob        UTF-8 fact texts, back to back
+
+Facts of a category are stored contiguously, so a category is just an
+index range. The file is memory-mapped and a fact is decoded only when
+it is read, so opening the catalogue costs the same for thirty facts
+as for millions.
+
+Build a catalogue from a JSON list of ``{"type": ..., "fact": ...}``
+objects with::
+
+    python fact_catalogue.py data/en-US/facts.json data/en-US/facts.bin
+"""
+import io
+import json
+import mmap
+import struct
+import sys
+import threading
+
+from collections import abc
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+MAGIC = b"FCAT"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_NAME_LENGTH = struct.Struct("<H")
+_RANGE = struct.Struct("<II")
+_OFFSET = struct.Struct("<I")
+_OFFSET_PAIR = struct.Struct("<II")
+
+
+class CatalogueError(Exception):
+    """Raised when a catalogue file is malformed."""
+    pass
+
+
+def write_catalogue(path, facts):
+    # type: (str, Iterable[Mapping[str, str]]) -> None
+    """Write facts to path in catalogue format, grouped by category in
+    order of first appearance."""
+    by_category = {}  # type: Dict[str, List[bytes]]
+    for item in facts:
+        by_category.setdefault(item["type"], []).append(
+            item["fact"].encode("utf-8"))
+
+    fact_count = sum(len(v) for v in by_category.values())
+    header = io.BytesIO()
+    header.write(_HEADER.pack(MAGIC, VERSION, len(by_category), fact_count))
+    start = 0
+    for category, category_facts in by_category.items():
+        name = category.encode("utf-8")
+        header.write(_NAME_LENGTH.pack(len(name)))
+        header.write(name)
+        header.write(_RANGE.pack(start, start + len(category_facts)))
+        start += len(category_facts)
+
+    offsets = io.BytesIO()
+    blob = io.BytesIO()
+    for category_facts in by_category.values():
+        for fact in category_facts:
+            offsets.write(_OFFSET.pack(blob.tell()))
+            blob.write(fact)
+    offsets.write(_OFFSET.pack(blob.tell()))
+    if blob.tell() > 0xFFFFFFFF:
+        raise CatalogueError("Fact blob exceeds 4 GiB")
+
+    with open(path, "wb") as f:
+        f.write(header.getvalue())
+        f.write(offsets.getvalue())
+        f.write(blob.getvalue())
+
+
+class FactCatalogue(object):
+    """Read-only view over a catalogue file.
+
+    The file is opened and mapped on first use and stays mapped for the
+    lifetime of the container.
+    """
+    def __init__(self, path):
+        # type: (str) -> None
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None  # type: mmap.mmap
+        self._categories = None  # type: Dict[str, Tuple[int, int]]
+        self._fact_count = 0
+        self._offsets_at = 0
+        self._blob_at = 0
+
+    def _open(self):
+        # type: () -> None
+        with self._lock:
+            if self._map is not None:
+                return
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version, category_count, fact_count = (
+                _HEADER.unpack_from(mapped, 0))
+            if magic != MAGIC or version != VERSION:
+                mapped.close()
+                raise CatalogueError(
+                    "{} is not a version {} fact catalogue".format(
+                        self.path, VERSION))
+
+            categories = {}
+            pos = _HEADER.size
+            for _ in range(category_count):
+                (length,) = _NAME_LENGTH.unpack_from(mapped, pos)
+                pos += _NAME_LENGTH.size
+                name = mapped[pos:pos + length].decode("utf-8")
+                pos += length
+                categories[name] = _RANGE.unpack_from(mapped, pos)
+                pos += _RANGE.size
+
+            self._fact_count = fact_count
+            self._offsets_at = pos
+            self._blob_at = pos + (fact_count + 1) * _OFFSET.size
+            self._categories = categories
+            self._map = mapped
+
+    @property
+    def categories(self):
+        # type: () -> Dict[str, Tuple[int, int]]
+        """Mapping of category name to its (start, end) fact range."""
+        if self._map is None:
+            self._open()
+        return self._categories
+
+    def __len__(self):
+        # type: () -> int
+        if self._map is None:
+            self._open()
+        return self._fact_count
+
+    def fact(self, index):
+        # type: (int) -> str
+        """Decode and return the fact at index."""
+        if self._map is None:
+            self._open()
+        start, end = _OFFSET_PAIR.unpack_from(
+            self._map, self._offsets_at + index * _OFFSET.size)
+        return self._map[self._blob_at + start:self._blob_at + end].decode(
+            "utf-8")
+
+    def view(self, start=0, end=None):
+        # type: (int, int) -> FactRange
+        """Return a lazy sequence over the facts in [start, end)."""
+        if end is None:
+            end = len(self)
+        return FactRange(self, start, end)
+
+
+class FactRange(abc.Sequence):
+    """Lazy sequence of facts backed by a FactCatalogue.
+
+    Works with ``random.choice``: only the chosen fact is decoded.
+    """
+    __slots__ = ("_catalogue", "_start", "_end")
+
+    def __init__(self, catalogue, start, end):
+        # type: (FactCatalogue, int, int) -> None
+        self._catalogue = catalogue
+        self._start = start
+        self._end = end
+
+    def __len__(self):
+        # type: () -> int
+        return self._end - self._start
+
+    def __getitem__(self, index):
+        # type: (int) -> str
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("fact index out of range")
+        return self._catalogue.fact(self._start + index)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python fact_catalogue.py <facts.json> <out.bin>")
+    with io.open(sys.argv[1], encoding="utf-8") as source:
+        write_catalogue(sys.argv[2], json.load(source))
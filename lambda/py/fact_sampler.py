@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Non-repeating fact draws with constant-size session state.
+
+Instead of the facts a user heard, the session keeps one seeded
+permutation cursor per category::
+
+    {"factSampler": {"science": "9f3a1c2e.4", "*": "51b0aa07.12"}}
+
+The seed picks an affine permutation ``(a * i + b) mod n`` of the n
+facts of the category (``*`` is every fact) and the cursor is how many
+of them were drawn. Each draw takes expected O(1) time and no memory
+kept between draws, and no fact repeats until all n were heard; then a
+new seed starts the next cycle. The state is a few bytes per category
+whatever the number of facts.
+"""
+import random
+
+from math import gcd
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from fact_store import FactStore
+
+SESSION_ATTRIBUTE = "factSampler"
+ALL_FACTS_KEY = "*"
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(x):
+    # type: (int) -> int
+    """SplitMix64 step: the next of a sequence of well spread 64-bit
+    values started from x."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def permutation(seed, n):
+    # type: (int, int) -> Tuple[int, int]
+    """Return the (a, b) of the permutation of range(n) picked by seed.
+
+    a is drawn from [2, n) until it is coprime with n, which takes
+    n / phi(n) tries on average (under 6 for any n below 10**9), so
+    nothing is precomputed per n. 1 (plain rotation) is only used for
+    n <= 2.
+    """
+    a = 1
+    if n > 2:
+        x = seed
+        while True:
+            x = _mix(x)
+            a = 2 + x % (n - 2)
+            if gcd(a, n) == 1:
+                break
+    return a, seed % n
+
+
+def permuted_index(seed, cursor, n):
+    # type: (int, int, int) -> int
+    """Return the cursor-th index of the permutation of range(n) picked
+    by seed."""
+    a, b = permutation(seed, n)
+    return (a * cursor + b) % n
+
+
+def encode_state(seed, cursor):
+    # type: (int, int) -> str
+    return "{:x}.{:x}".format(seed, cursor)
+
+
+def decode_state(state):
+    # type: (Any) -> Tuple[Optional[int], int]
+    """Return (seed, cursor), or (None, 0) for missing or malformed
+    state."""
+    try:
+        seed, cursor = state.split(".")
+        return int(seed, 16), int(cursor, 16)
+    except (AttributeError, ValueError):
+        return None, 0
+
+
+class FactSampler(object):
+    """Draw facts from a FactStore without repeats within a session."""
+    def __init__(self, fact_store, attribute=SESSION_ATTRIBUTE):
+        # type: (FactStore, str) -> None
+        self.fact_store = fact_store
+        self.attribute = attribute
+
+    def draw(self, session_attributes, category=None):
+        # type: (Optional[Dict[str, Any]], Optional[str]) -> str
+        """Return the next fact of category for the session.
+
+        Without session attributes (out of session requests) the fact
+        is drawn at random, as before.
+        """
+        facts = self.fact_store.facts(category)  # type: Sequence[str]
+        if session_attributes is None or not facts:
+            return random.choice(facts)
+        n = len(facts)
+        state = session_attributes.get(self.attribute)
+        if not isinstance(state, dict):
+            state = session_attributes[self.attribute] = {}
+        key = category or ALL_FACTS_KEY
+        seed, cursor = decode_state(state.get(key))
+        if seed is None or cursor >= n:
+            seed, cursor = random.getrandbits(32), 0
+        state[key] = encode_state(seed, cursor + 1)
+        return facts[permuted_index(seed, cursor, n)]
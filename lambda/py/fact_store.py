@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Category index over the skill's fact catalogue."""
+from typing import Dict, Optional, Sequence
+
+from fact_catalogue import FactCatalogue, FactRange
+
+ALL_ACCESS = "all_access"
+PACK_SUFFIX = "_pack"
+
+
+class FactStore(object):
+    """Facts grouped by category over a memory-mapped FactCatalogue.
+
+    The index is built the first time a fact or a product mapping is
+    needed, so requests that never read a fact never touch the
+    catalogue file. Every category is a lazy FactRange, so picking a
+    random fact decodes exactly one string. Product reference names map
+    to the category they unlock; ``all_access`` maps to None, meaning
+    every fact.
+    """
+    def __init__(self, catalogue):
+        # type: (FactCatalogue) -> None
+        self.catalogue = catalogue
+        self._all_facts = None  # type: FactRange
+        self._by_category = None  # type: Dict[str, FactRange]
+        self._category_for_product = None  # type: Dict[str, Optional[str]]
+
+    def _build_index(self):
+        # type: () -> None
+        by_category = {
+            category: self.catalogue.view(start, end)
+            for category, (start, end) in self.catalogue.categories.items()
+        }
+        category_for_product = {
+            category + PACK_SUFFIX: category for category in by_category
+        }  # type: Dict[str, Optional[str]]
+        category_for_product[ALL_ACCESS] = None
+
+        self._category_for_product = category_for_product
+        self._all_facts = self.catalogue.view()
+        self._by_category = by_category
+
+    @property
+    def category_for_product(self):
+        # type: () -> Dict[str, Optional[str]]
+        """Mapping of product reference name to the category it
+        unlocks."""
+        if self._by_category is None:
+            self._build_index()
+        return self._category_for_product
+
+    def facts(self, category=None):
+        # type: (Optional[str]) -> Sequence[str]
+        """Return the facts of category, all facts if category is None
+        and an empty tuple for unknown categories."""
+        if self._by_category is None:
+            self._build_index()
+        if category is None:
+            return self._all_facts
+        return self._by_category.get(category, ())
+
+    def product_reference_name(self, category):
+        # type: (str) -> str
+        """Return the reference name of the pack for category."""
+        return category + PACK_SUFFIX
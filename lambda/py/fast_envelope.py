@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Fast-path request envelope deserialization.
+
+DefaultSerializer builds the whole typed RequestEnvelope graph (context,
+System, device, Viewport, ...) before any handler runs, which costs
+more than the rest of a warm turn. For the request types the skill
+serves most, parse_request_envelope reads only the fields the SDK and
+the handlers use into small ``__slots__`` objects:
+
+* the envelope's version, session (id, new, attributes, user) and
+  context.System (user, application, apiEndpoint, apiAccessToken)
+* the request's type, id and locale
+* for IntentRequest the intent name and slots, with value and entity
+  resolutions
+* for Connections.Response the name, status, payload and token
+
+Any other attribute is served by the full model of that node, built with
+the SDK serializer the first time it is read. The objects report the
+model class as their ``__class__``, so isinstance checks such as
+``is_intent_name`` behave as with the full model. They are read-only
+views of the event; don't mutate them.
+"""
+import json
+
+from typing import Any, Dict, Optional
+
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model import (
+    Application, Context, Intent, IntentRequest, LaunchRequest,
+    RequestEnvelope, Session, SessionEndedRequest, Slot, User)
+from ask_sdk_model.interfaces.connections import (
+    ConnectionsResponse, ConnectionsStatus)
+from ask_sdk_model.interfaces.system import SystemState
+from ask_sdk_model.slu.entityresolution import (
+    Resolution, Resolutions, Value, ValueWrapper)
+
+_serializer = DefaultSerializer()
+
+
+class LazyModel(object):
+    """Fields parsed from raw, with the full model built on demand."""
+    __slots__ = ("_raw", "_full")
+    model = object  # type: type
+
+    def __init__(self, raw):
+        # type: (Dict[str, Any]) -> None
+        self._raw = raw
+        self._full = None
+
+    @property
+    def __class__(self):
+        return self.model
+
+    def __getattr__(self, name):
+        # Only called for attributes that weren't parsed
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.full_model(), name)
+
+    def full_model(self):
+        # type: () -> Any
+        """Return the SDK model of this node, deserializing it once."""
+        if self._full is None:
+            self._full = _serializer.deserialize(
+                json.dumps(self._raw), self.model)
+        return self._full
+
+
+def _optional(node_type, raw):
+    return node_type(raw) if raw is not None else None
+
+
+class FastApplication(LazyModel):
+    __slots__ = ("application_id",)
+    model = Application
+
+    def __init__(self, raw):
+        super(FastApplication, self).__init__(raw)
+        self.application_id = raw.get("applicationId")
+
+
+class FastUser(LazyModel):
+    __slots__ = ("user_id",)
+    model = User
+
+    def __init__(self, raw):
+        super(FastUser, self).__init__(raw)
+        self.user_id = raw.get("userId")
+
+
+class FastSession(LazyModel):
+    __slots__ = ("new", "session_id", "user", "attributes", "application")
+    model = Session
+
+    def __init__(self, raw):
+        super(FastSession, self).__init__(raw)
+        self.new = raw.get("new")
+        self.session_id = raw.get("sessionId")
+        self.user = _optional(FastUser, raw.get("user"))
+        self.attributes = raw.get("attributes")
+        self.application = _optional(FastApplication, raw.get("application"))
+
+
+class FastSystemState(LazyModel):
+    __slots__ = ("application", "user", "api_endpoint", "api_access_token")
+    model = SystemState
+
+    def __init__(self, raw):
+        super(FastSystemState, self).__init__(raw)
+        self.application = _optional(FastApplication, raw.get("application"))
+        self.user = _optional(FastUser, raw.get("user"))
+        self.api_endpoint = raw.get("apiEndpoint")
+        self.api_access_token = raw.get("apiAccessToken")
+
+
+class FastContext(LazyModel):
+    __slots__ = ("system",)
+    model = Context
+
+    def __init__(self, raw):
+        super(FastContext, self).__init__(raw)
+        self.system = _optional(FastSystemState, raw.get("System"))
+
+
+class FastValue(LazyModel):
+    __slots__ = ("name", "id")
+    model = Value
+
+    def __init__(self, raw):
+        super(FastValue, self).__init__(raw)
+        self.name = raw.get("name")
+        self.id = raw.get("id")
+
+
+class FastValueWrapper(LazyModel):
+    __slots__ = ("value",)
+    model = ValueWrapper
+
+    def __init__(self, raw):
+        super(FastValueWrapper, self).__init__(raw)
+        self.value = _optional(FastValue, raw.get("value"))
+
+
+class FastResolution(LazyModel):
+    __slots__ = ("authority", "values")
+    model = Resolution
+
+    def __init__(self, raw):
+        super(FastResolution, self).__init__(raw)
+        self.authority = raw.get("authority")
+        values = raw.get("values")
+        self.values = (
+            [FastValueWrapper(value) for value in values]
+            if values is not None else None)
+
+
+class FastResolutions(LazyModel):
+    __slots__ = ("resolutions_per_authority",)
+    model = Resolutions
+
+    def __init__(self, raw):
+        super(FastResolutions, self).__init__(raw)
+        per_authority = raw.get("resolutionsPerAuthority")
+        self.resolutions_per_authority = (
+            [FastResolution(resolution) for resolution in per_authority]
+            if per_authority is not None else None)
+
+
+class FastSlot(LazyModel):
+    __slots__ = ("name", "value", "resolutions")
+    model = Slot
+
+    def __init__(self, raw):
+        super(FastSlot, self).__init__(raw)
+        self.name = raw.get("name")
+        self.value = raw.get("value")
+        self.resolutions = _optional(FastResolutions, raw.get("resolutions"))
+
+
+class FastIntent(LazyModel):
+    __slots__ = ("name", "slots")
+    model = Intent
+
+    def __init__(self, raw):
+        super(FastIntent, self).__init__(raw)
+        self.name = raw.get("name")
+        slots = raw.get("slots")
+        self.slots = (
+            {name: FastSlot(slot) for name, slot in slots.items()}
+            if slots is not None else None)
+
+
+class FastRequest(LazyModel):
+    __slots__ = ("object_type", "request_id", "locale")
+
+    def __init__(self, raw):
+        super(FastRequest, self).__init__(raw)
+        self.object_type = raw.get("type")
+        self.request_id = raw.get("requestId")
+        self.locale = raw.get("locale")
+
+
+class FastLaunchRequest(FastRequest):
+    __slots__ = ()
+    model = LaunchRequest
+
+
+class FastSessionEndedRequest(FastRequest):
+    __slots__ = ()
+    model = SessionEndedRequest
+
+
+class FastIntentRequest(FastRequest):
+    __slots__ = ("intent",)
+    model = IntentRequest
+
+    def __init__(self, raw):
+        super(FastIntentRequest, self).__init__(raw)
+        self.intent = _optional(FastIntent, raw.get("intent"))
+
+
+class FastConnectionsStatus(LazyModel):
+    __slots__ = ("code", "message")
+    model = ConnectionsStatus
+
+    def __init__(self, raw):
+        super(FastConnectionsStatus, self).__init__(raw)
+        self.code = raw.get("code")
+        self.message = raw.get("message")
+
+
+class FastConnectionsResponse(FastRequest):
+    __slots__ = ("name", "status", "payload", "token")
+    model = ConnectionsResponse
+
+    def __init__(self, raw):
+        super(FastConnectionsResponse, self).__init__(raw)
+        self.name = raw.get("name")
+        self.status = _optional(FastConnectionsStatus, raw.get("status"))
+        self.payload = raw.get("payload")
+        self.token = raw.get("token")
+
+
+FAST_REQUEST_TYPES = {
+    "LaunchRequest": FastLaunchRequest,
+    "IntentRequest": FastIntentRequest,
+    "SessionEndedRequest": FastSessionEndedRequest,
+    "Connections.Response": FastConnectionsResponse,
+}
+
+
+class FastRequestEnvelope(LazyModel):
+    __slots__ = ("version", "session", "context", "request")
+    model = RequestEnvelope
+
+    def __init__(self, raw, request):
+        # type: (Dict[str, Any], FastRequest) -> None
+        super(FastRequestEnvelope, self).__init__(raw)
+        self.version = raw.get("version")
+        self.session = _optional(FastSession, raw.get("session"))
+        self.context = _optional(FastContext, raw.get("context"))
+        self.request = request
+
+
+def parse_request_envelope(event):
+    # type: (Dict[str, Any]) -> Optional[FastRequestEnvelope]
+    """Return the fast-path envelope of a Lambda event, or None if its
+    request type has no fast path."""
+    raw_request = event.get("request")
+    if raw_request is None:
+        return None
+    request_type = FAST_REQUEST_TYPES.get(raw_request.get("type"))
+    if request_type is None:
+        return None
+    return FastRequestEnvelope(event, request_type(raw_request))
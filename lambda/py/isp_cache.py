@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Container-local cache for In-skill product responses."""
+import threading
+import time
+
+from collections import OrderedDict
+
+from typing import Callable, Hashable, Optional
+
+from ask_sdk_model.services.monetization import InSkillProductsResponse
+
+FETCHED_AT_ATTRIBUTE = "_fetched_at"
+
+
+def mark_fetched(response, fetched_at):
+    # type: (InSkillProductsResponse, float) -> None
+    """Record on response when (epoch seconds) the monetization service
+    produced it, so copies served from caches and stores keep their
+    real age."""
+    setattr(response, FETCHED_AT_ATTRIBUTE, fetched_at)
+
+
+def fetched_at(response):
+    # type: (InSkillProductsResponse) -> Optional[float]
+    """Return the fetch time recorded by mark_fetched, if any."""
+    return getattr(response, FETCHED_AT_ATTRIBUTE, None)
+
+
+class ProductCache(object):
+    """Per-user cache of InSkillProductsResponse objects.
+
+    Entries are keyed on (user_id, locale), expire ``ttl`` seconds after
+    they were stored (but stay readable through get_stale) and are
+    evicted least-recently-used first once the cache holds
+    ``max_entries`` items. The cache lives at module level,
+    so it survives across invocations on a warm Lambda container.
+    """
+    def __init__(self, ttl=60.0, max_entries=1024, clock=time.monotonic):
+        # type: (float, int, Callable[[], float]) -> None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # type: (Hashable) -> Optional[InSkillProductsResponse]
+        """Return the cached response for key, or None if missing or
+        expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= self._clock():
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def get_stale(self, key):
+        # type: (Hashable) -> Optional[InSkillProductsResponse]
+        """Return the last response stored for key, even if expired.
+
+        Expired entries are kept until they are replaced, invalidated
+        or evicted, so they can stand in while the service is down.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def put(self, key, response):
+        # type: (Hashable, InSkillProductsResponse) -> None
+        """Store response for key, evicting the oldest entries if the
+        cache is full."""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        # type: (Hashable) -> None
+        """Drop the entry for key, if any."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        # type: (str) -> None
+        """Drop the entries for user_id across all locales."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._entries)
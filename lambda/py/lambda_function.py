@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
-import random
+import os
 import logging
+import random
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
 
-from typing import Union, List
+from typing import FrozenSet, Hashable, Union, List, Sequence, Tuple
 
-from ask_sdk.standard import StandardSkillBuilder
 from ask_sdk_core.dispatch_components import (
     AbstractRequestHandler, AbstractExceptionHandler,
     AbstractRequestInterceptor, AbstractResponseInterceptor)
 from ask_sdk_core.handler_input import HandlerInput
+from ask_sdk_core.response_helper import ResponseFactory
 from ask_sdk_core.utils import is_request_type, is_intent_name
 
 from ask_sdk_model.services.monetization import (
@@ -16,178 +21,239 @@ from ask_sdk_model.services.monetization import (
     InSkillProduct)
 from ask_sdk_model.interfaces.monetization.v1 import PurchaseResult
 from ask_sdk_model import Response, IntentRequest
+from ask_sdk_model.ui import Reprompt, SsmlOutputSpeech
+from ask_sdk_model.services import ApiClient
 from ask_sdk_model.interfaces.connections import SendRequestDirective
 
+from dispatch import (
+    FactSkillBuilder, connections_route, intent_route, request_route,
+    request_route_key)
+from entitlement_snapshot import EntitlementSnapshots
+from entitlement_store import build_entitlement_store
+from fact_store import ALL_ACCESS
+from isp_cache import ProductCache, fetched_at, mark_fetched
+from locale_catalogue import Locale, LocaleCatalogue
+from memory_accounting import (
+    MemoryAccounting, MemoryRequestInterceptor, MemoryResponseInterceptor)
+from product_view import ProductView
+from resilience import CircuitBreaker, GuardedCall, ServiceUnavailable
+from response_cache import ResponseCache
+from service_clients import LazyApiClient
+from single_flight import Flight, SingleFlight
+from telemetry import (
+    MetricsRequestInterceptor, MetricsResponseInterceptor, current_turn,
+    log_turn, start_turn)
+from templates import respond
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 # Data for the skill
 
-# Static list of facts across 3 categories that serve as
-# the free and premium content served by the Skill
-all_facts = [
-    {
-        "type": "science",
-        "fact": "There is enough DNA in an average person's body to stretch from the sun to Pluto and back — 17 times."
-    },
-    {
-        "type": "science",
-        "fact": "The average human body carries ten times more bacterial cells than human cells."
-    },
-    {
-        "type": "science",
-        "fact": "It can take a photon 40,000 years to travel from the core of the sun to its surface, but only 8 minutes to travel the rest of the way to Earth."
-    },
-    {
-        "type": "science",
-        "fact": "At over 2000 kilometers long, The Great Barrier Reef is the largest living structure on Earth."
-    },
-    {
-        "type": "science",
-        "fact": "There are 8 times as many atoms in a teaspoonful of water as there are teaspoonfuls of water in the Atlantic ocean."
-    },
-    {
-        "type": "science",
-        "fact": "The average person walks the equivalent of five times around the world in a lifetime."
-    },
-    {
-        "type": "science",
-        "fact": "When Helium is cooled to absolute zero it flows against gravity and will start running up and over the lip of a glass container!"
-    },
-    {
-        "type": "science",
-        "fact": "An individual blood cell takes about 60 seconds to make a complete circuit of the body."
-    },
-    {
-        "type": "science",
-        "fact": "The human eye blinks an average of 4,200,000 times a year."
-    },
-    {
-        "type": "history",
-        "fact": "The Hundred Years War actually lasted 116 years from thirteen thirty seven to fourteen fifty three."
-    },
-    {
-        "type": "history",
-        "fact": "There are ninety two known cases of nuclear bombs lost at sea."
-    },
-    {
-        "type": "history",
-        "fact": "Despite popular belief, Napoleon Bonaparte stood 5 feet 6 inch tall. Average height for men at the time."
-    },
-    {
-        "type": "history",
-        "fact": "Leonardo Da Vinci designed the first helicopter, tank, submarine, parachute and ammunition igniter... Five hundred years ago."
-    },
-    {
-        "type": "history",
-        "fact": "The shortest war on record was fought between Zanzibar and England in eighteen ninety six. Zanzibar surrendered after 38 minutes."
-    },
-    {
-        "type": "history",
-        "fact": "X-rays of the Mona Lisa show that there are 3 different versions under the present one."
-    },
-    {
-        "type": "history",
-        "fact": "At Andrew Jackson's funeral in 1845, his pet parrot had to be removed because it was swearing too much."
-    },
-    {
-        "type": "history",
-        "fact": "English was once a language for “commoners,” while the British elites spoke French."
-    },
-    {
-        "type": "history",
-        "fact": "In ancient Egypt, servants were smeared with honey in order to attract flies away from the pharaoh."
-    },
-    {
-        "type": "history",
-        "fact": "Ronald Reagan was a lifeguard during high school and saved 77 people’s lives."
-    },
-    {
-        "type": "space",
-        "fact": "A year on Mercury is just 88 days long."
-    },
-    {
-        "type": "space",
-        "fact": "Despite being farther from the Sun, Venus experiences higher temperatures than Mercury."
-    },
-    {
-        "type": "space",
-        "fact": "Venus rotates anti-clockwise, possibly because of a collision in the past with an asteroid."
-    },
-    {
-        "type": "space",
-        "fact": "On Mars, the Sun appears about half the size as it does on Earth."
-    },
-    {
-        "type": "space",
-        "fact": "Earth is the only planet not named after a god."
-    },
-    {
-        "type": "space",
-        "fact": "Jupiter has the shortest day of all the planets."
-    },
-    {
-        "type": "space",
-        "fact": "The Milky Way galaxy will collide with the Andromeda Galaxy in about 5 billion years."
-    },
-    {
-        "type": "space",
-        "fact": "The Sun contains 99.86% of the mass in the Solar System."
-    },
-    {
-        "type": "space",
-        "fact": "The Sun is an almost perfect sphere."
-    },
-    {
-        "type": "space",
-        "fact": "A total solar eclipse can happen once every 1 to 2 years. This makes them a rare event."
-    },
-]
-
-skill_name = "Premium Facts Sample"
+# Facts across 3 categories that serve as the free and premium content
+# served by the Skill, with the skill's speech, per locale under
+# data/<locale>/ (see locale_catalogue.py). Each locale is loaded when
+# its first request arrives; facts are drawn without repeats per
+# session, see fact_sampler.py.
+locales = LocaleCatalogue(
+    os.environ.get(
+        "LOCALE_DATA_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")),
+    default_locale=os.environ.get("DEFAULT_LOCALE", "en-US"))
+
+# Fraction of turns logged as a JSON summary line by ResponseLogger
+log_sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+
+# CloudWatch namespace of the per-turn Embedded Metric Format lines;
+# set EMIT_METRICS=false to turn them off.
+metrics_namespace = os.environ.get("METRICS_NAMESPACE", "PremiumFactsSkill")
+emit_metrics = os.environ.get("EMIT_METRICS", "true").lower() != "false"
+
+# Warm containers reuse this cache across invocations, so repeat turns
+# from the same user skip the round trip to the monetization service.
+product_cache = ProductCache(
+    ttl=float(os.environ.get("ISP_CACHE_TTL_SECONDS", "60")),
+    max_entries=int(os.environ.get("ISP_CACHE_MAX_ENTRIES", "1024")))
+
+# Requests whose handlers read the In-skill products; their fetch is
+# started by ProductPrefetchInterceptor before the handler runs.
+PRODUCT_ROUTES = frozenset([
+    request_route("LaunchRequest"),
+    intent_route("ShoppingIntent"),
+    intent_route("ProductDetailIntent"),
+    intent_route("BuyIntent"),
+    intent_route("CancelSubscriptionIntent"),
+    intent_route("AMAZON.HelpIntent"),
+    connections_route("Buy"),
+    connections_route("Cancel"),
+])
+PREFETCH_ATTRIBUTE = "_products_prefetch"
+INVALIDATED_ATTRIBUTE = "_products_invalidated"
+PENDING_WRITES_ATTRIBUTE = "_entitlements_pending_writes"
+FALLBACK_ATTRIBUTE = "_products_fallback"
+
+# Set ISP_PREFETCH_WORKERS=0 to fetch products synchronously in handlers
+prefetch_workers = int(os.environ.get("ISP_PREFETCH_WORKERS", "2"))
+prefetch_executor = ThreadPoolExecutor(max_workers=max(prefetch_workers, 1))
+
+# Optional store shared by all containers, see entitlement_store.py.
+# Writes run on the prefetch executor and are awaited for at most
+# ENTITLEMENT_FLUSH_SECONDS before the response is returned, so they
+# finish before Lambda freezes the container.
+entitlement_store = build_entitlement_store(executor=prefetch_executor)
+entitlement_flush_seconds = float(
+    os.environ.get("ENTITLEMENT_FLUSH_SECONDS", "0.5"))
+
+# Monetization calls are given ISP_TIMEOUT_SECONDS, cut short to leave
+# ISP_DEADLINE_RESERVE_SECONDS of the Lambda's remaining time. A second
+# attempt is started once the first is slower than the recent p95, and
+# after ISP_BREAKER_FAILURES failed calls in a row the service is left
+# alone for ISP_BREAKER_RESET_SECONDS. Meanwhile turns are served the
+# user's last known products, or FREE_TIER_RESPONSE.
+isp_timeout = float(os.environ.get("ISP_TIMEOUT_SECONDS", "1.5"))
+isp_deadline_reserve = float(
+    os.environ.get("ISP_DEADLINE_RESERVE_SECONDS", "0.3"))
+isp_guard = GuardedCall(
+    ThreadPoolExecutor(
+        max_workers=int(os.environ.get("ISP_CALL_WORKERS", "4"))),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("ISP_BREAKER_FAILURES", "5")),
+        reset_timeout=float(
+            os.environ.get("ISP_BREAKER_RESET_SECONDS", "30"))),
+    hedge=os.environ.get("ISP_HEDGE", "true").lower() != "false")
+FREE_TIER_RESPONSE = InSkillProductsResponse(
+    in_skill_products=[], is_truncated=False)
+
+# Entitlement store loads are given ENTITLEMENT_LOAD_TIMEOUT_SECONDS,
+# within the monetization budget of the turn, and after
+# ENTITLEMENT_BREAKER_FAILURES failed loads in a row the store is
+# skipped for ENTITLEMENT_BREAKER_RESET_SECONDS. A slow or failed load
+# falls through to the monetization call.
+entitlement_load_timeout = float(
+    os.environ.get("ENTITLEMENT_LOAD_TIMEOUT_SECONDS", "0.2"))
+entitlement_guard = GuardedCall(
+    ThreadPoolExecutor(
+        max_workers=int(os.environ.get("ENTITLEMENT_LOAD_WORKERS", "2"))),
+    breaker=CircuitBreaker(
+        failure_threshold=int(
+            os.environ.get("ENTITLEMENT_BREAKER_FAILURES", "5")),
+        reset_timeout=float(
+            os.environ.get("ENTITLEMENT_BREAKER_RESET_SECONDS", "30"))),
+    hedge=False)
+
+# Concurrent fetches for the same user and locale, e.g. in a threaded
+# server or a burst of Connections.Response events, share one call and
+# its result or error, see single_flight.py. Callers wait for it no
+# longer than their own budget. Set ISP_SINGLE_FLIGHT=false to give
+# every caller its own call; calls are still tracked, so an accepted
+# purchase keeps those in progress from caching older products.
+isp_flights = SingleFlight(
+    share=os.environ.get("ISP_SINGLE_FLIGHT", "true").lower() != "false")
+
+# The user's entitled products are kept in session attributes as a signed
+# snapshot (see entitlement_snapshot.py), so later turns of the session
+# that only check entitlements skip the monetization call. A Buy, Cancel
+# or Upsell Connections.Response drops it. Set ENTITLEMENT_SNAPSHOT_KEY
+# to one secret for all containers; without it each container signs with
+# its own random key and ignores the snapshots of the others.
+# Set ENTITLEMENT_SNAPSHOTS=false to turn them off.
+use_entitlement_snapshots = os.environ.get(
+    "ENTITLEMENT_SNAPSHOTS", "true").lower() != "false"
+entitlement_snapshots = EntitlementSnapshots(
+    key=(os.environ.get("ENTITLEMENT_SNAPSHOT_KEY", "").encode("utf-8") or
+         os.urandom(32)),
+    max_age=float(
+        os.environ.get("ENTITLEMENT_SNAPSHOT_MAX_AGE_SECONDS", "3600")))
+SNAPSHOT_INVALIDATING_ROUTES = frozenset([
+    connections_route("Buy"),
+    connections_route("Cancel"),
+    connections_route("Upsell"),
+])
+
+# Alexa service calls go through one pooled client per container, see
+# pooled_api_client.py; it is built on the first service call.
+api_pool_size = int(os.environ.get("API_POOL_SIZE", "8"))
+
+def build_api_client():
+    """Return the ApiClient used for Alexa service calls."""
+    # type: () -> ApiClient
+    from pooled_api_client import PooledApiClient
+    return PooledApiClient(pool_size=api_pool_size)
+
+# Responses that are the same for every user (help, fallback, goodbyes)
+# are built and serialized once per container, see response_cache.py;
+# set RESPONSE_CACHE=false to turn it off.
+response_cache = (
+    ResponseCache(max_entries=int(
+        os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "256")))
+    if os.environ.get("RESPONSE_CACHE", "true").lower() != "false"
+    else None)
+
+# Slot values entity resolution didn't match are matched locally
+# against the locale's slot types, see slot_matcher.py; set
+# FUZZY_SLOTS=false to re-prompt instead.
+fuzzy_slots = os.environ.get("FUZZY_SLOTS", "true").lower() != "false"
+SLOT_VALUES_ATTRIBUTE = "_slot_values"
+
+# Run synthetic turns during init, see warm_up(). With the default
+# WARM_UP=auto that happens when Lambda initializes environments ahead
+# of requests (provisioned concurrency and SnapStart); true and false
+# force it on or off.
+warm_up_mode = os.environ.get("WARM_UP", "auto").lower()
+
+# Set MEMORY_ACCOUNTING=true to trace the heap and measure one turn of
+# every MEMORY_SAMPLE_EVERY: bytes it left behind and its peak, per
+# handler, as metrics; growth of the heap on MEMORY_GROWTH_SAMPLES
+# samples in a row is logged as a warning, see memory_accounting.py.
+# Tracing slows every turn down, so leave it off in production.
+memory_accounting = (
+    MemoryAccounting(
+        metrics_namespace,
+        sample_every=int(os.environ.get("MEMORY_SAMPLE_EVERY", "100")),
+        growth_samples=int(os.environ.get("MEMORY_GROWTH_SAMPLES", "5")),
+        min_growth_bytes=int(
+            os.environ.get("MEMORY_MIN_GROWTH_BYTES", "65536")))
+    if os.environ.get("MEMORY_ACCOUNTING", "false").lower() == "true"
+    else None)
+
+# Read hot request types into light objects instead of the full SDK
+# model, see fast_envelope.py; set FAST_ENVELOPES=false to turn it off.
+fast_envelopes = os.environ.get("FAST_ENVELOPES", "true").lower() != "false"
 
 # Utility functions
 
-def get_all_entitled_products(in_skill_product_list):
-    """Get list of in-skill products in ENTITLED state."""
-    # type: (List[InSkillProduct]) -> List[InSkillProduct]
-    entitled_product_list = [
-        l for l in in_skill_product_list if (
-                l.entitled == EntitledState.ENTITLED)]
-    return entitled_product_list
-
-def get_random_from_list(facts):
-    """Return the fact message from randomly chosen list element."""
-    # type: (List) -> str
-    fact_item = random.choice(facts)
-    return fact_item.get("fact")
-
-def get_random_yes_no_question():
+def get_all_entitled_products(in_skill_response):
+    """Get in-skill products in ENTITLED state."""
+    # type: (InSkillProductsResponse) -> Sequence[InSkillProduct]
+    return ProductView.of(in_skill_response).entitled
+
+def get_locale(handler_input):
+    """Return the Locale serving the current request."""
+    # type: (HandlerInput) -> Locale
+    return locales.get(handler_input.request_envelope.request.locale)
+
+def get_random_fact(handler_input, category=None):
+    """Return a fact from category not yet heard in this session."""
+    # type: (HandlerInput, Union[str, None]) -> str
+    if handler_input.request_envelope.session is None:
+        session_attributes = None
+    else:
+        session_attributes = (
+            handler_input.attributes_manager.session_attributes)
+    return get_locale(handler_input).fact_sampler.draw(
+        session_attributes, category)
+
+def get_random_yes_no_question(handler_input):
     """Return random question for YES/NO answering."""
-    # type: () -> str
-    questions = [
-        "Would you like another fact?", "Can I tell you another fact?",
-        "Do you want to hear another fact?"]
-    return random.choice(questions)
-
-def get_random_goodbye():
-    """Return random goodbye message."""
-    # type: () -> str
-    goodbyes = ["OK.  Goodbye!", "Have a great day!", "Come back again soon!"]
-    return random.choice(goodbyes)
-
-def get_speakable_list_of_products(entitled_products_list):
+    # type: (HandlerInput) -> str
+    return get_locale(handler_input).templates[
+        "yes_no_question"].choice().text
+
+def get_speakable_list_of_products(handler_input, entitled_products_list):
     """Return product list in speakable form."""
-    # type: (List[InSkillProduct]) -> str
-    product_names = [item.name for item in entitled_products_list]
-    if len(product_names) > 1:
-        # If more than one, add and 'and' in the end
-        speech = " and ".join(
-            [", ".join(product_names[:-1]), product_names[-1]])
-    else:
-        # If one or none, then return the list content in a string
-        speech = ", ".join(product_names)
-    return speech
+    # type: (HandlerInput, List[InSkillProduct]) -> str
+    return get_locale(handler_input).speakable_list(
+        [item.name for item in entitled_products_list])
 
 def get_resolved_value(request, slot_name):
     """Resolve the slot name from the request using resolutions."""
@@ -195,7 +261,7 @@ def get_resolved_value(request, slot_name):
     try:
         return (request.intent.slots[slot_name].resolutions.
                 resolutions_per_authority[0].values[0].value.name)
-    except (AttributeError, ValueError, KeyError, IndexError):
+    except (AttributeError, ValueError, KeyError, IndexError, TypeError):
         return None
 
 def get_spoken_value(request, slot_name):
@@ -203,26 +269,275 @@ def get_spoken_value(request, slot_name):
     # type: (IntentRequest, str) -> Union[str, None]
     try:
         return request.intent.slots[slot_name].value
-    except (AttributeError, ValueError, KeyError, IndexError):
+    except (AttributeError, ValueError, KeyError, IndexError, TypeError):
         return None
 
+def get_slot_value(handler_input, slot_name):
+    """Resolve the slot using resolutions, or else by matching the
+    spoken value against the slot type locally.
+
+    Resolved once per request; interceptors and the handler share the
+    value.
+    """
+    # type: (HandlerInput, str) -> Union[str, None]
+    request_attributes = handler_input.attributes_manager.request_attributes
+    slot_values = request_attributes.setdefault(SLOT_VALUES_ATTRIBUTE, {})
+    if slot_name not in slot_values:
+        slot_values[slot_name] = resolve_slot_value(handler_input, slot_name)
+    return slot_values[slot_name]
+
+def resolve_slot_value(handler_input, slot_name):
+    # type: (HandlerInput, str) -> Union[str, None]
+    request = handler_input.request_envelope.request
+    value = get_resolved_value(request, slot_name)
+    if value is not None or not fuzzy_slots:
+        return value
+    matcher = get_locale(handler_input).slot_matcher
+    if matcher is None:
+        return None
+    value = matcher.match(slot_name, get_spoken_value(request, slot_name))
+    if value is not None:
+        current_turn(handler_input).slot_matches += 1
+    return value
+
 def is_product(product):
-    """Is the product list not empty."""
-    # type: (List) -> bool
-    return bool(product)
+    """Is there a product."""
+    # type: (Union[InSkillProduct, None]) -> bool
+    return product is not None
 
 def is_entitled(product):
     """Is the product in ENTITLED state."""
-    # type: (List) -> bool
+    # type: (Union[InSkillProduct, None]) -> bool
     return (is_product(product) and
-            product[0].entitled == EntitledState.ENTITLED)
+            product.entitled == EntitledState.ENTITLED)
+
+def get_user_id(handler_input):
+    """Return the user id of the current request."""
+    # type: (HandlerInput) -> str
+    return handler_input.request_envelope.context.system.user.user_id
 
 def in_skill_product_response(handler_input):
-    """Get the In-skill product response from monetization service."""
+    """Get the In-skill product response from monetization service.
+
+    Waits for the fetch started by ProductPrefetchInterceptor, if any,
+    and fetches synchronously otherwise.
+    """
+    # type: (HandlerInput) -> Union[InSkillProductsResponse, Error]
+    request_attributes = handler_input.attributes_manager.request_attributes
+    prefetch = request_attributes.get(PREFETCH_ATTRIBUTE)
+    if prefetch is not None:
+        response = prefetch.result()
+    else:
+        response = fetch_in_skill_products(handler_input)
+    if (isinstance(response, InSkillProductsResponse) and
+            not request_attributes.get(FALLBACK_ATTRIBUTE)):
+        save_entitlement_snapshot(handler_input, response)
+    return response
+
+def fetch_in_skill_products(handler_input):
+    """Fetch the In-skill product response from monetization service.
+
+    Successful responses are cached per user and locale, errors are
+    never cached. Concurrent fetches for the same user and locale share
+    one call. While the service fails or is too slow, the user's last
+    known products or FREE_TIER_RESPONSE are returned instead.
+    """
     # type: (HandlerInput) -> Union[InSkillProductsResponse, Error]
-    locale = handler_input.request_envelope.request.locale
-    ms = handler_input.service_client_factory.get_monetization_service()
-    return ms.get_in_skill_products(locale)
+    turn = current_turn(handler_input)
+    started = time.perf_counter()
+    try:
+        locale = handler_input.request_envelope.request.locale
+        cache_key = (get_user_id(handler_input), locale)
+        cached = product_cache.get(cache_key)
+        if cached is not None:
+            turn.cache_hits += 1
+            return cached
+
+        turn.cache_misses += 1
+        request_envelope = handler_input.request_envelope
+        request_attributes = (
+            handler_input.attributes_manager.request_attributes)
+        if (entitlement_store is not None and
+                not request_attributes.get(INVALIDATED_ATTRIBUTE)):
+            store = entitlement_store
+            try:
+                stored = entitlement_guard.call(
+                    lambda: store.load(request_envelope, locale),
+                    min(entitlement_load_timeout, isp_budget(handler_input)))
+            except ServiceUnavailable as e:
+                logger.warning("Could not load entitlements: %s", e)
+                stored = None
+            if stored is not None:
+                product_cache.put(cache_key, stored)
+                return stored
+
+        ms = handler_input.service_client_factory.get_monetization_service()
+        budget = isp_budget(handler_input)
+
+        def call(flight):
+            # type: (Flight) -> Tuple[InSkillProductsResponse, bool]
+            turn.isp_calls += 1
+            requested_at = time.time()
+            response = isp_guard.call(
+                lambda: ms.get_in_skill_products(locale), budget,
+                is_success=lambda r: isinstance(r, InSkillProductsResponse))
+            mark_fetched(response, requested_at)
+            # Cached before the call stops being shared, so no caller
+            # comes between and fetches again. If a purchase accepted
+            # meanwhile cancelled the flight, its products are stale and
+            # neither cached nor stored.
+            return response, flight.publish(
+                product_cache.put, cache_key, response)
+
+        try:
+            (response, current), shared = isp_flights.call(
+                cache_key, call, budget)
+        except ServiceUnavailable as e:
+            logger.warning("InSkillProducts API unavailable: %s", e)
+            turn.isp_fallbacks += 1
+            request_attributes[FALLBACK_ATTRIBUTE] = True
+            return product_cache.get_stale(cache_key) or FREE_TIER_RESPONSE
+
+        if shared:
+            # The caller that made the call stores it
+            turn.isp_coalesced += 1
+            return response
+        if current and entitlement_store is not None:
+            add_pending_write(handler_input, entitlement_store.save_async(
+                request_envelope, locale, response))
+        return response
+    finally:
+        turn.isp_seconds += time.perf_counter() - started
+
+def isp_budget(handler_input):
+    """Seconds the monetization call may take in this turn."""
+    # type: (HandlerInput) -> float
+    remaining = getattr(
+        handler_input.context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return isp_timeout
+    return min(isp_timeout, remaining() / 1000.0 - isp_deadline_reserve)
+
+def shared_response(key, speech, reprompt=None, should_end_session=None):
+    """Return a response that is the same for every user.
+
+    With the response cache it is built and serialized once per key,
+    which names the handler and the variant of the response.
+    """
+    # type: (Hashable, SsmlOutputSpeech, Reprompt, bool) -> Response
+    def build():
+        # type: () -> Response
+        return respond(
+            ResponseFactory(), speech, reprompt, should_end_session)
+    if response_cache is None:
+        return build()
+    return response_cache.response(key, build)
+
+def store_unavailable(handler_input):
+    """Response for turns needing a product the service didn't return."""
+    # type: (HandlerInput) -> Response
+    templates = get_locale(handler_input).templates
+    return shared_response(
+        ("store_unavailable", templates["store_unavailable"]),
+        templates["store_unavailable"].speech(),
+        templates["what_can_i_help"].reprompt())
+
+def invalidate_on_accepted(handler_input):
+    """Drop the cached products of the user, and cancel their fetch in
+    flight, if the purchase or cancel in this Connections.Response was
+    accepted.
+
+    Runs at most once per request, so products fetched after the
+    invalidation stay cached. The user's records in the entitlement
+    store are invalidated too, and the fetch in an invalidated request
+    skips the store and refreshes it instead.
+    """
+    # type: (HandlerInput) -> None
+    request_attributes = handler_input.attributes_manager.request_attributes
+    if INVALIDATED_ATTRIBUTE in request_attributes:
+        return
+    request = handler_input.request_envelope.request
+    status = getattr(request, "status", None)
+    payload = getattr(request, "payload", None)
+    accepted = (
+        status is not None and status.code == "200" and
+        payload is not None and
+        payload.get("purchaseResult") == PurchaseResult.ACCEPTED.value)
+    request_attributes[INVALIDATED_ATTRIBUTE] = accepted
+    if accepted:
+        user_id = get_user_id(handler_input)
+        # Fetches still in flight predate the purchase. Cancelled first,
+        # so one that cached its products before is dropped with the
+        # cache entries below.
+        isp_flights.cancel_where(lambda key: key[0] == user_id)
+        product_cache.invalidate_user(user_id)
+        if entitlement_store is not None:
+            # Upsell turns don't fetch, so without this the next turn
+            # would load the products from before the purchase
+            add_pending_write(
+                handler_input,
+                entitlement_store.invalidate_async(
+                    handler_input.request_envelope))
+
+def add_pending_write(handler_input, future):
+    """Keep an entitlement store write for EntitlementFlushInterceptor
+    to wait on."""
+    # type: (HandlerInput, Union[Future, None]) -> None
+    if future is not None:
+        handler_input.attributes_manager.request_attributes.setdefault(
+            PENDING_WRITES_ATTRIBUTE, []).append(future)
+
+def entitlement_snapshot(handler_input):
+    """Return the reference names the session's snapshot says are
+    entitled, or None without a valid snapshot."""
+    # type: (HandlerInput) -> Union[FrozenSet[str], None]
+    if (not use_entitlement_snapshots or
+            handler_input.request_envelope.session is None):
+        return None
+    return entitlement_snapshots.load(
+        handler_input.attributes_manager.session_attributes,
+        get_user_id(handler_input),
+        handler_input.request_envelope.request.locale)
+
+def save_entitlement_snapshot(handler_input, in_skill_response):
+    """Keep the entitled products of in_skill_response in the session,
+    dated when the monetization service returned them, not when they
+    were read from a cache."""
+    # type: (HandlerInput, InSkillProductsResponse) -> None
+    if (not use_entitlement_snapshots or
+            handler_input.request_envelope.session is None):
+        return
+    entitlement_snapshots.save(
+        handler_input.attributes_manager.session_attributes,
+        get_user_id(handler_input),
+        handler_input.request_envelope.request.locale,
+        [product.reference_name for product in
+         get_all_entitled_products(in_skill_response)],
+        fetched_at(in_skill_response))
+
+def snapshot_entitles(handler_input, category):
+    """Does the session's snapshot entitle the user to category."""
+    # type: (HandlerInput, str) -> bool
+    entitled = entitlement_snapshot(handler_input)
+    if entitled is None:
+        return False
+    return (ALL_ACCESS in entitled or
+            get_locale(handler_input).fact_store.product_reference_name(
+                category) in entitled)
+
+def needs_products(handler_input):
+    """Will the handler of this request read the In-skill products."""
+    # type: (HandlerInput) -> bool
+    route = request_route_key(handler_input)
+    if route == intent_route("GetCategoryFactIntent"):
+        # Unresolved categories are answered without the product list,
+        # and so are categories the entitlement snapshot unlocks
+        category = get_slot_value(handler_input, "factCategory")
+        return (category is not None and
+                not snapshot_entitles(handler_input, category))
+    if route == intent_route("AMAZON.HelpIntent"):
+        return entitlement_snapshot(handler_input) is None
+    return route in PRODUCT_ROUTES
 
 # Skill Handlers
 
@@ -234,85 +549,88 @@ class LaunchRequestHandler(AbstractRequestHandler):
     to the user.
     User says: Alexa, open <skill_name>.
     """
+    routes = (request_route("LaunchRequest"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_request_type("LaunchRequest")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In LaunchRequestHandler")
+        logger.debug("In LaunchRequestHandler")
+        locale = get_locale(handler_input)
+        templates = locale.templates
 
         in_skill_response = in_skill_product_response(handler_input)
         if isinstance(in_skill_response, InSkillProductsResponse):
-            entitled_prods = get_all_entitled_products(in_skill_response.in_skill_products)
+            entitled_prods = get_all_entitled_products(in_skill_response)
             if entitled_prods:
-                speech = (
-                    "Welcome to {}. You currently own {} products. "
-                    "To hear a random fact, you could say, 'Tell me a fact', "
-                    "or you can ask for a specific category you have "
-                    "purchased, for example, say 'Tell me a science fact'. "
-                    "To know what else you can buy, say, 'What can i buy?'. "
-                    "So, what can I help you with?").format(
-                        skill_name,
-                        get_speakable_list_of_products(entitled_prods))
+                speech = templates["welcome_owned"].speech(
+                    skill_name=locale.skill_name,
+                    products=get_speakable_list_of_products(
+                        handler_input, entitled_prods))
             else:
                 logger.info("No entitled products")
-                speech = (
-                    "Welcome to {}. To hear a random fact you can say "
-                    "'Tell me a fact', or to hear about the premium categories "
-                    "for purchase, say 'What can I buy'. For help, say , "
-                    "'Help me'... So, what can I help you with?"
-                ).format(skill_name)
-            reprompt = "I didn't catch that. What can I help you with?"
+                speech = templates["welcome"].speech(
+                    skill_name=locale.skill_name)
+            reprompt = templates["what_can_i_help"].reprompt()
         else:
-            logger.info("Error calling InSkillProducts API: {}".format(
-                in_skill_response.message))
-            speech = "Something went wrong in loading your purchase history."
-            reprompt = speech
+            logger.info("Error calling InSkillProducts API: %s",
+                        in_skill_response.message)
+            speech = templates["products_error"].speech()
+            reprompt = templates["products_error"].reprompt()
 
-        return handler_input.response_builder.speak(speech).ask(
-            reprompt).response
+        return respond(handler_input.response_builder, speech, reprompt)
 
 class GetFactHandler(AbstractRequestHandler):
     """Handler for returning random fact to the user."""
+    routes = (intent_route("GetFactIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("GetFactIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In GetFactHandler")
+        logger.debug("In GetFactHandler")
 
-        fact_text = get_random_from_list(all_facts)
+        templates = get_locale(handler_input).templates
+        fact_text = get_random_fact(handler_input)
         return handler_input.response_builder.speak(
-            "Here's your random fact: {} {}".format(
-                fact_text, get_random_yes_no_question())).ask(
-            get_random_yes_no_question()).response
+            templates["random_fact"].format(
+                fact=fact_text,
+                question=get_random_yes_no_question(handler_input))).ask(
+            get_random_yes_no_question(handler_input)).response
 
 class YesHandler(AbstractRequestHandler):
     """If the user says Yes, they want another fact."""
+    routes = (intent_route("AMAZON.YesIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("AMAZON.YesIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In YesHandler")
+        logger.debug("In YesHandler")
         return GetFactHandler().handle(handler_input)
 
 
 class NoHandler(AbstractRequestHandler):
     """If the user says No, then the skill should be exited."""
+    routes = (intent_route("AMAZON.NoIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("AMAZON.NoIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In NoHandler")
+        logger.debug("In NoHandler")
 
-        return handler_input.response_builder.speak(
-            get_random_goodbye()).set_should_end_session(True).response
+        goodbye = get_locale(handler_input).templates["goodbye"].choice()
+        return shared_response(
+            ("goodbye", goodbye), goodbye.speech(), should_end_session=True)
 
 class GetCategoryFactHandler(AbstractRequestHandler):
     """Handler for providing category specific facts to the user.
@@ -323,76 +641,82 @@ class GetCategoryFactHandler(AbstractRequestHandler):
     then a custom message to choose valid categories is provided, rather
     than throwing an error.
     """
+    routes = (intent_route("GetCategoryFactIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("GetCategoryFactIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In GetCategoryFactHandler")
+        logger.debug("In GetCategoryFactHandler")
+        locale = get_locale(handler_input)
+        templates = locale.templates
 
-        fact_category = get_resolved_value(
-            handler_input.request_envelope.request, 'factCategory')
-        logger.info("FACT CATEGORY = {}".format(fact_category))
+        fact_category = get_slot_value(handler_input, 'factCategory')
+        logger.debug("FACT CATEGORY = %s", fact_category)
 
         if fact_category is not None:
             # If there was an entity resolution match for this slot value
-            category_facts = [
-                l for l in all_facts if l.get("type") == fact_category]
+            category_facts = locale.fact_store.facts(fact_category)
         else:
             # If there was not an entity resolution match for this slot value
-            category_facts = []
+            category_facts = ()
 
         if not category_facts:
             slot_value = get_spoken_value(
                 handler_input.request_envelope.request, "factCategory")
             if slot_value is not None:
-                speak_prefix = "I heard you say {}.".format(slot_value)
+                speak_prefix = templates["heard_you_say"].format(
+                    value=slot_value)
             else:
                 speak_prefix = ""
-            speech = (
-                "{} I don't have facts for that category.  You can ask for "
-                "science, space or history facts.  Which one would you "
-                "like?".format(speak_prefix))
-            reprompt = (
-                "Which fact category would you like?  I have science, space, "
-                "or history.")
-            return handler_input.response_builder.speak(speech).ask(
-                reprompt).response
+            return respond(
+                handler_input.response_builder,
+                templates["unknown_category"].speech(prefix=speak_prefix),
+                templates["which_category"].reprompt())
+        elif snapshot_entitles(handler_input, fact_category):
+            # Entitled earlier in this session, no product list needed
+            return self.category_fact(handler_input, fact_category)
         else:
             in_skill_response = in_skill_product_response(handler_input)
             if in_skill_response:
-                subscription = [
-                    l for l in in_skill_response.in_skill_products
-                    if l.reference_name == "all_access"]
-                category_product = [
-                    l for l in in_skill_response.in_skill_products
-                    if l.reference_name == "{}_pack".format(fact_category)]
+                products = ProductView.of(in_skill_response)
+                subscription = products.get(ALL_ACCESS)
+                category_product = products.get(
+                    locale.fact_store.product_reference_name(fact_category))
 
                 if is_entitled(subscription) or is_entitled(category_product):
-                    speech = "Here's your {} fact: {} {}".format(
-                        fact_category, get_random_from_list(category_facts),
-                        get_random_yes_no_question())
-                    reprompt = get_random_yes_no_question()
-                    return handler_input.response_builder.speak(speech).ask(
-                        reprompt).response
+                    return self.category_fact(handler_input, fact_category)
+                elif category_product is None:
+                    return store_unavailable(handler_input)
                 else:
-                    upsell_msg = (
-                        "You don't currently own the {} pack. {} "
-                        "Want to learn more?").format(
-                        fact_category, category_product[0].summary)
+                    upsell_msg = templates["upsell"].format(
+                        category=locale.category_name(fact_category),
+                        summary=category_product.summary)
                     return handler_input.response_builder.add_directive(
                         SendRequestDirective(
                             name="Upsell",
                             payload={
                                 "InSkillProduct": {
-                                    "productId": category_product[0].product_id,
+                                    "productId": category_product.product_id,
                                 },
                                 "upsellMessage": upsell_msg,
                             },
                             token="correlationToken")
                     ).response
 
+    def category_fact(self, handler_input, fact_category):
+        # type: (HandlerInput, str) -> Response
+        locale = get_locale(handler_input)
+        speech = locale.templates["category_fact"].format(
+            category=locale.category_name(fact_category),
+            fact=get_random_fact(handler_input, fact_category),
+            question=get_random_yes_no_question(handler_input))
+        reprompt = get_random_yes_no_question(handler_input)
+        return handler_input.response_builder.speak(speech).ask(
+            reprompt).response
+
 
 class ShoppingHandler(AbstractRequestHandler):
     """
@@ -400,37 +724,35 @@ class ShoppingHandler(AbstractRequestHandler):
     discover what products are available for purchase in-skill.
     User says: Alexa, ask Premium facts what can I buy.
     """
+    routes = (intent_route("ShoppingIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("ShoppingIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In ShoppingHandler")
+        logger.debug("In ShoppingHandler")
+
+        templates = get_locale(handler_input).templates
 
         # Inform the user about what products are available for purchase
         in_skill_response = in_skill_product_response(handler_input)
         if in_skill_response:
-            purchasable = [l for l in in_skill_response.in_skill_products
-                           if l.entitled == EntitledState.NOT_ENTITLED and
-                           l.purchasable == PurchasableState.PURCHASABLE]
-
-            if purchasable:
-                speech = ("Products available for purchase at this time are {}.  "
-                          "To learn more about a product, say 'Tell me more "
-                          "about' followed by the product name.  If you are ready "
-                          "to buy say 'Buy' followed by the product name. So what "
-                          "can I help you with?").format(
-                    get_speakable_list_of_products(purchasable))
-            else:
-                speech = ("There are no more products to buy. To hear a "
-                          "random fact, you could say, 'Tell me a fact', or "
-                          "you can ask for a specific category you have "
-                          "purchased, for example, say 'Tell me a science "
-                          "fact'. So what can I help you with?")
-            reprompt = "I didn't catch that. What can I help you with?"
-            return handler_input.response_builder.speak(speech).ask(
-                reprompt).response
+            purchasable = ProductView.of(in_skill_response).purchasable
+
+            reprompt = templates["what_can_i_help"].reprompt()
+            if not purchasable and in_skill_response is FREE_TIER_RESPONSE:
+                # Stands in for the service, the catalogue isn't empty
+                return store_unavailable(handler_input)
+            if not purchasable:
+                return shared_response(
+                    ("ShoppingHandler", templates["nothing_purchasable"]),
+                    templates["nothing_purchasable"].speech(), reprompt)
+            speech = templates["purchasable"].speech(
+                products=get_speakable_list_of_products(
+                    handler_input, purchasable))
+            return respond(handler_input.response_builder, speech, reprompt)
 
 
 class ProductDetailHandler(AbstractRequestHandler):
@@ -440,84 +762,92 @@ class ProductDetailHandler(AbstractRequestHandler):
     corresponding product detail message.
     User says: Alexa, tell me about <category> pack
     """
+    routes = (intent_route("ProductDetailIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("ProductDetailIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In ProductDetailHandler")
+        logger.debug("In ProductDetailHandler")
+        locale = get_locale(handler_input)
+        templates = locale.templates
         in_skill_response = in_skill_product_response(handler_input)
 
         if in_skill_response:
-            product_category = get_resolved_value(
-                handler_input.request_envelope.request, "productCategory")
-            all_access = get_resolved_value(
-                handler_input.request_envelope.request, "allAccess")
+            product_category = get_slot_value(handler_input, "productCategory")
+            all_access = get_slot_value(handler_input, "allAccess")
 
             if all_access is not None:
-                product_category = "all_access"
+                product_category = ALL_ACCESS
 
             # No entity resolution match
             if product_category is None:
-                speech = ("I don't think we have a product by that name.  "
-                          "Can you try again?")
-                reprompt = "I didn't catch that. Can you try again?"
-                return handler_input.response_builder.speak(speech).ask(
-                    reprompt).response
+                return respond(
+                    handler_input.response_builder,
+                    templates["unknown_product"].speech(),
+                    templates["try_again"].reprompt())
             else:
-                if product_category != "all_access":
-                    product_category += "_pack"
+                if product_category != ALL_ACCESS:
+                    product_category = (
+                        locale.fact_store.product_reference_name(
+                            product_category))
 
-                product = [l for l in in_skill_response.in_skill_products
-                           if l.reference_name == product_category]
+                product = ProductView.of(in_skill_response).get(
+                    product_category)
                 if is_product(product):
-                    speech = ("{}.  To buy it, say Buy {}".format(
-                        product[0].summary, product[0].name))
-                    reprompt = (
-                        "I didn't catch that. To buy {}, say Buy {}".format(
-                            product[0].name, product[0].name))
-                else:
-                    speech = ("I don't think we have a product by that name.  "
-                              "Can you try again?")
-                    reprompt = "I didn't catch that. Can you try again?"
+                    speech = templates["product_detail"].format(
+                        summary=product.summary, name=product.name)
+                    reprompt = templates["product_detail_reprompt"].format(
+                        name=product.name)
+                    return handler_input.response_builder.speak(speech).ask(
+                        reprompt).response
+                if in_skill_response is FREE_TIER_RESPONSE:
+                    return store_unavailable(handler_input)
 
-                return handler_input.response_builder.speak(speech).ask(
-                    reprompt).response
+                return respond(
+                    handler_input.response_builder,
+                    templates["unknown_product"].speech(),
+                    templates["try_again"].reprompt())
 
 class BuyHandler(AbstractRequestHandler):
     """Handler for letting users buy the product.
 
     User says: Alexa, buy <category>.
     """
+    routes = (intent_route("BuyIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("BuyIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In BuyHandler")
+        logger.debug("In BuyHandler")
 
         # Inform the user about what products are available for purchase
         in_skill_response = in_skill_product_response(handler_input)
         if in_skill_response:
-            product_category = get_resolved_value(
-                handler_input.request_envelope.request, "productCategory")
+            product_category = get_slot_value(handler_input, "productCategory")
 
             # No entity resolution match
             if product_category is None:
-                product_category = "all_access"
+                product_category = ALL_ACCESS
             else:
-                product_category += "_pack"
+                product_category = get_locale(
+                    handler_input).fact_store.product_reference_name(
+                        product_category)
 
-            product = [l for l in in_skill_response.in_skill_products
-                       if l.reference_name == product_category]
+            product = ProductView.of(in_skill_response).get(product_category)
+            if product is None:
+                return store_unavailable(handler_input)
             return handler_input.response_builder.add_directive(
                 SendRequestDirective(
                     name="Buy",
                     payload={
                         "InSkillProduct": {
-                            "productId": product[0].product_id
+                            "productId": product.product_id
                         }
                     },
                     token="correlationToken")
@@ -529,33 +859,37 @@ class CancelSubscriptionHandler(AbstractRequestHandler):
     from customers and then trigger a cancel request to Alexa
     User says: Alexa, ask premium facts to cancel <product name>
     """
+    routes = (intent_route("CancelSubscriptionIntent"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return is_intent_name("CancelSubscriptionIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In CancelSubscriptionHandler")
+        logger.debug("In CancelSubscriptionHandler")
 
         in_skill_response = in_skill_product_response(handler_input)
         if in_skill_response:
-            product_category = get_resolved_value(
-                handler_input.request_envelope.request, "productCategory")
+            product_category = get_slot_value(handler_input, "productCategory")
 
             # No entity resolution match
             if product_category is None:
-                product_category = "all_access"
+                product_category = ALL_ACCESS
             else:
-                product_category += "_pack"
+                product_category = get_locale(
+                    handler_input).fact_store.product_reference_name(
+                        product_category)
 
-            product = [l for l in in_skill_response.in_skill_products
-                       if l.reference_name == product_category]
+            product = ProductView.of(in_skill_response).get(product_category)
+            if product is None:
+                return store_unavailable(handler_input)
             return handler_input.response_builder.add_directive(
                 SendRequestDirective(
                     name="Cancel",
                     payload={
                         "InSkillProduct": {
-                            "productId": product[0].product_id
+                            "productId": product.product_id
                         }
                     },
                     token="correlationToken")
@@ -563,6 +897,8 @@ class CancelSubscriptionHandler(AbstractRequestHandler):
 
 class BuyResponseHandler(AbstractRequestHandler):
     """This handles the Connections.Response event after a buy occurs."""
+    routes = (connections_route("Buy"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return (is_request_type("Connections.Response")(handler_input) and
@@ -570,65 +906,63 @@ class BuyResponseHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In BuyResponseHandler")
+        logger.debug("In BuyResponseHandler")
+        locale = get_locale(handler_input)
+        templates = locale.templates
+        invalidate_on_accepted(handler_input)
         in_skill_response = in_skill_product_response(handler_input)
         product_id = handler_input.request_envelope.request.payload.get(
             "productId")
 
         if in_skill_response:
-            product = [l for l in in_skill_response.in_skill_products
-                       if l.product_id == product_id]
-            logger.info("Product = {}".format(str(product)))
+            product = ProductView.of(in_skill_response).get_by_id(product_id)
+            logger.debug("Product = %s", product_id)
+            if product is None:
+                return store_unavailable(handler_input)
             if handler_input.request_envelope.request.status.code == "200":
                 speech = None
                 reprompt = None
                 purchase_result = handler_input.request_envelope.request.payload.get(
                     "purchaseResult")
                 if purchase_result == PurchaseResult.ACCEPTED.value:
-                    category_facts = all_facts
-                    if product[0].reference_name != "all_access":
-                        category_facts = [l for l in all_facts if
-                                          l.get("type") ==
-                                          product[0].reference_name.replace(
-                                              "_pack", "")]
-                    speech = ("You have unlocked the {}.  Here is your {} "
-                              "fact: {}  {}").format(
-                        product[0].name,
-                        product[0].reference_name.replace(
-                            "_pack", "").replace("all_access", ""),
-                        get_random_from_list(category_facts),
-                        get_random_yes_no_question())
-                    reprompt = get_random_yes_no_question()
+                    category = locale.fact_store.category_for_product.get(
+                        product.reference_name)
+                    speech = templates["purchase_accepted"].format(
+                        product=product.name,
+                        category=locale.category_name(category),
+                        fact=get_random_fact(handler_input, category),
+                        question=get_random_yes_no_question(handler_input))
+                    reprompt = get_random_yes_no_question(handler_input)
                 elif purchase_result in (
                         PurchaseResult.DECLINED.value,
                         PurchaseResult.ERROR.value,
                         PurchaseResult.NOT_ENTITLED.value):
-                    speech = ("Thanks for your interest in {}.  "
-                              "Would you like another random fact?".format(
-                        product[0].name))
-                    reprompt = "Would you like another random fact?"
+                    speech = templates["purchase_declined"].format(
+                        product=product.name)
+                    reprompt = templates["another_fact"].text
                 elif purchase_result == PurchaseResult.ALREADY_PURCHASED.value:
                     logger.info("Already purchased product")
-                    speech = " Do you want to hear a fact?"
-                    reprompt = "What can I help you with?"
+                    speech = templates["already_purchased"].text
+                    reprompt = templates["help_question"].text
                 else:
                     # Invalid purchase result value
-                    logger.info("Purchase result: {}".format(purchase_result))
+                    logger.info("Purchase result: %s", purchase_result)
                     return FallbackIntentHandler().handle(handler_input)
 
                 return handler_input.response_builder.speak(speech).ask(
                     reprompt).response
             else:
-                logger.log("Connections.Response indicated failure. "
-                           "Error: {}".format(
-                    handler_input.request_envelope.request.status.message))
+                logger.error(
+                    "Connections.Response indicated failure. Error: %s",
+                    handler_input.request_envelope.request.status.message)
 
                 return handler_input.response_builder.speak(
-                    "There was an error handling your purchase request. "
-                    "Please try again or contact us for help").response
+                    templates["purchase_error"].text).response
 
 class CancelResponseHandler(AbstractRequestHandler):
     """This handles the Connections.Response event after a cancel occurs."""
+    routes = (connections_route("Cancel"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return (is_request_type("Connections.Response")(handler_input) and
@@ -636,50 +970,52 @@ class CancelResponseHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In CancelResponseHandler")
+        logger.debug("In CancelResponseHandler")
+        templates = get_locale(handler_input).templates
+        invalidate_on_accepted(handler_input)
         in_skill_response = in_skill_product_response(handler_input)
         product_id = handler_input.request_envelope.request.payload.get(
             "productId")
 
         if in_skill_response:
-            product = [l for l in in_skill_response.in_skill_products
-                       if l.product_id == product_id]
-            logger.info("Product = {}".format(str(product)))
+            product = ProductView.of(in_skill_response).get_by_id(product_id)
+            logger.debug("Product = %s", product_id)
+            if product is None:
+                return store_unavailable(handler_input)
             if handler_input.request_envelope.request.status.code == "200":
                 speech = None
                 reprompt = None
                 purchase_result = handler_input.request_envelope.request.payload.get(
                         "purchaseResult")
-                purchasable = product[0].purchasable
+                purchasable = product.purchasable
                 if purchase_result == PurchaseResult.ACCEPTED.value:
-                    speech = ("You have successfully cancelled your "
-                              "subscription. {}".format(
-                        get_random_yes_no_question()))
-                    reprompt = get_random_yes_no_question()
+                    speech = templates["cancel_accepted"].format(
+                        question=get_random_yes_no_question(handler_input))
+                    reprompt = get_random_yes_no_question(handler_input)
 
                 if purchase_result == PurchaseResult.DECLINED.value:
                     if purchasable == PurchasableState.PURCHASABLE:
-                        speech = ("You don't currently have a "
-                              "subscription. {}".format(
-                            get_random_yes_no_question()))
+                        speech = templates["no_subscription"].format(
+                            question=get_random_yes_no_question(
+                                handler_input))
                     else:
-                        speech = get_random_yes_no_question()
-                    reprompt = get_random_yes_no_question()
+                        speech = get_random_yes_no_question(handler_input)
+                    reprompt = get_random_yes_no_question(handler_input)
 
                 return handler_input.response_builder.speak(speech).ask(
                     reprompt).response
             else:
-                logger.log("Connections.Response indicated failure. "
-                           "Error: {}".format(
-                    handler_input.request_envelope.request.status.message))
+                logger.error(
+                    "Connections.Response indicated failure. Error: %s",
+                    handler_input.request_envelope.request.status.message)
 
                 return handler_input.response_builder.speak(
-                        "There was an error handling your cancellation "
-                        "request. Please try again or contact us for "
-                        "help").response
+                    templates["cancel_error"].text).response
 
 class UpsellResponseHandler(AbstractRequestHandler):
     """This handles the Connections.Response event after an upsell occurs."""
+    routes = (connections_route("Upsell"),)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return (is_request_type("Connections.Response")(handler_input) and
@@ -687,51 +1023,56 @@ class UpsellResponseHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In UpsellResponseHandler")
+        logger.debug("In UpsellResponseHandler")
+        templates = get_locale(handler_input).templates
+        invalidate_on_accepted(handler_input)
 
         if handler_input.request_envelope.request.status.code == "200":
             if handler_input.request_envelope.request.payload.get(
                     "purchaseResult") == PurchaseResult.DECLINED.value:
-                speech = ("Ok. Here's a random fact: {} {}".format(
-                    get_random_from_list(all_facts),
-                    get_random_yes_no_question()))
-                reprompt = get_random_yes_no_question()
+                speech = templates["upsell_declined"].format(
+                    fact=get_random_fact(handler_input),
+                    question=get_random_yes_no_question(handler_input))
+                reprompt = get_random_yes_no_question(handler_input)
                 return handler_input.response_builder.speak(speech).ask(
                     reprompt).response
         else:
-            logger.log("Connections.Response indicated failure. "
-                       "Error: {}".format(
-                handler_input.request_envelope.request.status.message))
+            logger.error(
+                "Connections.Response indicated failure. Error: %s",
+                handler_input.request_envelope.request.status.message)
             return handler_input.response_builder.speak(
-                "There was an error handling your Upsell request. "
-                "Please try again or contact us for help.").response
+                templates["upsell_error"].text).response
 
 class HelpIntentHandler(AbstractRequestHandler):
     """Handler for help message to users."""
+    routes = (intent_route("AMAZON.HelpIntent"),)
+
     def can_handle(self, handler_input):
         return is_intent_name("AMAZON.HelpIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In HelpIntentHandler")
-        in_skill_response = in_skill_product_response(handler_input)
-
-        if isinstance(in_skill_response, InSkillProductsResponse):
-            speech = (
-                "To hear a random fact you can say "
-                "'Tell me a fact', or to hear about the premium categories "
-                "for purchase, say 'What can I buy'. For help, say , "
-                "'Help me'... So, what can I help you with?"
-            )
-            reprompt = "I didn't catch that. What can I help you with?"
+        logger.debug("In HelpIntentHandler")
+        templates = get_locale(handler_input).templates
+        if entitlement_snapshot(handler_input) is None:
+            in_skill_response = in_skill_product_response(handler_input)
         else:
-            logger.info("Error calling InSkillProducts API: {}".format(
-                in_skill_response.message))
-            speech = "Something went wrong in loading your purchase history."
-            reprompt = speech
+            # Products were loaded earlier in this session
+            in_skill_response = None
 
-        return handler_input.response_builder.speak(speech).ask(
-            reprompt).response
+        if (in_skill_response is None or
+                isinstance(in_skill_response, InSkillProductsResponse)):
+            return shared_response(
+                ("HelpIntentHandler", templates["help"]),
+                templates["help"].speech(),
+                templates["what_can_i_help"].reprompt())
+
+        logger.info("Error calling InSkillProducts API: %s",
+                    in_skill_response.message)
+        return respond(
+            handler_input.response_builder,
+            templates["products_error"].speech(),
+            templates["products_error"].reprompt())
 
 
 class FallbackIntentHandler(AbstractRequestHandler):
@@ -742,28 +1083,27 @@ class FallbackIntentHandler(AbstractRequestHandler):
     locale, so it can be safely deployed for any locale. More info
     on the fallback intent can be found here: https://developer.amazon.com/docs/custom-skills/standard-built-in-intents.html#fallback
     """
+    routes = (intent_route("AMAZON.FallbackIntent"),)
+
     def can_handle(self, handler_input):
         return is_intent_name("AMAZON.FallbackIntent")(handler_input)
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In FallbackIntentHandler")
-        speech = (
-                "Sorry. I cannot help with that. I can help you with "
-                "some facts. "
-                "To hear a random fact you can say "
-                "'Tell me a fact', or to hear about the premium categories "
-                "for purchase, say 'What can I buy'. For help, say , "
-                "'Help me'... So, what can I help you with?"
-            )
-        reprompt = "I didn't catch that. What can I help you with?"
-
-        return handler_input.response_builder.speak(speech).ask(
-            reprompt).response
+        logger.debug("In FallbackIntentHandler")
+        templates = get_locale(handler_input).templates
+        return shared_response(
+            ("FallbackIntentHandler", templates["fallback"]),
+            templates["fallback"].speech(),
+            templates["what_can_i_help"].reprompt())
 
 
 class SessionEndedHandler(AbstractRequestHandler):
     """Handler for session end request, stop or cancel intents."""
+    routes = (request_route("SessionEndedRequest"),
+              intent_route("AMAZON.StopIntent"),
+              intent_route("AMAZON.CancelIntent"))
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return (is_request_type("SessionEndedRequest")(handler_input) or
@@ -772,9 +1112,10 @@ class SessionEndedHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In SessionEndedHandler")
-        return handler_input.response_builder.speak(
-            get_random_goodbye()).set_should_end_session(True).response
+        logger.debug("In SessionEndedHandler")
+        goodbye = get_locale(handler_input).templates["goodbye"].choice()
+        return shared_response(
+            ("goodbye", goodbye), goodbye.speech(), should_end_session=True)
 
 # Skill Exception Handler
 class CatchAllExceptionHandler(AbstractExceptionHandler):
@@ -787,27 +1128,84 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
         # type: (HandlerInput, Exception) -> Response
         logger.error(exception, exc_info=True)
 
-        speech = "Sorry, I can't understand the command. Please try again!!"
+        speech = get_locale(handler_input).templates["not_understood"].text
         handler_input.response_builder.speak(speech).ask(speech)
 
         return handler_input.response_builder.response
 
+# In-skill product prefetch
+class ProductPrefetchInterceptor(AbstractRequestInterceptor):
+    """Start fetching the In-skill products before the handler runs.
+
+    The fetch runs on prefetch_executor while the handler resolves
+    slots and picks facts; in_skill_product_response then waits on it.
+    Cache hits are left to the handler, since they don't wait on the
+    network.
+    """
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        if not needs_products(handler_input):
+            return
+        invalidate_on_accepted(handler_input)
+        locale = handler_input.request_envelope.request.locale
+        if product_cache.get((get_user_id(handler_input), locale)):
+            return
+        handler_input.attributes_manager.request_attributes[
+            PREFETCH_ATTRIBUTE] = prefetch_executor.submit(
+                fetch_in_skill_products, handler_input)
+
+class EntitlementSnapshotInterceptor(AbstractRequestInterceptor):
+    """Drop the session's entitlement snapshot on a Buy, Cancel or
+    Upsell Connections.Response, and the user's cached products if the
+    purchase or cancel was accepted."""
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        route = request_route_key(handler_input)
+        if route not in SNAPSHOT_INVALIDATING_ROUTES:
+            return
+        invalidate_on_accepted(handler_input)
+        if handler_input.request_envelope.session is not None:
+            entitlement_snapshots.invalidate(
+                handler_input.attributes_manager.session_attributes)
+
+class EntitlementFlushInterceptor(AbstractResponseInterceptor):
+    """Wait for the entitlement store writes started in this turn."""
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        pending = handler_input.attributes_manager.request_attributes.get(
+            PENDING_WRITES_ATTRIBUTE)
+        if not pending:
+            return
+        if wait_futures(pending, timeout=entitlement_flush_seconds).not_done:
+            logger.warning("Entitlement store write still pending")
+
 # Request and Response Loggers
 class RequestLogger(AbstractRequestInterceptor):
-    """Log the request envelope."""
+    """Start the turn and log the request envelope at DEBUG level.
+
+    A LOG_SAMPLE_RATE fraction of turns is sampled for the turn summary
+    logged by ResponseLogger.
+    """
     def process(self, handler_input):
         # type: (HandlerInput) -> None
-        logger.info("Request Envelope: {}".format(
-            handler_input.request_envelope))
+        start_turn(handler_input, sample_rate=log_sample_rate)
+        logger.debug("Request Envelope: %s", handler_input.request_envelope)
 
 class ResponseLogger(AbstractResponseInterceptor):
-    """Log the response envelope."""
+    """Log the turn summary as one JSON line, and the response at DEBUG
+    level."""
     def process(self, handler_input, response):
         # type: (HandlerInput, Response) -> None
-        logger.info("Response: {}".format(response))
+        log_turn(handler_input, current_turn(handler_input))
+        logger.debug("Response: %s", response)
 
 
-sb = StandardSkillBuilder()
+# The skill keeps no persistent attributes, so the core builder is enough;
+# StandardSkillBuilder would also import boto3 and the DynamoDB adapter.
+# FactSkillBuilder is a CustomSkillBuilder recording the handler per turn.
+sb = FactSkillBuilder(api_client=LazyApiClient(build_api_client),
+                      fast_envelopes=fast_envelopes,
+                      response_cache=response_cache)
 
 sb.add_request_handler(LaunchRequestHandler())
 sb.add_request_handler(GetFactHandler())
@@ -828,5 +1226,75 @@ sb.add_request_handler(SessionEndedHandler())
 sb.add_exception_handler(CatchAllExceptionHandler())
 sb.add_global_request_interceptor(RequestLogger())
 sb.add_global_response_interceptor(ResponseLogger())
+if memory_accounting is not None:
+    sb.add_global_request_interceptor(
+        MemoryRequestInterceptor(memory_accounting))
+    sb.add_global_response_interceptor(
+        MemoryResponseInterceptor(memory_accounting))
+if use_entitlement_snapshots:
+    sb.add_global_request_interceptor(EntitlementSnapshotInterceptor())
+if prefetch_workers > 0:
+    sb.add_global_request_interceptor(ProductPrefetchInterceptor())
+if entitlement_store is not None:
+    sb.add_global_response_interceptor(EntitlementFlushInterceptor())
+if emit_metrics:
+    sb.add_global_request_interceptor(MetricsRequestInterceptor())
+    sb.add_global_response_interceptor(
+        MetricsResponseInterceptor(metrics_namespace))
 
 lambda_handler = sb.lambda_handler()
+
+
+def warm_up():
+    """Run synthetic turns through the skill and return the seconds
+    they took.
+
+    The turns, see warmup.py, use their own product cache and circuit
+    breaker, no entitlement store and a stub monetization client, so no
+    user state is left behind. The real api client is built (it only
+    connects on its first call) so the first request doesn't import it.
+    """
+    # type: () -> float
+    global product_cache, entitlement_store, isp_guard
+    from warmup import WarmupApiClient, prime, synthetic_envelopes
+
+    locale = locales.get(locales.default_locale)
+    fact_store = locale.fact_store
+    categories = sorted(
+        category for category in fact_store.category_for_product.values()
+        if category is not None)
+    saved = product_cache, entitlement_store, isp_guard, sb.api_client
+    try:
+        product_cache = ProductCache(ttl=60, max_entries=16)
+        entitlement_store = None
+        isp_guard = GuardedCall(isp_guard.executor, hedge=False)
+        sb.api_client = WarmupApiClient(
+            fact_store.category_for_product,
+            entitled=[fact_store.product_reference_name(categories[0])])
+        seconds = prime(
+            sb.lambda_handler(),
+            synthetic_envelopes(locale.name, categories[0], categories[-1]))
+    finally:
+        product_cache, entitlement_store, isp_guard, sb.api_client = saved
+    if isinstance(sb.api_client, LazyApiClient):
+        # Imports and builds the client the first request would build
+        sb.api_client.delegate
+    return seconds
+
+if (warm_up_mode == "true" or (
+        warm_up_mode == "auto" and
+        os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") in (
+            "provisioned-concurrency", "snap-start"))):
+    logger.info("Warm-up took %.1f ms", warm_up() * 1000)
+
+if memory_accounting is not None:
+    # After warm-up, so init's allocations aren't traced
+    memory_accounting.start()
+
+try:
+    from snapshot_restore_py import register_after_restore
+except ImportError:
+    pass
+else:
+    # Environments restored from one snapshot share its random state
+    register_after_restore(random.seed)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Facts, speech and product phrases partitioned by locale.
+
+Every locale the skill speaks has its own directory under the data
+directory::
+
+    data/en-US/facts.bin     fact catalogue, see fact_catalogue.py
+    data/en-US/speech.json   skill name, speech templates, spoken
+                             category names and list separators
+    data/en-US/slots.json    slot types for fuzzy matching, optional;
+                             see slot_matcher.py
+
+A locale is loaded the first time a request in it arrives: its
+catalogue is mapped, its category index built on first read and its
+templates compiled. A container only holds the locales it has served,
+so adding markets doesn't grow the cold start. Requests in a locale
+without a directory are served the first locale of the same language
+(en-GB from en-US), and the default locale otherwise.
+"""
+import io
+import json
+import os
+import threading
+
+from typing import Dict, List, Optional, Sequence
+
+from fact_catalogue import FactCatalogue
+from fact_sampler import FactSampler
+from fact_store import FactStore
+from slot_matcher import SlotMatcher
+from templates import TemplateRegistry
+
+FACTS_FILE = "facts.bin"
+SPEECH_FILE = "speech.json"
+SLOTS_FILE = "slots.json"
+
+
+class Locale(object):
+    """Fact store, sampler, compiled speech and phrases of one locale."""
+    def __init__(self, name, directory):
+        # type: (str, str) -> None
+        self.name = name
+        self.directory = directory
+        self.fact_store = FactStore(
+            FactCatalogue(os.path.join(directory, FACTS_FILE)))
+        self.fact_sampler = FactSampler(self.fact_store)
+        with io.open(os.path.join(directory, SPEECH_FILE),
+                     encoding="utf-8") as f:
+            speech = json.load(f)
+        self.skill_name = speech["skill_name"]
+        self.templates = TemplateRegistry(speech["templates"])
+        self._category_names = speech.get(
+            "categories", {})  # type: Dict[str, str]
+        self._list_separator = speech.get("list_separator", ", ")
+        self._list_last_separator = speech.get(
+            "list_last_separator", " and ")
+        self._slot_matcher = None  # type: SlotMatcher
+        self._slot_matcher_loaded = False
+
+    @property
+    def slot_matcher(self):
+        # type: () -> Optional[SlotMatcher]
+        """Fuzzy matcher of the locale's slot values, built on first
+        use; None if the locale has no slots.json."""
+        if not self._slot_matcher_loaded:
+            path = os.path.join(self.directory, SLOTS_FILE)
+            if os.path.isfile(path):
+                self._slot_matcher = SlotMatcher.load(path)
+            self._slot_matcher_loaded = True
+        return self._slot_matcher
+
+    def category_name(self, category):
+        # type: (Optional[str]) -> str
+        """Return the spoken name of a fact category."""
+        if category is None:
+            return ""
+        return self._category_names.get(category, category)
+
+    def speakable_list(self, names):
+        # type: (Sequence[str]) -> str
+        """Join names as spoken: "a, b and c"."""
+        if len(names) > 1:
+            return self._list_last_separator.join(
+                [self._list_separator.join(names[:-1]), names[-1]])
+        return self._list_separator.join(names)
+
+
+class LocaleCatalogue(object):
+    """Locales under root, each loaded on first request."""
+    def __init__(self, root, default_locale="en-US"):
+        # type: (str, str) -> None
+        self.root = root
+        self.default_locale = default_locale
+        self._lock = threading.Lock()
+        self._available = None  # type: List[str]
+        self._loaded = {}  # type: Dict[str, Locale]
+        self._by_request_locale = {}  # type: Dict[Optional[str], Locale]
+
+    @property
+    def available(self):
+        # type: () -> List[str]
+        """Names of the locales with a directory under root."""
+        if self._available is None:
+            self._available = sorted(
+                name for name in os.listdir(self.root)
+                if os.path.isfile(os.path.join(self.root, name, SPEECH_FILE)))
+        return self._available
+
+    @property
+    def loaded(self):
+        # type: () -> List[str]
+        """Names of the locales loaded in this container."""
+        return sorted(self._loaded)
+
+    def resolve(self, locale):
+        # type: (Optional[str]) -> str
+        """Return the name of the locale serving requests in locale."""
+        available = self.available
+        if locale in available:
+            return locale
+        if locale:
+            language = locale.split("-")[0].lower() + "-"
+            for name in available:
+                if name.lower().startswith(language):
+                    return name
+        return self.default_locale
+
+    def get(self, locale):
+        # type: (Optional[str]) -> Locale
+        """Return the Locale serving requests in locale, loading it on
+        first use."""
+        served = self._by_request_locale.get(locale)
+        if served is not None:
+            return served
+        with self._lock:
+            name = self.resolve(locale)
+            served = self._loaded.get(name)
+            if served is None:
+                served = Locale(name, os.path.join(self.root, name))
+                self._loaded[name] = served
+            self._by_request_locale[locale] = served
+            return served
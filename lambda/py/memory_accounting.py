@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Memory accounting of warm containers with tracemalloc.
+
+A warm container serves requests for hours, so module-level state that
+grows a little on every turn ends in an out-of-memory kill long after
+the change that caused it. MemoryAccounting traces the Python heap and
+every sample_every requests measures one turn:
+
+* net bytes: the traced heap at the start of the next request minus
+  the traced heap at the start of the sampled turn, i.e. what the turn
+  left behind once its request and response were dropped, attributed
+  to the handler class that served it
+* peak bytes: the traced heap's peak during the turn over its start,
+  the turn's working set
+
+Each measurement is written as one Embedded Metric Format line with the
+handler class as dimension, and the running mean per handler is kept in
+MemoryAccounting.handlers.
+
+The traced heap is also recorded at every sample. When it has grown on
+growth_samples samples in a row, by min_growth_bytes in total, a
+warning lists the source lines that grew the most since the run of
+growth began.
+
+Tracing slows every allocation down, and a snapshot of the heap costs
+milliseconds, so this is an instrumentation mode for test and canary
+deployments rather than something to leave on.
+"""
+import json
+import logging
+import time
+import tracemalloc
+
+from typing import Any, Callable, Dict, List, Optional
+
+from ask_sdk_core.dispatch_components import (
+    AbstractRequestInterceptor, AbstractResponseInterceptor)
+from ask_sdk_core.handler_input import HandlerInput
+from ask_sdk_model import Response
+
+from telemetry import _write_stdout, current_turn
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Frames kept per traced allocation; one is enough to name the line
+TRACE_FRAMES = 1
+# tracemalloc's own bookkeeping isn't the skill's memory
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+)
+
+
+class HandlerMemory(object):
+    """Net bytes left behind by the sampled turns of one handler."""
+    __slots__ = ("samples", "net_bytes", "peak_bytes")
+
+    def __init__(self):
+        # type: () -> None
+        self.samples = 0
+        self.net_bytes = 0
+        self.peak_bytes = 0
+
+    @property
+    def mean_net_bytes(self):
+        # type: () -> float
+        return float(self.net_bytes) / self.samples if self.samples else 0.0
+
+
+class _Sample(object):
+    """A sampled turn waiting for the next request to measure it."""
+    __slots__ = ("handler", "traced_bytes", "peak_bytes")
+
+    def __init__(self, traced_bytes):
+        # type: (int) -> None
+        self.handler = None  # type: Optional[str]
+        self.traced_bytes = traced_bytes
+        self.peak_bytes = 0
+
+
+class MemoryAccounting(object):
+    """Sampled per-handler memory accounting and growth detection.
+
+    :param namespace: CloudWatch namespace of the metric lines
+    :param sample_every: measure one turn of every sample_every
+    :param growth_samples: samples in a row the traced heap must grow
+        on before it is reported
+    :param min_growth_bytes: growth over those samples below which it
+        isn't reported
+    :param top_lines: source lines listed in a growth report
+    """
+    def __init__(self, namespace, sample_every=100, growth_samples=5,
+                 min_growth_bytes=64 * 1024, top_lines=10,
+                 emit=_write_stdout, clock=time.time):
+        # type: (str, int, int, int, int, Callable[[str], None], Callable[[], float]) -> None
+        self.namespace = namespace
+        self.sample_every = max(sample_every, 1)
+        self.growth_samples = max(growth_samples, 2)
+        self.min_growth_bytes = min_growth_bytes
+        self.top_lines = top_lines
+        self.emit = emit
+        self.clock = clock
+        self.requests = 0
+        self.handlers = {}  # type: Dict[str, HandlerMemory]
+        self._pending = None  # type: Optional[_Sample]
+        self._last_traced = None  # type: Optional[int]
+        self._run_start = None  # type: Optional[tracemalloc.Snapshot]
+        self._run_start_traced = 0
+        self._run_length = 0
+
+    def start(self):
+        # type: () -> None
+        """Start tracing, unless something else already did."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+    def request_started(self):
+        # type: () -> None
+        """Measure the pending sample, and start one on every
+        sample_every-th request."""
+        if not tracemalloc.is_tracing():
+            return
+        traced = tracemalloc.get_traced_memory()[0]
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self._record(pending, traced)
+        self.requests += 1
+        if self.requests % self.sample_every:
+            return
+        self._check_growth(traced)
+        self._pending = _Sample(tracemalloc.get_traced_memory()[0])
+        reset_peak = getattr(tracemalloc, "reset_peak", None)
+        if reset_peak is not None:
+            reset_peak()
+
+    def response_ready(self, handler):
+        # type: (Optional[str]) -> None
+        """Attribute the pending sample to the handler of its turn."""
+        pending = self._pending
+        if pending is None or pending.handler is not None:
+            return
+        pending.handler = handler or "None"
+        pending.peak_bytes = max(
+            tracemalloc.get_traced_memory()[1] - pending.traced_bytes, 0)
+
+    def _record(self, sample, traced):
+        # type: (_Sample, int) -> None
+        if sample.handler is None:
+            # The turn raised before any response interceptor ran
+            return
+        net = traced - sample.traced_bytes
+        memory = self.handlers.get(sample.handler)
+        if memory is None:
+            memory = self.handlers[sample.handler] = HandlerMemory()
+        memory.samples += 1
+        memory.net_bytes += net
+        memory.peak_bytes = max(memory.peak_bytes, sample.peak_bytes)
+        self.emit(json.dumps(
+            self.metrics_document(sample.handler, net, sample.peak_bytes,
+                                  traced),
+            separators=(",", ":")))
+
+    def _check_growth(self, traced):
+        # type: (int) -> None
+        last, self._last_traced = self._last_traced, traced
+        if last is None or traced <= last:
+            # Drop the old snapshot first: it is traced, and would be
+            # counted in the new one and held alongside it
+            self._run_start = None
+            self._run_start = tracemalloc.take_snapshot()
+            # The snapshot is traced too; measure growth from after it
+            self._run_start_traced = self._last_traced = (
+                tracemalloc.get_traced_memory()[0])
+            self._run_length = 1
+            return
+        self._run_length += 1
+        if (self._run_length % self.growth_samples or
+                traced - self._run_start_traced < self.min_growth_bytes):
+            return
+        # Filtering and comparing walk every trace in Python, so they
+        # are left to the rare report
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        top = snapshot.compare_to(
+            self._run_start.filter_traces(_IGNORED),
+            "lineno")[:self.top_lines]
+        logger.warning(
+            "Traced heap grew on %d samples in a row, %d to %d bytes "
+            "over %d requests:\n%s",
+            self._run_length, self._run_start_traced, traced,
+            (self._run_length - 1) * self.sample_every,
+            "\n".join(str(stat) for stat in top))
+
+    def report(self):
+        # type: () -> List[Dict[str, Any]]
+        """Return the per-handler totals, largest mean first."""
+        return [{
+            "handler": handler,
+            "samples": memory.samples,
+            "meanNetBytes": round(memory.mean_net_bytes, 1),
+            "maxPeakBytes": memory.peak_bytes,
+        } for handler, memory in sorted(
+            self.handlers.items(), key=lambda item: -item[1].mean_net_bytes)]
+
+    def metrics_document(self, handler, net_bytes, peak_bytes, traced_bytes):
+        # type: (str, int, int, int) -> Dict[str, Any]
+        """Return one measurement in CloudWatch Embedded Metric Format."""
+        return {
+            "_aws": {
+                "Timestamp": int(self.clock() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [["Handler"]],
+                    "Metrics": [
+                        {"Name": "NetAllocatedBytes", "Unit": "Bytes"},
+                        {"Name": "PeakAllocatedBytes", "Unit": "Bytes"},
+                        {"Name": "TracedHeapBytes", "Unit": "Bytes"},
+                    ],
+                }],
+            },
+            "Handler": handler,
+            "NetAllocatedBytes": net_bytes,
+            "PeakAllocatedBytes": peak_bytes,
+            "TracedHeapBytes": traced_bytes,
+        }
+
+
+class MemoryRequestInterceptor(AbstractRequestInterceptor):
+    """Measure the last sampled turn and maybe sample this one.
+
+    Synthetic turns are neither counted nor sampled.
+    """
+    def __init__(self, accounting):
+        # type: (MemoryAccounting) -> None
+        self.accounting = accounting
+
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        if not current_turn(handler_input).synthetic:
+            self.accounting.request_started()
+
+
+class MemoryResponseInterceptor(AbstractResponseInterceptor):
+    """Attribute the sampled turn to the handler that served it."""
+    def __init__(self, accounting):
+        # type: (MemoryAccounting) -> None
+        self.accounting = accounting
+
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        if not current_turn(handler_input).synthetic:
+            self.accounting.response_ready(current_turn(handler_input).handler)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""ApiClient keeping HTTPS connections to the Alexa APIs open.
+
+DefaultApiClient calls the module-level ``requests.get``/``post``
+functions, which build a throwaway Session, so every service call pays
+for a TCP connect and a full TLS handshake. PooledApiClient sends the
+same requests through one long-lived Session, so warm containers reuse
+kept-alive connections, and with them their TLS sessions, across
+invocations.
+
+Imported by the skill's LazyApiClient factory on the first service
+call, so cold starts that never call a service don't import
+``requests``.
+"""
+import functools
+
+from typing import Callable, Optional, Tuple, Union
+
+import requests
+
+from ask_sdk_core.api_client import DefaultApiClient
+from ask_sdk_core.exceptions import ApiClientException
+from ask_sdk_model.services import ApiClientRequest
+from requests.adapters import HTTPAdapter
+
+HTTP_METHODS = frozenset(
+    ["get", "post", "put", "delete", "patch", "head", "options"])
+
+
+class PooledApiClient(DefaultApiClient):
+    """DefaultApiClient sending its requests through a pooled Session.
+
+    :param pool_size: connections kept open per API host; extra concurrent
+        requests get a connection that is closed after use
+    :param timeout: requests timeout, seconds or (connect, read)
+    """
+    def __init__(self, pool_size=8, timeout=(2.0, 5.0)):
+        # type: (int, Optional[Union[float, Tuple[float, float]]]) -> None
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+
+    def _resolve_method(self, request):
+        # type: (ApiClientRequest) -> Callable
+        method = (request.method or "").lower()
+        if method not in HTTP_METHODS:
+            raise ApiClientException(
+                "Invalid request method: {}".format(request.method))
+        return functools.partial(
+            getattr(self.session, method), timeout=self.timeout)
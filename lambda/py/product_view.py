@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Indexed view over an InSkillProductsResponse."""
+from typing import Dict, List, Optional, Tuple
+
+from ask_sdk_model.services.monetization import (
+    EntitledState, PurchasableState, InSkillProductsResponse, InSkillProduct)
+
+
+class ProductView(object):
+    """Lookup tables over the products of one InSkillProductsResponse.
+
+    The view is built once per response object and memoized on it, so
+    responses served from the product cache reuse the same tables.
+    """
+    def __init__(self, in_skill_products):
+        # type: (List[InSkillProduct]) -> None
+        self.products = tuple(in_skill_products or ())
+        self.by_reference_name = {
+            p.reference_name: p for p in self.products
+        }  # type: Dict[str, InSkillProduct]
+        self.by_product_id = {
+            p.product_id: p for p in self.products
+        }  # type: Dict[str, InSkillProduct]
+        self.entitled = tuple(
+            p for p in self.products
+            if p.entitled == EntitledState.ENTITLED
+        )  # type: Tuple[InSkillProduct, ...]
+        self.purchasable = tuple(
+            p for p in self.products
+            if p.entitled == EntitledState.NOT_ENTITLED and
+            p.purchasable == PurchasableState.PURCHASABLE
+        )  # type: Tuple[InSkillProduct, ...]
+
+    @classmethod
+    def of(cls, in_skill_response):
+        # type: (InSkillProductsResponse) -> ProductView
+        """Return the view for in_skill_response, building it on first
+        use."""
+        view = getattr(in_skill_response, "_product_view", None)
+        if view is None:
+            view = cls(in_skill_response.in_skill_products)
+            in_skill_response._product_view = view
+        return view
+
+    def get(self, reference_name):
+        # type: (str) -> Optional[InSkillProduct]
+        """Return the product with reference_name, if any."""
+        return self.by_reference_name.get(reference_name)
+
+    def get_by_id(self, product_id):
+        # type: (str) -> Optional[InSkillProduct]
+        """Return the product with product_id, if any."""
+        return self.by_product_id.get(product_id)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Deadline, hedging and circuit breaking around a downstream call."""
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Deque, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ServiceUnavailable(Exception):
+    """The call was not made, failed or missed its deadline."""
+
+
+class CircuitBreaker(object):
+    """Fail fast after failure_threshold consecutive failures.
+
+    The circuit stays open for reset_timeout seconds, then lets one
+    trial call through (half-open): its success closes the circuit, its
+    failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0,
+                 clock=time.monotonic):
+        # type: (int, float, Callable[[], float]) -> None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None  # type: Optional[float]
+        self._trial_running = False
+
+    @property
+    def state(self):
+        # type: () -> str
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        # type: () -> str
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self):
+        # type: () -> bool
+        """Return whether a call may be made now."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        # type: () -> None
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        # type: () -> None
+        with self._lock:
+            self._failures += 1
+            if (self._trial_running or
+                    self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+
+class LatencyWindow(object):
+    """Latencies of the last size successful calls."""
+    def __init__(self, size=200):
+        # type: (int) -> None
+        self._samples = deque(maxlen=size)  # type: Deque[float]
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        # type: (float) -> None
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, default, min_samples=20):
+        # type: (float, float, int) -> float
+        """Return the pct percentile, or default until min_samples
+        calls were recorded."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return default
+            ordered = sorted(self._samples)
+        rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+        return ordered[rank]
+
+
+class GuardedCall(object):
+    """Run calls on an executor with a deadline, a hedged retry and a
+    circuit breaker.
+
+    If the first attempt hasn't finished after the p95 of recent
+    latencies, a second identical attempt is started and the first
+    result of either is used. Attempts still running at the deadline
+    are abandoned, not cancelled; the executor bounds how many there
+    can be.
+
+    :param executor: executor running the attempts
+    :param hedge_default: hedge delay until enough latencies are known
+    :param hedge_min: lower bound of the hedge delay
+    :param hedge: set False to never start a second attempt
+    """
+    def __init__(self, executor, breaker=None, latencies=None,
+                 hedge_default=0.25, hedge_min=0.05, hedge=True,
+                 clock=time.monotonic):
+        # type: (Executor, Optional[CircuitBreaker], Optional[LatencyWindow], float, float, bool, Callable[[], float]) -> None
+        self.executor = executor
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = latencies or LatencyWindow()
+        self.hedge_default = hedge_default
+        self.hedge_min = hedge_min
+        self.hedge = hedge
+        self._clock = clock
+
+    def hedge_delay(self):
+        # type: () -> float
+        return max(self.hedge_min,
+                   self.latencies.percentile(95, self.hedge_default))
+
+    def _attempt(self, call):
+        # type: (Callable[[], T]) -> Any
+        started = self._clock()
+        result = call()
+        return result, self._clock() - started
+
+    def call(self, call, budget, is_success=None):
+        # type: (Callable[[], T], float, Optional[Callable[[T], bool]]) -> T
+        """Return the first successful result of call within budget
+        seconds.
+
+        is_success tells failed results (such as an Error body) from
+        good ones. Raises ServiceUnavailable when the circuit is open,
+        the budget is spent or every attempt failed.
+        """
+        if budget <= 0:
+            raise ServiceUnavailable("No time left for the call")
+        if not self.breaker.allow():
+            raise ServiceUnavailable("Circuit open")
+
+        deadline = self._clock() + budget
+        attempts = {self.executor.submit(self._attempt, call)}
+        hedged = not self.hedge
+        last_error = None  # type: Optional[BaseException]
+        while attempts:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if not hedged:
+                timeout = min(remaining, self.hedge_delay())
+            done, attempts = wait(
+                attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if is_success is None or is_success(result):
+                    self.latencies.add(seconds)
+                    self.breaker.record_success()
+                    return result
+                last_error = ServiceUnavailable(
+                    "Unsuccessful result: {!r}".format(result))
+            if not hedged and (not done or not attempts):
+                # Slow, or failed fast: try once more
+                hedged = True
+                attempts.add(self.executor.submit(self._attempt, call))
+
+        self.breaker.record_failure()
+        if last_error is None:
+            raise ServiceUnavailable(
+                "No response within {:.3f} s".format(budget))
+        raise ServiceUnavailable(str(last_error))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Responses built and serialized once per container.
+
+Help, fallback, goodbye and similar turns return the same Response for
+every user, yet the SDK serializes the model graph to a dict on each
+turn. Handlers get such responses from ResponseCache.response under a
+key naming the handler and the variant picked (for instance which
+goodbye was chosen). The first call builds the Response and serializes
+it, and later calls return that same object. The skill's lambda
+handler then takes the stored dict instead of running the serializer.
+
+Cached responses and their dicts are shared by all turns and must never
+be mutated.
+"""
+import threading
+
+from typing import Any, Callable, Dict, Hashable
+
+from ask_sdk_core.serialize import DefaultSerializer, Serializer
+from ask_sdk_model import Response, ResponseEnvelope
+
+
+class ResponseCache(object):
+    """Shared Response objects and their serialized dicts, by key.
+
+    At most max_entries responses are kept; past that, responses are
+    built and serialized per turn as without the cache.
+    """
+    def __init__(self, serializer=None, max_entries=256):
+        # type: (Serializer, int) -> None
+        self.serializer = serializer or DefaultSerializer()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._responses = {}  # type: Dict[Hashable, Response]
+        # Keyed on id(); cached responses stay alive, so ids are unique
+        self._serialized = {}  # type: Dict[int, Dict[str, Any]]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._responses)
+
+    def response(self, key, build):
+        # type: (Hashable, Callable[[], Response]) -> Response
+        """Return the response cached under key, building it with build
+        on the first call."""
+        response = self._responses.get(key)
+        if response is not None:
+            return response
+        response = build()
+        with self._lock:
+            if len(self._responses) >= self.max_entries:
+                return response
+            cached = self._responses.setdefault(key, response)
+            if cached is response:
+                self._serialized[id(response)] = self.serializer.serialize(
+                    response)
+        return cached
+
+    def serialized(self, response):
+        # type: (Response) -> Any
+        """Return the serialized dict of a cached response, or None."""
+        return self._serialized.get(id(response))
+
+    def serialize_envelope(self, serializer, response_envelope):
+        # type: (Serializer, ResponseEnvelope) -> Any
+        """Serialize response_envelope, reusing the dict of its response
+        if that is cached."""
+        serialized = self._serialized.get(id(response_envelope.response))
+        if serialized is None:
+            return serializer.serialize(response_envelope)
+        response_envelope.response = None
+        result = serializer.serialize(response_envelope)
+        result["response"] = serialized
+        return result
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Api clients plugged into the skill builder."""
+from typing import Callable
+
+from ask_sdk_model.services import (
+    ApiClient, ApiClientRequest, ApiClientResponse)
+
+
+class LazyApiClient(ApiClient):
+    """ApiClient that imports and builds its delegate on first use.
+
+    ``ask_sdk_core.api_client`` pulls in ``requests`` and its
+    dependencies, which is the largest single import of the skill.
+    Turns that never call an Alexa service API (GetFact, Fallback,
+    SessionEnded, ...) don't pay for it, and cold starts get shorter.
+    """
+    def __init__(self, factory=None):
+        # type: (Callable[[], ApiClient]) -> None
+        self._factory = factory
+        self._delegate = None  # type: ApiClient
+
+    @property
+    def delegate(self):
+        # type: () -> ApiClient
+        if self._delegate is None:
+            if self._factory is None:
+                from ask_sdk_core.api_client import DefaultApiClient
+                self._factory = DefaultApiClient
+            self._delegate = self._factory()
+        return self._delegate
+
+    def invoke(self, request):
+        # type: (ApiClientRequest) -> ApiClientResponse
+        return self.delegate.invoke(request)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of concurrent identical downstream calls."""
+import threading
+import time
+
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from resilience import ServiceUnavailable
+
+T = TypeVar("T")
+
+
+class FlightCancelled(ServiceUnavailable):
+    """The call was cancelled while waiting for it."""
+
+
+class Flight(object):
+    """One call in progress and the callers waiting for it."""
+    __slots__ = ("done", "result", "error", "cancelled", "_lock")
+
+    def __init__(self, lock):
+        # type: (threading.Lock) -> None
+        self.done = threading.Event()
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[BaseException]
+        self.cancelled = False
+        self._lock = lock
+
+    def publish(self, function, *args):
+        # type: (Callable[..., Any], *Any) -> bool
+        """Call function(*args) unless the flight was cancelled, and
+        return whether it was called.
+
+        Runs under the lock cancel() takes, so whatever cancels the
+        flight and then drops what function stored, e.g. a cache
+        entry, always comes after it.
+        """
+        with self._lock:
+            if self.cancelled:
+                return False
+            function(*args)
+            return True
+
+
+class SingleFlight(object):
+    """Share one in-flight call per key between concurrent callers.
+
+    The first caller for a key runs the call in its own thread, passing
+    it the Flight; callers arriving before it finishes wait for it and
+    get its result, or have its exception raised. Nothing is kept once
+    the call finished, so this complements a cache rather than
+    replacing one.
+
+    Waiting is bounded by each caller's timeout. cancel() detaches the
+    call in progress from its key, for instance once its result is
+    known to be out of date: waiting callers stop waiting and start
+    (or join) a new call for the time they have left. The cancelled
+    call itself runs to completion, and only its first caller gets its
+    result; it should store that result only through Flight.publish.
+
+    With share=False every caller runs its own call. The calls are
+    still tracked, so cancel() keeps them from publishing.
+    """
+    def __init__(self, clock=time.monotonic, share=True):
+        # type: (Callable[[], float], bool) -> None
+        self._clock = clock
+        self.share = share
+        self._lock = threading.Lock()
+        self._flights = {}  # type: Dict[Hashable, Flight]
+        self._unshared = {}  # type: Dict[Flight, Hashable]
+
+    def call(self, key, call, timeout):
+        # type: (Hashable, Callable[[Flight], T], float) -> Tuple[T, bool]
+        """Return the result of call, or of the call in progress for
+        key, and whether it was shared with another caller.
+
+        Raises ServiceUnavailable if the call in progress doesn't
+        finish within timeout seconds.
+        """
+        if not self.share:
+            flight = Flight(self._lock)
+            with self._lock:
+                self._unshared[flight] = key
+            return self._lead(key, flight, call), False
+
+        deadline = self._clock() + timeout
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = Flight(self._lock)
+            if leader:
+                return self._lead(key, flight, call), False
+
+            remaining = deadline - self._clock()
+            if remaining <= 0 or not flight.done.wait(remaining):
+                raise ServiceUnavailable(
+                    "No shared response within {:.3f} s".format(timeout))
+            if flight.cancelled:
+                if deadline <= self._clock():
+                    raise FlightCancelled("Shared call cancelled")
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+    def _lead(self, key, flight, call):
+        # type: (Hashable, Flight, Callable[[Flight], T]) -> T
+        try:
+            flight.result = call(flight)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._unshared.pop(flight, None)
+            flight.done.set()
+
+    def cancel(self, key):
+        # type: (Hashable) -> bool
+        """Detach the call in progress for key, if any, and wake its
+        waiting callers. Return whether there was one."""
+        return self.cancel_where(lambda k: k == key) > 0
+
+    def cancel_where(self, predicate):
+        # type: (Callable[[Hashable], bool]) -> int
+        """Cancel the calls in progress whose key matches predicate and
+        return how many there were."""
+        with self._lock:
+            flights = [self._flights.pop(key) for key in
+                       [k for k in self._flights if predicate(k)]]
+            unshared = [flight for flight, key in self._unshared.items()
+                        if predicate(key)]
+            for flight in unshared:
+                del self._unshared[flight]
+            flights.extend(unshared)
+            for flight in flights:
+                flight.cancelled = True
+        for flight in flights:
+            flight.done.set()
+        return len(flights)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._flights) + len(self._unshared)
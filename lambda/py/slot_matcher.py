@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Local fuzzy matching of slot values entity resolution missed.
+
+When Alexa's entity resolution finds no match, the handlers used to
+re-prompt, costing the user a whole voice round trip. SlotMatcher maps
+the raw spoken value to a slot type value with indexes built once per
+locale:
+
+* exact: the normalized value or one of its synonyms
+* phonetic: Soundex key of every word ("histery" -> H236)
+* trigram: Dice similarity of character trigrams ("sciences",
+  "spaced"), looked up through a trigram -> phrase index
+
+Filler words such as "the" or "pack" are dropped first. A trigram match
+must score at least min_score and beat the best match of any other
+value by margin, so ambiguous values stay unresolved.
+
+The matcher reads data/<locale>/slots.json, extracted from the
+interaction model with::
+
+    python slot_matcher.py ../../models/en-US.json data/en-US/slots.json
+"""
+import io
+import json
+import re
+import sys
+
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple
+
+DEFAULT_FILLER_WORDS = (
+    "a", "an", "the", "some", "my", "me", "please", "about", "fact",
+    "facts", "pack", "packs", "category", "one",
+)
+
+_NON_WORD = re.compile(r"[^\w ]+", re.UNICODE)
+_SOUNDEX_CODES = dict(
+    [(c, "1") for c in "bfpv"] + [(c, "2") for c in "cgjkqsxz"] +
+    [(c, "3") for c in "dt"] + [("l", "4")] + [(c, "5") for c in "mn"] +
+    [("r", "6")])
+
+
+def normalize(text, filler_words=frozenset()):
+    # type: (str, FrozenSet[str]) -> str
+    """Lower-case text, drop punctuation and filler words."""
+    words = _NON_WORD.sub(" ", text.lower().replace("-", " ")).split()
+    kept = [word for word in words if word not in filler_words]
+    return " ".join(kept or words)
+
+
+def soundex(word):
+    # type: (str) -> str
+    """American Soundex code of word, e.g. "history" -> "H236"."""
+    if not word:
+        return ""
+    code = word[0].upper()
+    previous = _SOUNDEX_CODES.get(word[0], "")
+    for char in word[1:]:
+        digit = _SOUNDEX_CODES.get(char, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if char not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def phonetic_key(phrase):
+    # type: (str) -> str
+    return " ".join(soundex(word) for word in phrase.split())
+
+
+def trigrams(phrase):
+    # type: (str) -> Set[str]
+    padded = "  {} ".format(phrase)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SlotTypeIndex(object):
+    """Exact, phonetic and trigram indexes over one slot type."""
+    def __init__(self, values, filler_words=frozenset()):
+        # type: (Mapping[str, Iterable[str]], FrozenSet[str]) -> None
+        self._exact = {}  # type: Dict[str, str]
+        phonetic = defaultdict(set)  # type: Dict[str, Set[str]]
+        self._phrases = []  # type: List[Tuple[str, Set[str]]]
+        by_trigram = defaultdict(list)  # type: Dict[str, List[int]]
+        for name, synonyms in values.items():
+            for phrase in [name] + list(synonyms):
+                phrase = normalize(phrase, filler_words)
+                self._exact.setdefault(phrase, name)
+                phonetic[phonetic_key(phrase)].add(name)
+                grams = trigrams(phrase)
+                for gram in grams:
+                    by_trigram[gram].append(len(self._phrases))
+                self._phrases.append((name, grams))
+        # Keys shared by several values are ambiguous and left out
+        self._phonetic = {
+            key: next(iter(names)) for key, names in phonetic.items()
+            if len(names) == 1}  # type: Dict[str, str]
+        self._by_trigram = dict(by_trigram)
+
+    def match(self, phrase, min_score, margin):
+        # type: (str, float, float) -> Optional[str]
+        name = self._exact.get(phrase)
+        if name is not None:
+            return name
+        name = self._phonetic.get(phonetic_key(phrase))
+        if name is not None:
+            return name
+
+        grams = trigrams(phrase)
+        shared = defaultdict(int)  # type: Dict[int, int]
+        for gram in grams:
+            for index in self._by_trigram.get(gram, ()):
+                shared[index] += 1
+        best = {}  # type: Dict[str, float]
+        for index, count in shared.items():
+            name, phrase_grams = self._phrases[index]
+            score = 2.0 * count / (len(grams) + len(phrase_grams))
+            if score > best.get(name, 0.0):
+                best[name] = score
+        if not best:
+            return None
+        ranked = sorted(best.items(), key=lambda item: -item[1])
+        name, score = ranked[0]
+        if score < min_score:
+            return None
+        if len(ranked) > 1 and score - ranked[1][1] < margin:
+            return None
+        return name
+
+
+class SlotMatcher(object):
+    """Fuzzy matchers for the slots of one locale's interaction model.
+
+    :param slot_types: slot type name to {value: [synonyms]}
+    :param slots: slot name to slot type name
+    """
+    def __init__(self, slot_types, slots, filler_words=DEFAULT_FILLER_WORDS,
+                 min_score=0.5, margin=0.1):
+        # type: (Mapping[str, Mapping[str, Iterable[str]]], Mapping[str, str], Iterable[str], float, float) -> None
+        self.slots = dict(slots)
+        self.filler_words = frozenset(filler_words)
+        self.min_score = min_score
+        self.margin = margin
+        self._indexes = {
+            slot_type: SlotTypeIndex(values, self.filler_words)
+            for slot_type, values in slot_types.items()
+        }  # type: Dict[str, SlotTypeIndex]
+
+    @classmethod
+    def load(cls, path):
+        # type: (str) -> SlotMatcher
+        with io.open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["types"], data["slots"],
+                   filler_words=data.get(
+                       "fillerWords", DEFAULT_FILLER_WORDS))
+
+    def match(self, slot_name, spoken_value):
+        # type: (str, Optional[str]) -> Optional[str]
+        """Return the slot type value spoken_value most likely meant,
+        or None."""
+        index = self._indexes.get(self.slots.get(slot_name))
+        if index is None or not spoken_value:
+            return None
+        phrase = normalize(spoken_value, self.filler_words)
+        if not phrase:
+            return None
+        return index.match(phrase, self.min_score, self.margin)
+
+
+def extract_slots(interaction_model):
+    # type: (Mapping[str, Any]) -> Dict[str, Any]
+    """Return the slots.json content for an interaction model."""
+    language_model = interaction_model["interactionModel"]["languageModel"]
+    slot_types = {}  # type: Dict[str, Dict[str, List[str]]]
+    for slot_type in language_model.get("types", []):
+        slot_types[slot_type["name"]] = {
+            value["name"]["value"]: value["name"].get("synonyms", [])
+            for value in slot_type.get("values", [])
+        }
+    slots = {}  # type: Dict[str, str]
+    for intent in language_model.get("intents", []):
+        for slot in intent.get("slots", []):
+            if slot["type"] not in slot_types:
+                continue
+            if slots.setdefault(slot["name"], slot["type"]) != slot["type"]:
+                raise ValueError(
+                    "Slot {} has types {} and {}".format(
+                        slot["name"], slots[slot["name"]], slot["type"]))
+    return {"types": slot_types, "slots": slots,
+            "fillerWords": list(DEFAULT_FILLER_WORDS)}
+
+
+def main(argv):
+    # type: (List[str]) -> int
+    if len(argv) != 3:
+        sys.exit("Usage: python slot_matcher.py <model.json> <slots.json>")
+    with io.open(argv[1], encoding="utf-8") as f:
+        slots = extract_slots(json.load(f))
+    with io.open(argv[2], "w", encoding="utf-8") as f:
+        f.write(json.dumps(slots, indent=2, sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Per-turn bookkeeping shared by the skill's loggers and metrics."""
+import json
+import logging
+import random
+import sys
+import time
+
+from typing import Any, Callable, Dict, Optional
+
+from ask_sdk_core.dispatch_components import (
+    AbstractRequestInterceptor, AbstractResponseInterceptor)
+from ask_sdk_core.handler_input import HandlerInput
+from ask_sdk_model import Response
+from ask_sdk_runtime.dispatch_components import GenericHandlerAdapter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TURN_ATTRIBUTE = "_turn"
+# Requests with ids starting with this prefix are synthetic, such as the
+# warm-up turns run during init; they are neither logged nor measured.
+SYNTHETIC_REQUEST_PREFIX = "synthetic."
+
+
+class Turn(object):
+    """What happened while handling one request.
+
+    Stored in the request attributes, so it lives exactly as long as
+    the request.
+    """
+    __slots__ = ("started", "handler", "handler_seconds", "isp_calls",
+                 "isp_seconds", "isp_fallbacks", "isp_coalesced",
+                 "cache_hits", "cache_misses", "slot_matches", "sampled",
+                 "synthetic")
+
+    def __init__(self, sampled=True, synthetic=False):
+        # type: (bool, bool) -> None
+        self.started = time.perf_counter()
+        self.handler = None  # type: Optional[str]
+        self.handler_seconds = 0.0
+        self.isp_calls = 0
+        self.isp_seconds = 0.0
+        self.isp_fallbacks = 0
+        self.isp_coalesced = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.slot_matches = 0
+        self.sampled = sampled and not synthetic
+        self.synthetic = synthetic
+
+    @property
+    def latency_ms(self):
+        # type: () -> float
+        return (time.perf_counter() - self.started) * 1000
+
+
+def start_turn(handler_input, sample_rate=1.0):
+    # type: (HandlerInput, float) -> Turn
+    """Start bookkeeping for the current request.
+
+    The turn is sampled for logging with probability sample_rate.
+    """
+    request_id = handler_input.request_envelope.request.request_id or ""
+    turn = Turn(
+        sampled=sample_rate >= 1.0 or random.random() < sample_rate,
+        synthetic=request_id.startswith(SYNTHETIC_REQUEST_PREFIX))
+    handler_input.attributes_manager.request_attributes[TURN_ATTRIBUTE] = turn
+    return turn
+
+
+def current_turn(handler_input):
+    # type: (HandlerInput) -> Turn
+    """Return the turn of the current request, starting one if no
+    interceptor did."""
+    turn = handler_input.attributes_manager.request_attributes.get(
+        TURN_ATTRIBUTE)
+    if turn is None:
+        turn = start_turn(handler_input)
+    return turn
+
+
+def turn_summary(handler_input, turn):
+    # type: (HandlerInput, Turn) -> Dict[str, Any]
+    """Return the fixed set of fields logged for every sampled turn."""
+    request = handler_input.request_envelope.request
+    intent = getattr(request, "intent", None)
+    return {
+        "requestType": request.object_type,
+        "intent": intent.name if intent is not None else None,
+        "handler": turn.handler,
+        "latencyMs": round(turn.latency_ms, 3),
+        "ispCalls": turn.isp_calls,
+    }
+
+
+def log_turn(handler_input, turn):
+    # type: (HandlerInput, Turn) -> None
+    """Emit the turn as one compact JSON line if it was sampled."""
+    if turn.sampled and logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(
+            turn_summary(handler_input, turn), separators=(",", ":")))
+
+
+class TracingHandlerAdapter(GenericHandlerAdapter):
+    """Handler adapter recording which handler served the turn and how
+    long it took."""
+    def execute(self, handler_input, handler):
+        turn = current_turn(handler_input)
+        turn.handler = type(handler).__name__
+        started = time.perf_counter()
+        try:
+            return handler.handle(handler_input)
+        finally:
+            turn.handler_seconds += time.perf_counter() - started
+
+
+def _write_stdout(line):
+    # type: (str) -> None
+    sys.stdout.write(line + "\n")
+
+
+def metrics_document(turn, namespace, timestamp=None):
+    # type: (Turn, str, Optional[float]) -> Dict[str, Any]
+    """Return the turn's metrics in CloudWatch Embedded Metric Format,
+    with the handler class as the only dimension."""
+    if timestamp is None:
+        timestamp = time.time()
+    return {
+        "_aws": {
+            "Timestamp": int(timestamp * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace,
+                "Dimensions": [["Handler"]],
+                "Metrics": [
+                    {"Name": "HandlerLatency", "Unit": "Milliseconds"},
+                    {"Name": "IspLatency", "Unit": "Milliseconds"},
+                    {"Name": "IspCalls", "Unit": "Count"},
+                    {"Name": "IspFallbacks", "Unit": "Count"},
+                    {"Name": "IspCoalescedCalls", "Unit": "Count"},
+                    {"Name": "ProductCacheHits", "Unit": "Count"},
+                    {"Name": "ProductCacheMisses", "Unit": "Count"},
+                    {"Name": "FuzzySlotMatches", "Unit": "Count"},
+                ],
+            }],
+        },
+        "Handler": turn.handler or "None",
+        "HandlerLatency": round(turn.handler_seconds * 1000, 3),
+        "IspLatency": round(turn.isp_seconds * 1000, 3),
+        "IspCalls": turn.isp_calls,
+        "IspFallbacks": turn.isp_fallbacks,
+        "IspCoalescedCalls": turn.isp_coalesced,
+        "ProductCacheHits": turn.cache_hits,
+        "ProductCacheMisses": turn.cache_misses,
+        "FuzzySlotMatches": turn.slot_matches,
+    }
+
+
+class MetricsRequestInterceptor(AbstractRequestInterceptor):
+    """Make sure the turn is tracked before the handler runs."""
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        current_turn(handler_input)
+
+
+class MetricsResponseInterceptor(AbstractResponseInterceptor):
+    """Write the turn's metrics as one Embedded Metric Format line.
+
+    Lambda forwards stdout to CloudWatch Logs, which extracts the
+    metrics without a PutMetricData call.
+    """
+    def __init__(self, namespace, emit=_write_stdout):
+        # type: (str, Callable[[str], None]) -> None
+        self.namespace = namespace
+        self.emit = emit
+
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        turn = current_turn(handler_input)
+        if turn.synthetic:
+            return
+        self.emit(json.dumps(
+            metrics_document(turn, self.namespace), separators=(",", ":")))
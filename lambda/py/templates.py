@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Speech templates compiled once per container.
+
+ResponseFactory.speak and ask wrap every string in SSML and build new
+SsmlOutputSpeech and Reprompt objects on each turn. Templates without
+slots are compiled into those objects once and shared by all responses;
+templates with slots only pay for the str.format and one object.
+The shared model objects must never be mutated.
+"""
+import random
+import string
+
+from typing import Any, Dict, List, Mapping, Sequence, Union
+
+from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_model import Response
+from ask_sdk_model.ui import Reprompt, SsmlOutputSpeech
+
+_formatter = string.Formatter()
+
+
+def ssml_speech(text):
+    # type: (str) -> SsmlOutputSpeech
+    """Wrap text in <speak> tags, as ResponseFactory.speak does."""
+    return SsmlOutputSpeech(ssml="<speak>{}</speak>".format(text.strip()))
+
+
+class SpeechTemplate(object):
+    """A speech string with optional str.format slots."""
+    __slots__ = ("text", "static", "_speech", "_reprompt")
+
+    def __init__(self, text):
+        # type: (str) -> None
+        self.text = text
+        self.static = all(
+            field is None for _, field, _, _ in _formatter.parse(text))
+        if self.static:
+            self._speech = ssml_speech(text)
+            self._reprompt = Reprompt(output_speech=self._speech)
+        else:
+            self._speech = None
+            self._reprompt = None
+
+    def format(self, *args, **kwargs):
+        # type: (*Any, **Any) -> str
+        """Return the text with its slots filled."""
+        if self.static:
+            return self.text
+        return self.text.format(*args, **kwargs)
+
+    def speech(self, *args, **kwargs):
+        # type: (*Any, **Any) -> SsmlOutputSpeech
+        """Return the output speech, shared when the template is
+        static."""
+        if self.static:
+            return self._speech
+        return ssml_speech(self.text.format(*args, **kwargs))
+
+    def reprompt(self, *args, **kwargs):
+        # type: (*Any, **Any) -> Reprompt
+        """Return the reprompt, shared when the template is static."""
+        if self.static:
+            return self._reprompt
+        return Reprompt(output_speech=self.speech(*args, **kwargs))
+
+
+class SpeechPool(object):
+    """Templates of which one is picked at random per turn."""
+    __slots__ = ("templates",)
+
+    def __init__(self, texts):
+        # type: (Sequence[str]) -> None
+        self.templates = tuple(SpeechTemplate(text) for text in texts)
+
+    def choice(self):
+        # type: () -> SpeechTemplate
+        return random.choice(self.templates)
+
+
+class TemplateRegistry(object):
+    """Named templates: a string compiles to a SpeechTemplate, a list of
+    strings to a SpeechPool."""
+    def __init__(self, templates):
+        # type: (Mapping[str, Union[str, List[str]]]) -> None
+        self._templates = {}  # type: Dict[str, Union[SpeechTemplate, SpeechPool]]
+        for name, text in templates.items():
+            if isinstance(text, (list, tuple)):
+                self._templates[name] = SpeechPool(text)
+            else:
+                self._templates[name] = SpeechTemplate(text)
+
+    def __getitem__(self, name):
+        # type: (str) -> Union[SpeechTemplate, SpeechPool]
+        return self._templates[name]
+
+    def __contains__(self, name):
+        # type: (str) -> bool
+        return name in self._templates
+
+
+def respond(response_builder, speech, reprompt=None,
+            should_end_session=None):
+    # type: (ResponseFactory, SsmlOutputSpeech, Reprompt, bool) -> Response
+    """Set compiled speech (and reprompt) on the response, the way
+    speak().ask() would, and return the response."""
+    response = response_builder.response
+    response.output_speech = speech
+    if reprompt is not None:
+        response.reprompt = reprompt
+        response.should_end_session = False
+    if should_end_session is not None:
+        response.should_end_session = should_end_session
+    return response
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Synthetic turns run through the skill during init.
+
+A freshly imported skill still does work on its first requests: the SDK
+serializer resolves its model classes, the handlers' model objects,
+templates and the fact catalogue are built, thread pools start their
+threads. prime() runs a LaunchRequest, GetCategoryFactIntent (owned and
+not owned) and Connections.Response (Buy and Upsell) through a lambda
+handler, so that work happens in the init phase, before Lambda takes a
+snapshot or a provisioned environment serves its first request.
+
+The turns talk to WarmupApiClient instead of the monetization service,
+run as a made-up user, and carry request ids starting with
+telemetry.SYNTHETIC_REQUEST_PREFIX, so they are not logged or measured.
+"""
+import json
+import logging
+import time
+
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+from ask_sdk_model.services import (
+    ApiClient, ApiClientRequest, ApiClientResponse)
+
+from telemetry import SYNTHETIC_REQUEST_PREFIX
+
+logger = logging.getLogger(__name__)
+
+WARMUP_USER_ID = "amzn1.ask.account.WARMUP"
+WARMUP_APPLICATION_ID = "amzn1.ask.skill.warmup"
+
+
+def product_id(reference_name):
+    # type: (str) -> str
+    return "amzn1.adg.product.warmup-" + reference_name
+
+
+class WarmupApiClient(ApiClient):
+    """ApiClient answering every call with a fixed InSkillProducts list.
+
+    :param reference_names: reference names of the listed products
+    :param entitled: reference names the user owns
+    """
+    def __init__(self, reference_names, entitled=()):
+        # type: (Iterable[str], Iterable[str]) -> None
+        entitled = frozenset(entitled)
+        self._body = json.dumps({
+            "inSkillProducts": [{
+                "productId": product_id(name),
+                "referenceName": name,
+                "type": "ENTITLEMENT",
+                "name": name,
+                "summary": name,
+                "entitled": ("ENTITLED" if name in entitled
+                             else "NOT_ENTITLED"),
+                "entitlementReason": "NOT_PURCHASED",
+                "purchasable": ("NOT_PURCHASABLE" if name in entitled
+                                else "PURCHASABLE"),
+                "activeEntitlementCount": 1 if name in entitled else 0,
+                "purchaseMode": "TEST",
+            } for name in reference_names],
+            "isTruncated": False,
+        })
+
+    def invoke(self, request):
+        # type: (ApiClientRequest) -> ApiClientResponse
+        return ApiClientResponse(
+            headers=[("Content-Type", "application/json")],
+            status_code=200, body=self._body)
+
+
+def _envelope(locale, index, request):
+    # type: (str, int, Dict[str, Any]) -> Dict[str, Any]
+    request = dict(request, locale=locale, timestamp="1970-01-01T00:00:00Z",
+                   requestId="{}{}".format(SYNTHETIC_REQUEST_PREFIX, index))
+    return {
+        "version": "1.0",
+        "session": {
+            "new": index == 0,
+            "sessionId": SYNTHETIC_REQUEST_PREFIX + "session",
+            "application": {"applicationId": WARMUP_APPLICATION_ID},
+            "attributes": {},
+            "user": {"userId": WARMUP_USER_ID},
+        },
+        "context": {
+            "System": {
+                "application": {"applicationId": WARMUP_APPLICATION_ID},
+                "user": {"userId": WARMUP_USER_ID},
+                "device": {"deviceId": "warmup", "supportedInterfaces": {}},
+                "apiEndpoint": "https://api.amazonalexa.com",
+                "apiAccessToken": "warmup",
+            },
+        },
+        "request": request,
+    }
+
+
+def _category_intent(category):
+    # type: (str) -> Dict[str, Any]
+    return {
+        "type": "IntentRequest",
+        "intent": {
+            "name": "GetCategoryFactIntent",
+            "confirmationStatus": "NONE",
+            "slots": {"factCategory": {
+                "name": "factCategory",
+                "value": category,
+                "resolutions": {"resolutionsPerAuthority": [{
+                    "authority": "warmup",
+                    "status": {"code": "ER_SUCCESS_MATCH"},
+                    "values": [{"value": {"name": category, "id": category}}],
+                }]},
+            }},
+        },
+    }
+
+
+def _connections_response(name, purchase_result, reference_name):
+    # type: (str, str, str) -> Dict[str, Any]
+    return {
+        "type": "Connections.Response",
+        "name": name,
+        "status": {"code": "200", "message": "OK"},
+        "payload": {"purchaseResult": purchase_result,
+                    "productId": product_id(reference_name)},
+        "token": "correlationToken",
+    }
+
+
+def synthetic_envelopes(locale, owned, not_owned):
+    # type: (str, str, str) -> List[Dict[str, Any]]
+    """Return the warm-up turns for locale, given a category the
+    synthetic user owns the pack of and one they don't."""
+    requests = [
+        {"type": "LaunchRequest"},
+        _category_intent(owned),
+        _category_intent(not_owned),
+        _connections_response("Upsell", "DECLINED", not_owned + "_pack"),
+        _connections_response("Buy", "ACCEPTED", not_owned + "_pack"),
+    ]
+    return [_envelope(locale, index, request)
+            for index, request in enumerate(requests)]
+
+
+def prime(handler, envelopes):
+    # type: (Callable[[Dict[str, Any], Any], Any], Sequence[Dict[str, Any]]) -> float
+    """Run envelopes through handler and return the seconds it took.
+
+    Failures are logged, never raised: a failed warm-up only means the
+    first real requests do the work instead.
+    """
+    started = time.perf_counter()
+    for envelope in envelopes:
+        try:
+            handler(envelope, None)
+        except Exception:
+            logger.warning("Warm-up turn failed", exc_info=True)
+    return time.perf_counter() - started
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+
+from ask_sdk_core.attributes_manager import (  # noqa: E402
+    AbstractPersistenceAdapter)
+from ask_sdk_model import RequestEnvelope  # noqa: E402
+from ask_sdk_model.services.monetization import (  # noqa: E402
+    EntitledState, InSkillProduct, InSkillProductsResponse)
+
+from entitlement_store import (  # noqa: E402
+    EntitlementStore, SqlitePersistenceAdapter)
+from isp_cache import mark_fetched  # noqa: E402
+
+ENVELOPE = json.dumps({
+    "version": "1.0",
+    "context": {"System": {"user": {"userId": "amzn1.ask.account.TEST"}}},
+    "request": {"type": "LaunchRequest", "locale": "en-US"},
+})
+
+
+def products(entitled, fetched_at):
+    response = InSkillProductsResponse(in_skill_products=[InSkillProduct(
+        reference_name="space_pack", active_entitlement_count=1,
+        entitled=(EntitledState.ENTITLED if entitled
+                  else EntitledState.NOT_ENTITLED))])
+    mark_fetched(response, fetched_at)
+    return response
+
+
+class DynamoDbTypesAdapter(AbstractPersistenceAdapter):
+    """Keeps attributes as DynamoDB items, through the boto3 type
+    (de)serializers DynamoDbAdapter uses."""
+    def __init__(self):
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+        self.item = None
+
+    def get_attributes(self, request_envelope):
+        if self.item is None:
+            return {}
+        return self.deserializer.deserialize(self.item)
+
+    def save_attributes(self, request_envelope, attributes):
+        self.item = self.serializer.serialize(attributes)
+
+    def delete_attributes(self, request_envelope):
+        self.item = None
+
+
+class EntitlementStoreTest(unittest.TestCase):
+    def adapter(self):
+        return SqlitePersistenceAdapter(
+            os.path.join(tempfile.mkdtemp(), "entitlements.db"))
+
+    def setUp(self):
+        self.now = 1000.0
+        self.store = EntitlementStore(self.adapter, clock=lambda: self.now)
+        self.envelope = self.store.serializer.deserialize(
+            ENVELOPE, RequestEnvelope)
+
+    def stored(self):
+        attributes = self.store.adapter.get_attributes(self.envelope)
+        return attributes["entitlements"]["en-US"]
+
+    def test_load_returns_the_saved_products(self):
+        self.assertTrue(
+            self.store.save(self.envelope, "en-US", products(True, 990.0)))
+        loaded = self.store.load(self.envelope, "en-US")
+        self.assertEqual(
+            loaded.in_skill_products[0].entitled, EntitledState.ENTITLED)
+        self.assertEqual(self.stored()["version"], 1)
+
+    def test_older_products_do_not_replace_newer_ones(self):
+        # The purchase's fetch is stored before the slower write of a
+        # fetch that started earlier
+        self.store.save(self.envelope, "en-US", products(True, 995.0))
+        self.assertFalse(
+            self.store.save(self.envelope, "en-US", products(False, 990.0)))
+        self.assertEqual(self.stored()["entitled"], ["space_pack"])
+        self.assertEqual(self.stored()["version"], 1)
+
+        self.assertTrue(
+            self.store.save(self.envelope, "en-US", products(False, 999.0)))
+        self.assertEqual(self.stored()["entitled"], [])
+        self.assertEqual(self.stored()["version"], 2)
+
+    def test_invalidated_records_are_not_loaded(self):
+        self.store.save(self.envelope, "en-US", products(False, 990.0))
+        self.assertTrue(self.store.invalidate(self.envelope, 995.0))
+        self.assertIsNone(self.store.load(self.envelope, "en-US"))
+
+        # Fetched before the purchase
+        self.assertFalse(
+            self.store.save(self.envelope, "en-US", products(False, 993.0)))
+        self.assertIsNone(self.store.load(self.envelope, "en-US"))
+        self.assertTrue(
+            self.store.save(self.envelope, "en-US", products(True, 996.0)))
+        self.assertIsNotNone(self.store.load(self.envelope, "en-US"))
+
+    def test_expired_records_are_not_loaded(self):
+        self.store.save(self.envelope, "en-US", products(True, 990.0))
+        self.now = 990.0 + self.store.ttl
+        self.assertIsNone(self.store.load(self.envelope, "en-US"))
+
+
+class DynamoDbEntitlementStoreTest(EntitlementStoreTest):
+    def adapter(self):
+        return DynamoDbTypesAdapter()
+
+    def test_numbers_are_read_back_as_decimals(self):
+        self.store.save(self.envelope, "en-US", products(True, 990.5))
+        self.assertEqual(
+            repr(self.stored()["fetchedAt"]), "Decimal('990500')")
+        loaded = self.store.load(self.envelope, "en-US")
+        self.assertEqual(loaded.in_skill_products[0].reference_name,
+                         "space_pack")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+
+from fact_sampler import permutation, permuted_index  # noqa: E402
+
+
+class PermutationTest(unittest.TestCase):
+    def test_every_seed_permutes_range(self):
+        for n in (1, 2, 3, 4, 10, 12, 97, 210):
+            for seed in range(40):
+                self.assertEqual(
+                    sorted(permuted_index(seed, c, n) for c in range(n)),
+                    list(range(n)), (n, seed))
+
+    def test_rotation_only_when_nothing_else_permutes(self):
+        self.assertEqual(permutation(7, 2)[0], 1)
+        for seed in range(100):
+            self.assertNotEqual(permutation(seed, 10)[0], 1)
+
+    def test_seeds_spread_over_multipliers(self):
+        multipliers = {permutation(seed, 10)[0] for seed in range(200)}
+        self.assertEqual(multipliers, {3, 7, 9})
+
+    def test_large_category(self):
+        n = 2 * 3 * 5 * 7 * 11 * 13 * 17 * 19
+        a, b = permutation(0x9f3a1c2e, n)
+        self.assertTrue(1 < a < n)
+        self.assertEqual(permuted_index(0x9f3a1c2e, 0, n), b)
+
+
+if __name__ == "__main__":
+    unittest.main()
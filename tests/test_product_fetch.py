@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+os.environ.setdefault("EMIT_METRICS", "false")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("WARM_UP", "false")
+
+from ask_sdk_model import RequestEnvelope  # noqa: E402
+from ask_sdk_model.services import ApiClient  # noqa: E402
+
+import lambda_function  # noqa: E402
+from entitlement_store import (  # noqa: E402
+    EntitlementStore, SqlitePersistenceAdapter)
+from isp_cache import fetched_at, mark_fetched  # noqa: E402
+from lambda_function import FREE_TIER_RESPONSE  # noqa: E402
+from resilience import GuardedCall  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+from warmup import WarmupApiClient, product_id  # noqa: E402
+
+USER_ID = "amzn1.ask.account.TEST"
+PRODUCTS = ("science_pack", "history_pack", "space_pack", "all_access")
+
+
+def envelope(request):
+    request = dict(request, locale="en-US", requestId="test",
+                   timestamp="2026-10-18T12:00:00Z")
+    return {
+        "version": "1.0",
+        "session": {
+            "new": False, "sessionId": "test", "attributes": {},
+            "application": {"applicationId": "amzn1.ask.skill.test"},
+            "user": {"userId": USER_ID},
+        },
+        "context": {"System": {
+            "application": {"applicationId": "amzn1.ask.skill.test"},
+            "user": {"userId": USER_ID},
+            "device": {"deviceId": "test", "supportedInterfaces": {}},
+            "apiEndpoint": "https://api.amazonalexa.com",
+            "apiAccessToken": "test",
+        }},
+        "request": request,
+    }
+
+
+SHOPPING = envelope({
+    "type": "IntentRequest",
+    "intent": {"name": "ShoppingIntent", "confirmationStatus": "NONE"},
+})
+BUY_ACCEPTED = envelope({
+    "type": "Connections.Response", "name": "Buy",
+    "status": {"code": "200", "message": "OK"},
+    "payload": {"purchaseResult": "ACCEPTED",
+                "productId": product_id("space_pack")},
+    "token": "correlationToken",
+})
+UPSELL_ACCEPTED = envelope({
+    "type": "Connections.Response", "name": "Upsell",
+    "status": {"code": "200", "message": "OK"},
+    "payload": {"purchaseResult": "ACCEPTED",
+                "productId": product_id("space_pack")},
+    "token": "correlationToken",
+})
+SPACE_FACT = envelope({
+    "type": "IntentRequest",
+    "intent": {
+        "name": "GetCategoryFactIntent", "confirmationStatus": "NONE",
+        "slots": {"factCategory": {
+            "name": "factCategory", "value": "space",
+            "resolutions": {"resolutionsPerAuthority": [{
+                "authority": "test",
+                "status": {"code": "ER_SUCCESS_MATCH"},
+                "values": [{"value": {"name": "space", "id": "space"}}],
+            }]},
+        }},
+    },
+})
+
+PRODUCT_DETAIL = envelope({
+    "type": "IntentRequest",
+    "intent": {
+        "name": "ProductDetailIntent", "confirmationStatus": "NONE",
+        "slots": {"productCategory": {
+            "name": "productCategory", "value": "space",
+            "resolutions": {"resolutionsPerAuthority": [{
+                "authority": "test",
+                "status": {"code": "ER_SUCCESS_MATCH"},
+                "values": [{"value": {"name": "space", "id": "space"}}],
+            }]},
+        }},
+    },
+})
+
+
+class PurchaseApiClient(ApiClient):
+    """Monetization service whose first call is held until released,
+    and which lists space_pack as entitled once it was bought."""
+    def __init__(self):
+        self.first_started = threading.Event()
+        self.release_first = threading.Event()
+        self.calls = 0
+        self.before = WarmupApiClient(PRODUCTS)
+        self.after = WarmupApiClient(PRODUCTS, entitled=["space_pack"])
+        self.bought = False
+
+    def invoke(self, request):
+        self.calls += 1
+        client = self.after if self.bought else self.before
+        if self.calls == 1:
+            self.first_started.set()
+            self.release_first.wait(5)
+        return client.invoke(request)
+
+
+class PurchaseRaceTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (lambda_function.sb.api_client,
+                      lambda_function.isp_guard.hedge)
+        self.api_client = PurchaseApiClient()
+        lambda_function.sb.api_client = self.api_client
+        # A hedged second attempt would make the first call's result
+        # depend on timing
+        lambda_function.isp_guard.hedge = False
+        lambda_function.product_cache.clear()
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        (lambda_function.sb.api_client,
+         lambda_function.isp_guard.hedge) = self.saved
+        lambda_function.product_cache.clear()
+
+    def cached_space_pack(self):
+        response = lambda_function.product_cache.get((USER_ID, "en-US"))
+        return {p.reference_name: p.entitled.value
+                for p in response.in_skill_products}["space_pack"]
+
+    def test_fetch_started_before_purchase_is_not_cached(self):
+        shopping = threading.Thread(
+            target=self.handler, args=(SHOPPING, None))
+        shopping.start()
+        self.assertTrue(self.api_client.first_started.wait(5))
+
+        self.api_client.bought = True
+        self.handler(BUY_ACCEPTED, None)
+        self.assertEqual(self.cached_space_pack(), "ENTITLED")
+
+        self.api_client.release_first.set()
+        shopping.join(5)
+        self.assertEqual(self.api_client.calls, 2)
+        self.assertEqual(self.cached_space_pack(), "ENTITLED")
+
+
+class UpsellInvalidationTest(unittest.TestCase):
+    def setUp(self):
+        interceptors = (lambda_function.sb.runtime_configuration_builder
+                        .global_request_interceptors)
+        self.saved = interceptors[:]
+        # As with ENTITLEMENT_SNAPSHOTS=false
+        interceptors[:] = [
+            i for i in interceptors if not isinstance(
+                i, lambda_function.EntitlementSnapshotInterceptor)]
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        (lambda_function.sb.runtime_configuration_builder
+         .global_request_interceptors[:]) = self.saved
+        lambda_function.product_cache.clear()
+
+    def test_accepted_upsell_drops_cached_products(self):
+        lambda_function.product_cache.put(
+            (USER_ID, "en-US"), lambda_function.FREE_TIER_RESPONSE)
+        self.handler(UPSELL_ACCEPTED, None)
+        self.assertIsNone(
+            lambda_function.product_cache.get((USER_ID, "en-US")))
+
+
+class StoredUpsellTest(unittest.TestCase):
+    """An accepted upsell must not leave the products from before the
+    purchase in the entitlement store."""
+    def setUp(self):
+        self.saved = (lambda_function.sb.api_client,
+                      lambda_function.entitlement_store)
+        self.api_client = PurchaseApiClient()
+        self.api_client.release_first.set()
+        lambda_function.sb.api_client = self.api_client
+        lambda_function.entitlement_store = EntitlementStore(
+            lambda: SqlitePersistenceAdapter(
+                os.path.join(tempfile.mkdtemp(), "entitlements.db")))
+        lambda_function.product_cache.clear()
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        (lambda_function.sb.api_client,
+         lambda_function.entitlement_store) = self.saved
+        lambda_function.product_cache.clear()
+
+    def directives(self, envelope):
+        return [directive["name"] for directive in
+                self.handler(envelope, None)["response"].get(
+                    "directives", ())]
+
+    def test_bought_pack_is_not_upsold_again(self):
+        self.assertEqual(self.directives(SPACE_FACT), ["Upsell"])
+        self.api_client.bought = True
+        self.handler(UPSELL_ACCEPTED, None)
+        # As in a new container: only the store is left
+        lambda_function.product_cache.clear()
+        self.assertEqual(self.directives(SPACE_FACT), [])
+
+
+class SlowStore(object):
+    """Entitlement store whose loads hang until released."""
+    def __init__(self):
+        self.release = threading.Event()
+
+    def load(self, request_envelope, locale):
+        self.release.wait(5)
+
+    def save_async(self, request_envelope, locale, response):
+        return None
+
+
+class StoreTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (lambda_function.sb.api_client,
+                      lambda_function.entitlement_store,
+                      lambda_function.entitlement_load_timeout)
+        self.store = SlowStore()
+        lambda_function.sb.api_client = WarmupApiClient(PRODUCTS)
+        lambda_function.entitlement_store = self.store
+        lambda_function.entitlement_load_timeout = 0.05
+        lambda_function.product_cache.clear()
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        self.store.release.set()
+        (lambda_function.sb.api_client,
+         lambda_function.entitlement_store,
+         lambda_function.entitlement_load_timeout) = self.saved
+        lambda_function.product_cache.clear()
+
+    def test_slow_load_falls_through_to_the_service(self):
+        started = time.monotonic()
+        response = self.handler(SHOPPING, None)["response"]
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertIn("outputSpeech", response)
+        self.assertIsNotNone(
+            lambda_function.product_cache.get((USER_ID, "en-US")))
+
+
+class UnsharedPurchaseRaceTest(PurchaseRaceTest):
+    """As with ISP_SINGLE_FLIGHT=false."""
+    def setUp(self):
+        self.saved_flights = lambda_function.isp_flights
+        lambda_function.isp_flights = SingleFlight(share=False)
+        super(UnsharedPurchaseRaceTest, self).setUp()
+
+    def tearDown(self):
+        super(UnsharedPurchaseRaceTest, self).tearDown()
+        lambda_function.isp_flights = self.saved_flights
+
+
+class FailingApiClient(ApiClient):
+    def invoke(self, request):
+        raise IOError("Connection refused")
+
+
+class StoreUnavailableTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = lambda_function.sb.api_client, lambda_function.isp_guard
+        lambda_function.sb.api_client = FailingApiClient()
+        lambda_function.isp_guard = GuardedCall(
+            self.saved[1].executor, hedge=False)
+        lambda_function.product_cache.clear()
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        lambda_function.sb.api_client, lambda_function.isp_guard = self.saved
+
+    def speech(self, envelope):
+        return self.handler(envelope, None)["response"]["outputSpeech"][
+            "ssml"]
+
+    def assert_store_unavailable(self, envelope):
+        templates = lambda_function.locales.get("en-US").templates
+        self.assertEqual(
+            self.speech(envelope),
+            templates["store_unavailable"].speech().ssml)
+
+    def test_shopping(self):
+        self.assert_store_unavailable(SHOPPING)
+
+    def test_product_detail(self):
+        self.assert_store_unavailable(PRODUCT_DETAIL)
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FetchTimeTest(unittest.TestCase):
+    """Snapshots are dated when the products were fetched, not when
+    they were read back from a cache or the store."""
+    def setUp(self):
+        self.saved = lambda_function.sb.api_client
+        lambda_function.sb.api_client = WarmupApiClient(PRODUCTS)
+        lambda_function.product_cache.clear()
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        lambda_function.sb.api_client = self.saved
+        lambda_function.product_cache.clear()
+
+    def snapshot_time(self, envelope):
+        attributes = self.handler(envelope, None)["sessionAttributes"]
+        snapshot = attributes[lambda_function.entitlement_snapshots.attribute]
+        return int(snapshot.split(":")[0], 16)
+
+    def test_fresh_fetch(self):
+        before = int(time.time())
+        self.assertGreaterEqual(self.snapshot_time(SHOPPING), before)
+
+    def test_cached_products_keep_their_fetch_time(self):
+        self.handler(SHOPPING, None)
+        cached = lambda_function.product_cache.get((USER_ID, "en-US"))
+        mark_fetched(cached, time.time() - 600)
+        self.assertEqual(
+            self.snapshot_time(SHOPPING), int(fetched_at(cached)))
+
+    def test_stored_products_keep_their_fetch_time(self):
+        clock = FakeClock(time.time() - 600)
+        store = EntitlementStore(
+            lambda: SqlitePersistenceAdapter(
+                os.path.join(tempfile.mkdtemp(), "entitlements.db")),
+            clock=clock)
+        request_envelope = store.serializer.deserialize(
+            json.dumps(SHOPPING), RequestEnvelope)
+        store.save(request_envelope, "en-US", FREE_TIER_RESPONSE)
+        saved_at = clock.now
+        clock.now += 600
+
+        loaded = store.load(request_envelope, "en-US")
+        self.assertAlmostEqual(fetched_at(loaded), saved_at, places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+
+from resilience import (  # noqa: E402
+    CircuitBreaker, GuardedCall, LatencyWindow, ServiceUnavailable)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_the_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class LatencyWindowTest(unittest.TestCase):
+    def test_default_until_enough_samples(self):
+        window = LatencyWindow(size=100)
+        for i in range(10):
+            window.add(i)
+        self.assertEqual(window.percentile(95, 0.25, min_samples=20), 0.25)
+        for i in range(10, 100):
+            window.add(i)
+        self.assertEqual(window.percentile(95, 0.25, min_samples=20), 94)
+
+
+class GuardedCallTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.breaker = CircuitBreaker(failure_threshold=2)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=False)
+
+    def guard(self, **kwargs):
+        return GuardedCall(self.executor, breaker=self.breaker, **kwargs)
+
+    def test_returns_the_result(self):
+        self.assertEqual(self.guard().call(lambda: "ok", 1), "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_no_budget_is_not_called(self):
+        calls = []
+        with self.assertRaises(ServiceUnavailable):
+            self.guard().call(lambda: calls.append(1), 0)
+        self.assertEqual(calls, [])
+
+    def test_open_circuit_is_not_called(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        calls = []
+        with self.assertRaises(ServiceUnavailable):
+            self.guard().call(lambda: calls.append(1), 1)
+        self.assertEqual(calls, [])
+
+    def test_unsuccessful_results_fail(self):
+        with self.assertRaises(ServiceUnavailable):
+            self.guard(hedge=False).call(
+                lambda: "error", 1, is_success=lambda r: r == "ok")
+        # Counted as the first of the two failures opening the circuit
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_deadline(self):
+        release = threading.Event()
+        try:
+            with self.assertRaises(ServiceUnavailable):
+                self.guard(hedge=False).call(lambda: release.wait(5), 0.05)
+        finally:
+            release.set()
+
+    def test_slow_attempt_is_hedged(self):
+        attempts = []
+        release = threading.Event()
+
+        def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                release.wait(5)
+                return "slow"
+            return "hedged"
+        try:
+            result = self.guard(hedge_default=0.02, hedge_min=0.01).call(
+                call, 2)
+        finally:
+            release.set()
+        self.assertEqual(result, "hedged")
+        self.assertEqual(len(attempts), 2)
+
+    def test_failed_attempt_is_retried_once(self):
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise IOError("reset")
+            return "ok"
+        self.assertEqual(self.guard().call(call, 1), "ok")
+        self.assertEqual(len(attempts), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+
+from resilience import ServiceUnavailable  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+
+
+class Gate(object):
+    """A call that blocks until released, recording each run."""
+    def __init__(self, result):
+        self.result = result
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, flight):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+
+def in_thread(function, *args):
+    """Run function(*args) in a thread; return the thread and a dict
+    receiving its result or exception."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function(*args)
+        except BaseException as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def test_concurrent_callers_share_one_call(self):
+        gate = Gate("products")
+        leader, led = in_thread(self.flights.call, "user", gate, 5)
+        gate.started.wait(5)
+        waiters = [in_thread(self.flights.call, "user", gate, 5)
+                   for _ in range(3)]
+        gate.release.set()
+        for thread, _ in [(leader, led)] + waiters:
+            thread.join(5)
+
+        self.assertEqual(gate.calls, 1)
+        self.assertEqual(led["result"], ("products", False))
+        for _, outcome in waiters:
+            self.assertEqual(outcome["result"], ("products", True))
+        self.assertEqual(len(self.flights), 0)
+
+    def test_waiters_get_the_error(self):
+        gate = Gate(ServiceUnavailable("down"))
+        leader, led = in_thread(self.flights.call, "user", gate, 5)
+        gate.started.wait(5)
+        waiter, waited = in_thread(self.flights.call, "user", gate, 5)
+        gate.release.set()
+        leader.join(5)
+        waiter.join(5)
+
+        self.assertEqual(gate.calls, 1)
+        self.assertIsInstance(led["error"], ServiceUnavailable)
+        self.assertIs(waited["error"], led["error"])
+
+    def test_waiting_is_bounded(self):
+        gate = Gate("products")
+        leader, led = in_thread(self.flights.call, "user", gate, 5)
+        gate.started.wait(5)
+        with self.assertRaises(ServiceUnavailable):
+            self.flights.call("user", gate, 0.05)
+        gate.release.set()
+        leader.join(5)
+        self.assertEqual(led["result"], ("products", False))
+
+    def test_other_keys_are_not_shared(self):
+        gate = Gate("products")
+        leader, _ = in_thread(self.flights.call, "user", gate, 5)
+        gate.started.wait(5)
+        self.assertEqual(
+            self.flights.call("other", lambda flight: "other", 5),
+            ("other", False))
+        gate.release.set()
+        leader.join(5)
+
+    def test_cancelled_waiters_start_a_new_call(self):
+        stale = Gate("stale")
+        leader, led = in_thread(self.flights.call, "user", stale, 5)
+        stale.started.wait(5)
+        fresh = Gate("fresh")
+        fresh.release.set()
+        waiter, waited = in_thread(self.flights.call, "user", fresh, 5)
+
+        self.assertTrue(self.flights.cancel("user"))
+        waiter.join(5)
+        stale.release.set()
+        leader.join(5)
+
+        self.assertEqual(waited["result"], ("fresh", False))
+        self.assertEqual(led["result"], ("stale", False))
+        self.assertFalse(self.flights.cancel("user"))
+
+    def test_cancelled_call_does_not_publish(self):
+        # A fetch starts, a purchase is accepted and its products are
+        # cached, then the older fetch finishes: it must not overwrite
+        # the newer entry
+        cache = {}
+        started, release = threading.Event(), threading.Event()
+
+        def fetch(flight):
+            started.set()
+            release.wait(5)
+            return flight.publish(cache.__setitem__, "user", "NOT_ENTITLED")
+        leader, led = in_thread(self.flights.call, "user", fetch, 5)
+        started.wait(5)
+
+        self.assertEqual(
+            self.flights.cancel_where(lambda key: key == "user"), 1)
+        cache["user"] = "ENTITLED"
+        release.set()
+        leader.join(5)
+
+        self.assertEqual(led["result"], (False, False))
+        self.assertEqual(cache["user"], "ENTITLED")
+
+
+    def test_unshared_calls_are_cancelled_too(self):
+        self.flights = SingleFlight(share=False)
+        gate = Gate("products")
+        first, _ = in_thread(self.flights.call, "user", gate, 5)
+        gate.started.wait(5)
+        second, _ = in_thread(self.flights.call, "user", gate, 5)
+        while gate.calls < 2:
+            time.sleep(0.001)
+        self.assertEqual(len(self.flights), 2)
+
+        self.assertEqual(
+            self.flights.cancel_where(lambda key: key == "user"), 2)
+        gate.release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(len(self.flights), 0)
+
+    def test_unshared_cancelled_call_does_not_publish(self):
+        self.flights = SingleFlight(share=False)
+        cache = {}
+        started, release = threading.Event(), threading.Event()
+
+        def fetch(flight):
+            started.set()
+            release.wait(5)
+            return flight.publish(cache.__setitem__, "user", "NOT_ENTITLED")
+        leader, led = in_thread(self.flights.call, "user", fetch, 5)
+        started.wait(5)
+
+        self.assertTrue(self.flights.cancel("user"))
+        cache["user"] = "ENTITLED"
+        release.set()
+        leader.join(5)
+
+        self.assertEqual(led["result"], (False, False))
+        self.assertEqual(cache["user"], "ENTITLED")
+
+
+if __name__ == "__main__":
+    unittest.main()
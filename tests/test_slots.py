@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "lambda", "py"))
+os.environ.setdefault("EMIT_METRICS", "false")
+os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("WARM_UP", "false")
+
+from ask_sdk_core.dispatch_components import (  # noqa: E402
+    AbstractResponseInterceptor)
+
+import lambda_function  # noqa: E402
+from telemetry import current_turn  # noqa: E402
+from test_product_fetch import envelope  # noqa: E402
+from warmup import WarmupApiClient  # noqa: E402
+
+
+def unresolved(intent_name, slot_name, value):
+    return envelope({
+        "type": "IntentRequest",
+        "intent": {
+            "name": intent_name, "confirmationStatus": "NONE",
+            "slots": {slot_name: {
+                "name": slot_name, "value": value,
+                "resolutions": {"resolutionsPerAuthority": [{
+                    "authority": "test",
+                    "status": {"code": "ER_SUCCESS_NO_MATCH"},
+                }]},
+            }},
+        },
+    })
+
+
+class TurnRecorder(AbstractResponseInterceptor):
+    def __init__(self):
+        self.turns = []
+
+    def process(self, handler_input, response):
+        self.turns.append(current_turn(handler_input))
+
+
+class FuzzySlotTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = lambda_function.sb.api_client
+        lambda_function.sb.api_client = WarmupApiClient(
+            ("science_pack", "history_pack", "space_pack", "all_access"))
+        self.recorder = TurnRecorder()
+        self.interceptors = (lambda_function.sb.runtime_configuration_builder
+                             .global_response_interceptors)
+        self.interceptors.append(self.recorder)
+        self.handler = lambda_function.sb.lambda_handler()
+
+    def tearDown(self):
+        lambda_function.sb.api_client = self.saved
+        self.interceptors.remove(self.recorder)
+        lambda_function.product_cache.clear()
+
+    def test_slot_is_matched_once_per_turn(self):
+        self.handler(unresolved(
+            "GetCategoryFactIntent", "factCategory", "histery"), None)
+        self.assertEqual(self.recorder.turns[-1].slot_matches, 1)
+
+    def test_intent_without_slots(self):
+        request = envelope({
+            "type": "IntentRequest",
+            "intent": {"name": "CancelSubscriptionIntent",
+                       "confirmationStatus": "NONE", "slots": None},
+        })
+        directives = self.handler(request, None)["response"]["directives"]
+        self.assertEqual(directives[0]["name"], "Cancel")
+
+
+if __name__ == "__main__":
+    unittest.main()